@@ -0,0 +1,215 @@
+#!/usr/bin/python
+###########################################################################################
+# agfactors - precompiled age grade factor tables
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+###########################################################################################
+'''
+agfactors - precompiled age grade factor tables
+==============================================================================
+
+loutilities.agegrade.AgeGrade looks up and interpolates the factor and open standard
+every time a result is age graded.  AgeGradeFactors does this once per gender and
+distance, keeping the factors and open standards in tables indexed by age, so age
+grading a result is a table lookup.
+
+Use :func:`getagfactors` to get the module level cache, which is shared by all tools.
+
+Older loutilities keep the age grade data by gender, and newer versions by surface
+('road' or 'track') and then gender.  Both are supported, with the surface chosen by
+distance as AgeGrade.agegrade() does when no surface is given.
+
+'''
+
+# standard
+
+# pypi
+
+# github
+
+# other
+
+# home grown
+from .config import parameterError
+from loutilities.agegrade import AgeGrade
+
+# number of meters in a mile, and known conversions -- same as AgeGrade
+MPERMILE = 1609.344
+CDIST = {26.2:42195,13.1:21098}
+
+# AgeGrade uses the factors for these ages for younger and older runners
+MINAGE = 5
+MAXAGE = 99
+
+# module level cache, see getagfactors()
+agfactors = None
+
+########################################################################
+class AgeGradeFactors():
+########################################################################
+    '''
+    precompiled age grade factor tables, keyed by (gender, distance)
+
+    each table holds the factor and open standard for every age from 0 to MAXAGE, and is
+    created the first time the gender and distance is used.  Results are the same as
+    AgeGrade.agegrade(), and result() is its inverse
+
+    :param ag: AgeGrade object, default is to create one
+    '''
+    #----------------------------------------------------------------------
+    def __init__(self,ag=None):
+    #----------------------------------------------------------------------
+        if not ag:
+            ag = AgeGrade()
+        self.ag = ag
+        self.tables = {}
+
+    #----------------------------------------------------------------------
+    def table(self,gen,distmiles):
+    #----------------------------------------------------------------------
+        '''
+        return factor and open standard tables for gender and distance
+
+        :param gen: gender - M or F, or X if the age grade data has it
+        :param distmiles: distance (miles)
+        :rtype: (factors, openstds) - lists indexed by age
+        '''
+        gen = gen.upper()
+        key = (gen,distmiles)
+        if key in self.tables:
+            return self.tables[key]
+
+        if distmiles in CDIST:
+            distmeters = CDIST[distmiles]
+        else:
+            distmeters = distmiles*MPERMILE
+
+        # newer loutilities key the data by surface, then gender
+        agegradedata = self.ag.agegradedata
+        bysurface = 'road' in agegradedata
+        gens = agegradedata['road'] if bysurface else agegradedata
+
+        # check for some input errors, same as AgeGrade
+        if gen not in gens:
+            raise parameterError('gen must be one of {0}'.format(', '.join(sorted(gens))))
+
+        # road if there are road factors for this distance, else track
+        epsilon = 0
+        if bysurface:
+            surface = 'road' if int(round(distmeters)) >= min(agegradedata['road'][gen]) else 'track'
+            agegradedata = agegradedata[surface]
+            epsilon = 1     # meter fuzziness, same as AgeGrade
+
+        distlist = list(agegradedata[gen].keys())
+        minmeters = min(distlist)*1.0
+        maxmeters = max(distlist)*1.0
+        if distmeters < minmeters-epsilon or distmeters > maxmeters+epsilon:
+            raise parameterError('distmiles must be between {:0.3f} and {:0.1f}'.format(minmeters/MPERMILE,maxmeters/MPERMILE))
+
+        # interpolate once for each age
+        if bysurface:
+            factorstds = [self.ag.getfactorstd(surface,age,gen,distmeters) for age in range(MINAGE,MAXAGE+1)]
+        else:
+            factorstds = [self.ag.getfactorstd(age,gen,distmeters) for age in range(MINAGE,MAXAGE+1)]
+        factorstds = [factorstds[0]]*MINAGE + factorstds
+        factors = [factor for factor,openstd in factorstds]
+        openstds = [openstd for factor,openstd in factorstds]
+
+        self.tables[key] = factors,openstds
+        return self.tables[key]
+
+    #----------------------------------------------------------------------
+    def factorstd(self,age,gen,distmiles):
+    #----------------------------------------------------------------------
+        '''
+        return factor and open standard for age, gender and distance
+
+        :param age: integer age.  If float is supplied, integer portion is used
+        :param gen: gender - M or F
+        :param distmiles: distance (miles)
+        :rtype: (factor, openstd)
+        '''
+        factors,openstds = self.table(gen,distmiles)
+        age = min(max(int(age),0),MAXAGE)
+        return factors[age],openstds[age]
+
+    #----------------------------------------------------------------------
+    def agegrade(self,age,gen,distmiles,time):
+    #----------------------------------------------------------------------
+        '''
+        returns age grade statistics for the indicated age, gender, distance, result time
+
+        :param age: integer age.  If float is supplied, integer portion is used
+        :param gen: gender - M or F
+        :param distmiles: distance (miles)
+        :param time: time for distance (seconds)
+        :rtype: (age performance percentage, age graded result, age grade factor)
+        '''
+        factor,openstd = self.factorstd(age,gen,distmiles)
+        return 100*(openstd/factor)/time, time*factor, factor
+
+    #----------------------------------------------------------------------
+    def result(self,age,gen,distmiles,agpc):
+    #----------------------------------------------------------------------
+        '''
+        returns result required for the indicated age, gender, distance and age grade percentage
+
+        :param age: integer age.  If float is supplied, integer portion is used
+        :param gen: gender - M or F
+        :param distmiles: distance (miles)
+        :param agpc: age grade percentage - between 0 and 100
+        :rtype: result in seconds
+        '''
+        factor,openstd = self.factorstd(age,gen,distmiles)
+        return (openstd/factor)/(agpc/100.0)
+
+    #----------------------------------------------------------------------
+    def agegrade_many(self,ages,gens,distmiles,times):
+    #----------------------------------------------------------------------
+        '''
+        returns age grade statistics for many results at the same distance, e.g., all
+        the results for a race
+
+        same as [self.agegrade(age,gen,distmiles,time) for age,gen,time in zip(ages,gens,times)]
+
+        :param ages: list of integer ages
+        :param gens: list of genders - M or F
+        :param distmiles: distance (miles)
+        :param times: list of times for distance (seconds)
+        :rtype: list of (age performance percentage, age graded result, age grade factor)
+        '''
+        tables = {}
+        agegrades = []
+        for age,gen,time in zip(ages,gens,times):
+            if gen not in tables:
+                tables[gen] = self.table(gen,distmiles)
+            factors,openstds = tables[gen]
+            age = min(max(int(age),0),MAXAGE)
+            factor,openstd = factors[age],openstds[age]
+            agegrades.append((100*(openstd/factor)/time, time*factor, factor))
+
+        return agegrades
+
+#----------------------------------------------------------------------
+def getagfactors():
+#----------------------------------------------------------------------
+    '''
+    return module level AgeGradeFactors cache, creating it the first time it is used
+
+    :rtype: AgeGradeFactors object
+    '''
+    global agfactors
+    if not agfactors:
+        agfactors = AgeGradeFactors()
+    return agfactors
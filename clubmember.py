@@ -32,6 +32,8 @@ import argparse
 import datetime
 import difflib
 import csv
+import collections
+import importlib.util
 
 # pypi
 #from IPython.core.debugger import Tracer; debughere = Tracer(); debughere() # set breakpoint where needed
@@ -65,6 +67,100 @@ def getratio(a,b):
     sm.set_seqs(a,b)
     return sm.ratio()
 
+########################################################################
+class NameIndex():
+########################################################################
+    '''
+    character counts for a list of names, used to find the names which could have a difflib
+    ratio of at least cutoff with a name, without scoring each of them.  Requires numpy
+    
+    difflib ratio is 2M/T, where M is the number of matching characters and T is the total
+    length of the two names.  M can't be more than the number of characters the names have in
+    common, counting repeats, which gives difflib quick_ratio.  The character counts are kept in
+    a names x characters matrix, so quick_ratio is found for all the names at once
+    
+    :param names: list of lower case names
+    '''
+    #----------------------------------------------------------------------
+    def __init__(self,names):
+    #----------------------------------------------------------------------
+        import numpy as np
+        self.np = np
+        
+        self.names = np.array(names,dtype=object)
+        self.lengths = np.array([len(name) for name in names],dtype=np.int64)
+        
+        # counts is {name row, character column:count}
+        self.columns = dict([(char,col) for col,char in enumerate(sorted(set(''.join(names))))])
+        self.counts = np.zeros((len(names),len(self.columns)),dtype=np.int64)
+        for row,name in enumerate(names):
+            for char,count in list(collections.Counter(name).items()):
+                self.counts[row,self.columns[char]] = count
+    
+    #----------------------------------------------------------------------
+    def candidates(self,lowername,cutoff):
+    #----------------------------------------------------------------------
+        '''
+        return the names whose difflib quick_ratio with lowername is at least cutoff
+        
+        :param lowername: lower case name to search for
+        :param cutoff: cutoff as used by difflib.get_close_matches
+        :rtype: list of names
+        '''
+        np = self.np
+        
+        # characters which aren't in any of the names can't match
+        namecounts = np.zeros(len(self.columns),dtype=np.int64)
+        for char,count in list(collections.Counter(lowername).items()):
+            if char in self.columns:
+                namecounts[self.columns[char]] = count
+        
+        # same floating point comparison as difflib, quick_ratio is 2.0*matches/total
+        matches = np.minimum(self.counts,namecounts).sum(axis=1)
+        totals = self.lengths + len(lowername)
+        return self.names[2.0*matches/totals >= cutoff].tolist()
+
+#----------------------------------------------------------------------
+def nameindex(names):
+#----------------------------------------------------------------------
+    '''
+    return NameIndex for names, or None if numpy isn't installed
+    
+    :param names: list of lower case names
+    :rtype: NameIndex or None
+    '''
+    # numpy is optional -- without it getmember scores all the member names
+    if importlib.util.find_spec('numpy') is None:
+        return None
+    
+    return NameIndex(names)
+
+#----------------------------------------------------------------------
+def runner2member(name,dateofbirth,gender,hometown):
+#----------------------------------------------------------------------
+    '''
+    convert racedb.Runner column values to ClubMember.addmember arguments
+    
+    name is split the same way as for the file based ClubMember, so the keys come out the same
+    
+    :param name: runner.name
+    :param dateofbirth: runner.dateofbirth
+    :param gender: runner.gender
+    :param hometown: runner.hometown
+    :rtype: (first,last,dob,gender,hometown)
+    '''
+    name = name or ''
+    first = ' '.join(name.split(' ')[0:-1])
+    last = name.split(' ')[-1]
+    
+    # dates of birth which are not valid are treated as unknown
+    try:
+        dob = tYmd.dt2asc(tYmd.asc2dt(dateofbirth))
+    except (ValueError,TypeError):
+        dob = ''
+    
+    return first,last,dob,gender or '',hometown or ''
+
 ########################################################################
 class ClubMember():
 ########################################################################
@@ -95,25 +191,80 @@ class ClubMember():
             # allow First or GivenName; allow Last or FamilyName; throw error for First, Last keys
             first = thisrow['GivenName']  if 'GivenName' in thisrow  else thisrow['First']
             last  = thisrow['FamilyName'] if 'FamilyName' in thisrow else thisrow['Last']
-            first = first.strip()
-            last = last.strip()
             
-            name = ' '.join([first,last])
-            thismember = {}
-            thismember['name'] = name.strip()
-            if thismember['name'] == '': break   # assume first blank 'name' is the end of the data
+            # assume first blank 'name' is the end of the data
+            if not self.addmember(first,last,self.file2ascdate(thisrow['DOB']),thisrow['Gender'],
+                                  ', '.join([thisrow['City'].strip(),thisrow['State'].strip()])):
+                break
+        
+        # index the member names for getmember
+        self.indexmembers()
+    
+    #----------------------------------------------------------------------
+    def addmember(self,first,last,dob,gender,hometown):
+    #----------------------------------------------------------------------
+        '''
+        add a member to self.members
+        
+        :param first: member's first name
+        :param last: member's last name
+        :param dob: yyyy-mm-dd ascii date of birth, or '' if unknown
+        :param gender: member's gender
+        :param hometown: member's home town, 'City, ST'
+        :rtype: True if member was added, False if name was blank
+        '''
+        
+        first = first.strip()
+        last = last.strip()
+        
+        name = ' '.join([first,last])
+        thismember = {}
+        thismember['name'] = name.strip()
+        if thismember['name'] == '': return False
 
-            dob = self.file2ascdate(thisrow['DOB'])
-            thismember['dob'] = dob
-            thismember['gender'] = thisrow['Gender'].upper().strip()
-            thismember['hometown'] = ', '.join([thisrow['City'].strip(),thisrow['State'].strip()])
-            
-            # make self.memberskeys lower case
-            # lower case comparisons are always done, to avoid UPPER NAME issue, and any other case related issues
-            lowername = name.lower()
-            if lowername not in self.members:
-                self.members[lowername] = []
-            self.members[lowername].append(thismember)    # allows for possibility that multiple members have same name
+        thismember['dob'] = dob
+        thismember['gender'] = gender.upper().strip()
+        thismember['hometown'] = hometown
+        
+        # make self.memberskeys lower case
+        # lower case comparisons are always done, to avoid UPPER NAME issue, and any other case related issues
+        lowername = name.lower()
+        if lowername not in self.members:
+            self.members[lowername] = []
+        self.members[lowername].append(thismember)    # allows for possibility that multiple members have same name
+        
+        return True
+    
+    #----------------------------------------------------------------------
+    def indexmembers(self):
+    #----------------------------------------------------------------------
+        '''
+        build NameIndex of member names, used by getmember to shortlist the member names
+        which are worth scoring
+        
+        must be called if self.members is changed
+        '''
+        
+        self.nameindex = nameindex(list(self.members))
+    
+    #----------------------------------------------------------------------
+    def shortlist(self,lowername):
+    #----------------------------------------------------------------------
+        '''
+        return the member names which might have a difflib ratio of at least self.cutoff with lowername
+        
+        these are the names whose difflib quick_ratio reaches the cutoff, see NameIndex.  If
+        there is no index, all the member names are returned
+        
+        :param lowername: lower case name to search for
+        :rtype: list of member names (keys of self.members)
+        '''
+        
+        if self.nameindex is None:
+            return list(self.members)
+        
+        # the index may be shared with other ClubMember objects
+        return [membername for membername in self.nameindex.candidates(lowername,self.cutoff) if membername in self.members]
     
     #----------------------------------------------------------------------
     def file2ascdate(self,date):
@@ -162,7 +313,10 @@ class ClubMember():
         :rtype: {'matchingmembers':member record list, 'exactmatch':boolean, 'closematches':member name list}
         '''
         
-        closematches = difflib.get_close_matches(name.lower(),list(self.members.keys()),cutoff=self.cutoff)
+        # only member names which can reach the cutoff are scored, see shortlist().  The scoring
+        # is still done by difflib, so the matches are the same as for the full list of names
+        lowername = name.lower()
+        closematches = difflib.get_close_matches(lowername,self.shortlist(lowername),cutoff=self.cutoff)
         
         rval = {}
         if len(closematches) > 0:
@@ -328,54 +482,132 @@ class DbClubMember(ClubMember):
     #----------------------------------------------------------------------
     def __init__(self,dbfilename=None,cutoff=0.6,**kwfilter):
     #----------------------------------------------------------------------
+        # collect member information by member name
+        self.members = {}
+        self.exceldates = False
+        self.cutoff = cutoff
+        
+        # create database session
+        racedb.setracedb(dbfilename)
+        s = racedb.Session()
+        
+        # stream only the needed columns straight into self.members
+        runners = s.query(racedb.Runner.name,racedb.Runner.dateofbirth,racedb.Runner.gender,racedb.Runner.hometown).filter_by(**kwfilter)
+        for name,dateofbirth,gender,hometown in runners.yield_per(1000):
+            # skip over blank names rather than stopping, as there is no "end of the data" in the database
+            self.addmember(*runner2member(name,dateofbirth,gender,hometown))
+        
+        # done with database
+        s.close()
+        
+        # index the member names for getmember
+        self.indexmembers()
+    
+########################################################################
+class ClubMemberPartition(ClubMember):
+########################################################################
+    '''
+    ClubMember object for one partition of DbClubMemberPartitions
+    
+    members are added by DbClubMemberPartitions, and the name index is shared
+    with the other partitions
+    
+    :params cutoff: cutoff for getmember.  float in (0,1].  higher means strings have to match more closely to be considered "close"
+    '''
+    
+    #----------------------------------------------------------------------
+    def __init__(self,cutoff):
+    #----------------------------------------------------------------------
+        self.members = {}
+        self.exceldates = False
+        self.cutoff = cutoff
+        self.nameindex = None
+        
+    #----------------------------------------------------------------------
+    def indexmembers(self,sharedindex=None):
+    #----------------------------------------------------------------------
+        '''
+        use the name index built by DbClubMemberPartitions for all the partitions
+        
+        must be called if self.members is changed
+        
+        :param sharedindex: NameIndex with the names of all the partitions, None to score all names
+        '''
+        
+        self.nameindex = sharedindex
+    
+########################################################################
+class DbClubMemberPartitions():
+########################################################################
+    '''
+    several ClubMember objects with database input, loaded with a single pass through the
+    runner table and sharing a single name index
+    
+    each partition is specified by a keyword parameter partname=(cutoff,kwfilter), where
+    kwfilter is {column:value,...} for racedb.Runner columns, e.g.,
+    
+        DbClubMemberPartitions(active=(0.7,{'member':True,'active':True}),nonmember=(0.9,{'member':False}))
+    
+    a runner is put in every partition whose kwfilter it matches
+    
+    :params dbfilename: database file from which club members are to be retrieved -- default is to use configured database
+    :params \*\*partitions: partname=(cutoff,kwfilter) for each partition
+    '''
+    
+    #----------------------------------------------------------------------
+    def __init__(self,dbfilename=None,**partitions):
+    #----------------------------------------------------------------------
+        self.partitions = {}
+        self.kwfilters = {}
+        for partname in partitions:
+            cutoff,kwfilter = partitions[partname]
+            self.partitions[partname] = ClubMemberPartition(cutoff)
+            self.kwfilters[partname] = kwfilter
+        
+        # retrieve the columns needed for the members, plus any columns needed for the partition filters
+        memcols = ['name','dateofbirth','gender','hometown']
+        filtercols = []
+        for partname in self.kwfilters:
+            for col in self.kwfilters[partname]:
+                if col not in filtercols:
+                    filtercols.append(col)
+        
         # create database session
         racedb.setracedb(dbfilename)
         s = racedb.Session()
         
-        # TODO: don't really need this since adding exceldates as parameter to ClubMember, but for now keeping for safety
-        def _dob2excel(s,f):
-            try:
-                xl = tYmd.asc2excel(f)
-            except ValueError:
-                xl = None
-            return xl
-        
-        def _city(s,f):
-            if f:
-                return ','.join(f.split(',')[0:-1])
-            else:
-                return None
-        
-        def _state(s,f):
-            if f:
-                return lambda s,f: f.split(',')[-1]
-            else:
-                return None
-        
-        # map database table column names to output column names, and optionally function for transformation
-        # function x is x(s,f), where s is session, f is field value
-        # note it is ok to split name like this, because it will just get joined together when the csv is processed in clubmember
-        d = csvwt.Db2Csv()
-        hdrmap = {'dateofbirth':{'DOB':_dob2excel},
-                  'gender':'Gender',
-                  'name':{'First':lambda s,f: ' '.join(f.split(' ')[0:-1]),'Last':lambda s,f: f.split(' ')[-1]},
-                  'hometown':{'City':_city, 'State':_state}
-                    }
-        d.addtable('Sheet1',s,racedb.Runner,hdrmap,**kwfilter)
+        # single pass through runner table, putting each runner in the partition(s) it belongs to
+        runners = s.query(*[getattr(racedb.Runner,col) for col in memcols+filtercols])
+        for row in runners.yield_per(1000):
+            member = runner2member(*row[0:len(memcols)])
+            filtervals = dict(list(zip(filtercols,row[len(memcols):])))
+            for partname in self.partitions:
+                kwfilter = self.kwfilters[partname]
+                if all([filtervals[col] == kwfilter[col] for col in kwfilter]):
+                    self.partitions[partname].addmember(*member)
         
         # done with database
         s.close()
-
-        # retrieve first sheet's csv filename
-        csvfiles = d.getfiles()
-        csvsheets = list(csvfiles.keys())
-        csvfile = csvfiles[csvsheets[0]]
         
-        # do all the work
-        ClubMember.__init__(self,csvfile,cutoff=cutoff,exceldates=True)
+        # single name index for all the partitions -- each partition filters the shortlist to its own members
+        allnames = set()
+        for partname in self.partitions:
+            allnames.update(self.partitions[partname].members)
+        sharedindex = nameindex(sorted(allnames))
+        for partname in self.partitions:
+            self.partitions[partname].indexmembers(sharedindex)
+    
+    #----------------------------------------------------------------------
+    def getpartition(self,partname):
+    #----------------------------------------------------------------------
+        '''
+        return ClubMember object for the indicated partition
+        
+        :param partname: name of partition, as given when this object was created
+        :rtype: ClubMemberPartition
+        '''
         
-        ## csv files not needed any more
-        #del d
+        return self.partitions[partname]
     
 #----------------------------------------------------------------------
 def main(): # TODO: Update this for testing
@@ -72,9 +72,10 @@ OPTDBTYPE     = 'dbtype'
 OPTDBSERVER   = 'dbserver'
 OPTDBNAME     = 'dbname'
 OPTDBGLOBUSER = 'dbglobaluser'
+OPTDBSCHEMA   = 'dbschema'
 OPTUNAME      = 'username'          # not in OPTTBL - for FILEUSERCONFIG only
 OPTCLEARDB    = 'cleardb'           # not in OPTTBL - clears DB parameters
-DBCLEAROPTS = [OPTDBTYPE,OPTDBSERVER,OPTDBNAME] # options to null out if OPTCLEARDB set
+DBCLEAROPTS = [OPTDBTYPE,OPTDBSERVER,OPTDBNAME,OPTDBSCHEMA] # options to null out if OPTCLEARDB set
 
 # options constants for FILEDBPW
 OPTDBPW       = 'dbuserpassword'
@@ -96,4 +97,5 @@ OPTTBL = collections.OrderedDict([
     (OPTDBSERVER   ,('-s','server on which club database resides')),
     (OPTDBNAME     ,('-n','database name')),
     (OPTDBGLOBUSER ,('-g','global access username, or None if access requires individual username')),
+    (OPTDBSCHEMA   ,('-m','how database schema is maintained, create|alembic.  None means create')),
 ])
@@ -33,14 +33,19 @@ import argparse
 import copy
 import csv
 import time
+import datetime
+import json
+import os
 
 # pypi
 
 # github
 
 # other
+from sqlalchemy import func
 
 # home grown
+from .config import parameterError
 from . import version
 from . import racedb
 from . import render
@@ -49,8 +54,239 @@ tdb = timeu.asctime('%Y-%m-%d')
 
 METERSPERMILE = 1609.344
 
+# output fields
+OUTFIELDS = 'name,dob,gender,race,date,miles,km,time,ag'.split(',')
+
+# rows are fetched from the database, and written to columnar files, this many at a time
+BATCHSIZE = 1000
+
+# output file formats
+FORMATS = ['csv','ndjson','parquet','arrow']
+
+# incremental export manifest file name
+MANIFEST = 'manifest.json'
+
+#----------------------------------------------------------------------
+def queryresults(session,begindate=None,enddate=None,raceids=None): 
+#----------------------------------------------------------------------
+    '''
+    query results for active members, joined with runner and race information
+    
+    races are filtered by date and id in the database
+    
+    :param session: database session
+    :param begindate: collect races between begindate and enddate, yyyy-mm-dd
+    :param enddate: collect races between begindate and enddate, yyyy-mm-dd
+    :param raceids: collect results for these races only, default all races
+    :rtype: query for (runnerid,name,dob,gender,race,date,miles,time,ag) tuples, by runner
+    '''
+    query = session.query(racedb.Runner.id,racedb.Runner.name,racedb.Runner.dateofbirth,racedb.Runner.gender,
+                          racedb.Race.name,racedb.Race.date,racedb.Race.distance,
+                          racedb.RaceResult.time,racedb.RaceResult.agpercent) \
+                   .join(racedb.RaceResult,racedb.RaceResult.runnerid==racedb.Runner.id) \
+                   .join(racedb.Race,racedb.Race.id==racedb.RaceResult.raceid) \
+                   .filter(racedb.Runner.member==True,racedb.Runner.active==True)
+    if begindate:
+        query = query.filter(racedb.Race.date >= begindate)
+    if enddate:
+        query = query.filter(racedb.Race.date <= enddate)
+    if raceids is not None:
+        query = query.filter(racedb.Race.id.in_(raceids))
+    
+    return query.order_by(racedb.Runner.id,racedb.RaceResult.id)
+
+#----------------------------------------------------------------------
+def uniqueresults(session,**queryfilter): 
+#----------------------------------------------------------------------
+    '''
+    generate results of active members, streaming from the database
+    
+    results are possibly stored multiple times, for different series -- only the first
+    of identical results is generated.  Results are compared with the time in seconds.
+    Results are retrieved by runner, so only the current runner's results need to be remembered
+    
+    :param session: database session
+    :param \*\*queryfilter: filter parameters for queryresults()
+    :rtype: generator of (name,dob,gender,race,date,miles,time,ag) tuples
+    '''
+    seen = set()
+    lastrunnerid = None
+    for result in queryresults(session,**queryfilter).yield_per(BATCHSIZE):
+        runnerid = result[0]
+        values = tuple(result[1:])
+        if runnerid != lastrunnerid:
+            seen.clear()
+            lastrunnerid = runnerid
+        if values in seen: continue
+        seen.add(values)
+        
+        yield values
+
+#----------------------------------------------------------------------
+def exportrows(session,**queryfilter): 
+#----------------------------------------------------------------------
+    '''
+    generate export rows for results of active members, streaming from the database
+    
+    as for the original csv export, rows which are identical once the time is rendered are
+    only generated once, so csv files may have fewer rows than the typed formats
+    
+    :param session: database session
+    :param \*\*queryfilter: filter parameters for queryresults()
+    :rtype: generator of {field:value,...} for fields in OUTFIELDS
+    '''
+    seen = set()
+    lastrunner = None
+    for columns in batches(uniqueresults(session,**queryfilter)):
+        runnernames,runnerdobs,runnergenders,racenames,racedates,racemiles,resulttimes,resultags = columns
+        
+        # render all the times in the batch at once, as h:mm:ss
+        rendertimes = ['0:'*(2-rendertime.count(':')) + rendertime for rendertime in render.rendertimes(resulttimes,0)]
+        racekms = [(miles*METERSPERMILE)/1000 for miles in racemiles]
+        
+        # name,dob,gender,race,date,miles,km,time,ag
+        for values in zip(runnernames,runnerdobs,runnergenders,racenames,racedates,racemiles,racekms,rendertimes,resultags):
+            # rows are by runner, so only the current runner's rows need to be remembered
+            if values[0:2] != lastrunner:
+                seen.clear()
+                lastrunner = values[0:2]
+            if values in seen: continue
+            seen.add(values)
+            
+            yield dict(list(zip(OUTFIELDS,values)))
+
+#----------------------------------------------------------------------
+def typedrows(session,**queryfilter): 
+#----------------------------------------------------------------------
+    '''
+    generate typed export rows for results of active members, streaming from the database
+    
+    dates are datetime.date (None if not valid), time is in seconds
+    
+    :param session: database session
+    :param \*\*queryfilter: filter parameters for queryresults()
+    :rtype: generator of (name,dob,gender,race,date,miles,km,time,ag) tuples
+    '''
+    dates = {}
+    for runnername,runnerdob,runnergender,racename,racedate,racemiles,resulttime,resultag in uniqueresults(session,**queryfilter):
+        # many rows have the same dates
+        for dbdate in [runnerdob,racedate]:
+            if dbdate not in dates:
+                try:
+                    dates[dbdate] = datetime.datetime.strptime(dbdate,'%Y-%m-%d').date()
+                except (TypeError,ValueError):
+                    dates[dbdate] = None
+        
+        yield (runnername,dates[runnerdob],runnergender,racename,dates[racedate],racemiles,(racemiles*METERSPERMILE)/1000,resulttime,resultag)
+
+#----------------------------------------------------------------------
+def batches(rows,batchsize=BATCHSIZE): 
+#----------------------------------------------------------------------
+    '''
+    group rows into columns, a batch at a time
+    
+    :param rows: iterable of tuples, e.g., with values for OUTFIELDS
+    :param batchsize: maximum number of rows in each batch
+    :rtype: generator of [[values for field],...] in tuple order
+    '''
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batchsize:
+            yield [list(column) for column in zip(*batch)]
+            batch = []
+    if batch:
+        yield [list(column) for column in zip(*batch)]
+
+#----------------------------------------------------------------------
+def writendjson(fname,rows): 
+#----------------------------------------------------------------------
+    '''
+    write rows to newline delimited json file, with dates as yyyy-mm-dd and time in seconds
+    
+    :param fname: output file name
+    :param rows: iterable of tuples from typedrows()
+    '''
+    with open(fname,'w',encoding='utf-8') as OUT:
+        for row in rows:
+            record = dict(list(zip(OUTFIELDS,row)))
+            for field in ['dob','date']:
+                if record[field]:
+                    record[field] = record[field].isoformat()
+            OUT.write(json.dumps(record) + '\n')
+
+#----------------------------------------------------------------------
+def writecolumnar(fname,rows,fileformat,batchsize=BATCHSIZE): 
+#----------------------------------------------------------------------
+    '''
+    write rows to parquet or arrow ipc file, a batch at a time, with date columns and
+    time in seconds.  Requires pyarrow
+    
+    :param fname: output file name
+    :param rows: iterable of tuples from typedrows()
+    :param fileformat: 'parquet' or 'arrow'
+    :param batchsize: maximum number of rows held in memory
+    '''
+    # pyarrow is only required for columnar output
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise parameterError('pyarrow must be installed for {0} output'.format(fileformat))
+    
+    schema = pa.schema([
+        ('name',pa.string()),
+        ('dob',pa.date32()),
+        ('gender',pa.string()),
+        ('race',pa.string()),
+        ('date',pa.date32()),
+        ('miles',pa.float64()),
+        ('km',pa.float64()),
+        ('time',pa.float64()),
+        ('ag',pa.float64()),
+        ])
+    
+    if fileformat == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(fname,schema)
+    else:
+        writer = pa.ipc.new_file(fname,schema)
+    
+    try:
+        for columns in batches(rows,batchsize):
+            writer.write_batch(pa.RecordBatch.from_arrays([pa.array(column,type=field.type) for column,field in zip(columns,schema)],schema=schema))
+    finally:
+        writer.close()
+
 #----------------------------------------------------------------------
-def collect(outfile,begindate=None,enddate=None,thisracedb=None): 
+def writeexport(session,fname,fileformat,**queryfilter): 
+#----------------------------------------------------------------------
+    '''
+    write results to export file, as they are retrieved
+    
+    csv files have rendered times, and rows which render the same are written once.  ndjson,
+    parquet and arrow files have time in seconds, and parquet and arrow files have typed date columns
+    
+    :param session: database session
+    :param fname: output file name
+    :param fileformat: one of FORMATS
+    :param \*\*queryfilter: filter parameters for queryresults()
+    '''
+    if fileformat not in FORMATS:
+        raise parameterError('invalid format {0}, must be one of {1}'.format(fileformat,','.join(FORMATS)))
+    
+    if fileformat == 'csv':
+        _OUT = open(fname,'w',newline='')
+        OUT = csv.DictWriter(_OUT,OUTFIELDS)
+        OUT.writeheader()
+        OUT.writerows(exportrows(session,**queryfilter))
+        _OUT.close()
+    elif fileformat == 'ndjson':
+        writendjson(fname,typedrows(session,**queryfilter))
+    else:
+        writecolumnar(fname,typedrows(session,**queryfilter),fileformat)
+
+#----------------------------------------------------------------------
+def collect(outfile,begindate=None,enddate=None,thisracedb=None,fileformat='csv'): 
 #----------------------------------------------------------------------
     '''
     collect race information from database, and save to file
@@ -59,65 +295,118 @@ def collect(outfile,begindate=None,enddate=None,thisracedb=None):
     :param begindate: collect races between begindate and enddate, yyyy-mm-dd
     :param enddate: collect races between begindate and enddate, yyyy-mm-dd
     :param racedb: filename of race database (default is as configured during rcuserconfig)
+    :param fileformat: one of FORMATS
     '''
     # TODO: check format of begindate, enddate
     
-    # output fields
-    outfields = 'name,dob,gender,race,date,miles,km,time,ag'.split(',')
-    
-    # create/open results file
+    # results file name
     tfile = timeu.asctime('%Y-%m-%d')
     fname = outfile.format(date=tfile.epoch2asc(time.time()))
-    _OUT = open(fname,'w',newline='')
-    OUT = csv.DictWriter(_OUT,outfields)
-    OUT.writeheader()
     
     # open the database
     racedb.setracedb(thisracedb)
     session = racedb.Session()
 
-    # for each member, gather results
-    members = session.query(racedb.Runner).filter_by(member=True,active=True).all()
-    rows = []
-    for member in members:
-        runnername = member.name
-        runnerdob = member.dateofbirth
-        runnergender = member.gender
-
-        # loop through each of the runner's results
-        # NOTE: results are possibly stored multiple times, for different series -- these will be deduplicated later
-        for result in member.results:
-            race = session.query(racedb.Race).filter_by(id=result.raceid).first()
-            if race.date < begindate or race.date > enddate: continue
-            
-            resulttime = result.time
-            rendertime = render.rendertime(resulttime,0)
-            while len(rendertime.split(':')) < 3:
-                rendertime = '0:' + rendertime
-            resultag = result.agpercent
-            racename = race.name
-            racedate = race.date
-            racemiles = race.distance
-            racekm = (race.distance*METERSPERMILE)/1000
-            
-            # send to output - name,dob,gender,race,date,miles,km,time,ag
-            row = {}
-            row['name'] = runnername
-            row['dob'] = runnerdob
-            row['gender'] = runnergender
-            row['race'] = racename
-            row['date'] = racedate
-            row['miles'] = racemiles
-            row['km'] = racekm
-            row['time'] = rendertime
-            row['ag'] = resultag
-            if row not in rows:
-                rows.append(row)
-    
-    OUT.writerows(rows)
+    writeexport(session,fname,fileformat,begindate=begindate,enddate=enddate)
+    
+    session.close()
+
+#----------------------------------------------------------------------
+def readmanifest(outdir): 
+#----------------------------------------------------------------------
+    '''
+    read manifest for incremental export directory
+    
+    :param outdir: incremental export directory
+    :rtype: {'watermarks':{windowkey(begindate,enddate):last Race.resultsversion exported,...},'chunks':[chunk,...]}, see incremental()
+    '''
+    fname = os.path.join(outdir,MANIFEST)
+    if not os.path.exists(fname):
+        return {'watermarks':{},'chunks':[]}
+    
+    with open(fname,'r') as MAN:
+        return json.load(MAN)
+
+#----------------------------------------------------------------------
+def windowkey(begindate,enddate): 
+#----------------------------------------------------------------------
+    '''
+    manifest key for the watermark of a date window
+    
+    :param begindate: window begin date, yyyy-mm-dd, or None
+    :param enddate: window end date, yyyy-mm-dd, or None
+    :rtype: 'begindate:enddate', with missing dates empty
+    '''
+    return '{0}:{1}'.format(begindate or '',enddate or '')
+
+#----------------------------------------------------------------------
+def incremental(outdir,begindate=None,enddate=None,thisracedb=None,fileformat='csv'): 
+#----------------------------------------------------------------------
+    '''
+    export results for races which have been imported, updated or deleted since the last
+    incremental export to outdir, as a new chunk file
+    
+    Race.resultsversion is set each time a race's exported results change -- by importresults when
+    results are imported or deleted, by importraces when the race is updated, and by importmembers when
+    runners who ran the race are updated or deactivated.  The chunk has all the current results for each
+    of these races.  A chunk's results for its races replace those in earlier chunks, including when
+    there are no results left for a race, e.g., after importresults --delete
+    
+    The manifest in outdir has a watermark (last Race.resultsversion exported) for each date window
+    exported, so changed races outside one window are still exported for another window, and a list
+    of chunks, each {'file','created','begindate','enddate','firstversion','lastversion','raceids','races'},
+    where races is [{'id','name','date'},...] so rows can be matched to races.  A race whose date is
+    changed to outside a window is not reported for that window
     
+    :param outdir: incremental export directory
+    :param begindate: collect races between begindate and enddate, yyyy-mm-dd
+    :param enddate: collect races between begindate and enddate, yyyy-mm-dd
+    :param racedb: filename of race database (default is as configured during rcuserconfig)
+    :param fileformat: one of FORMATS
+    :rtype: new chunk, or None if no races have changed
+    '''
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    manifest = readmanifest(outdir)
+    window = windowkey(begindate,enddate)
+    watermark = manifest['watermarks'].get(window,0)
+    
+    # open the database
+    racedb.setracedb(thisracedb)
+    session = racedb.Session()
+    
+    # export through the last version now in the database, so races changed during the export are picked up next time
+    throughversion = session.query(func.max(racedb.Race.resultsversion)).scalar() or 0
+    query = session.query(racedb.Race.id,racedb.Race.name,racedb.Race.date).filter(racedb.Race.resultsversion > watermark,racedb.Race.resultsversion <= throughversion)
+    if begindate:
+        query = query.filter(racedb.Race.date >= begindate)
+    if enddate:
+        query = query.filter(racedb.Race.date <= enddate)
+    races = [{'id':raceid,'name':racename,'date':racedate} for raceid,racename,racedate in query.order_by(racedb.Race.id)]
+    raceids = [race['id'] for race in races]
+    if not raceids:
+        session.close()
+        return None
+    
+    # chunks for different date windows can cover the same versions
+    fname = 'results-{0}-{1}.{2}'.format(watermark+1,throughversion,fileformat)
+    if begindate or enddate:
+        fname = 'results-{0}_{1}-{2}-{3}.{4}'.format(begindate or '',enddate or '',watermark+1,throughversion,fileformat)
+    writeexport(session,os.path.join(outdir,fname),fileformat,begindate=begindate,enddate=enddate,raceids=raceids)
     session.close()
-    _OUT.close()
+    
+    # update manifest last, so an interrupted export is redone next time
+    tfile = timeu.asctime('%Y-%m-%d %H:%M:%S')
+    chunk = {'file':fname,'created':tfile.epoch2asc(time.time()),'begindate':begindate,'enddate':enddate,
+             'firstversion':watermark+1,'lastversion':throughversion,'raceids':raceids,'races':races}
+    manifest['watermarks'][window] = throughversion
+    manifest['chunks'].append(chunk)
+    tmpfname = os.path.join(outdir,MANIFEST+'.tmp')
+    with open(tmpfname,'w') as MAN:
+        json.dump(manifest,MAN,indent=2)
+    os.replace(tmpfname,os.path.join(outdir,MANIFEST))
+    
+    return chunk
 
 #----------------------------------------------------------------------
 def main(): 
@@ -126,15 +415,28 @@ def main():
     render race information
     '''
     parser = argparse.ArgumentParser(version='{0} {1}'.format('runningclub',version.__version__))
-    parser.add_argument('-o','--outfile', help="output file name template, default=%(default)s",default='results-export-{date}.csv')
+    parser.add_argument('-o','--outfile', help="output file name template, default=results-export-{date}.<format>",default=None)
+    parser.add_argument('-f','--format', help="output file format, one of {0}, default=%(default)s".format(','.join(FORMATS)),choices=FORMATS,default='csv')
     parser.add_argument('-b','--begindate', help="collect races between begindate and enddate, yyyy-mm-dd",default=None)
     parser.add_argument('-e','--enddate', help="collect races between begindate and enddate, yyyy-mm-dd",default=None)
     parser.add_argument('-r','--racedb',help='filename of race database (default is as configured during rcuserconfig)',default=None)
+    parser.add_argument('-i','--incremental', help="export results for races changed since last incremental export into this directory, which has {0}".format(MANIFEST),default=None)
     args = parser.parse_args()
     
     outfile = args.outfile
+    if not outfile:
+        outfile = 'results-export-{{date}}.{0}'.format(args.format)
     racedb = args.racedb
 
+    # incremental export only uses dates if they are given
+    if args.incremental:
+        chunk = incremental(args.incremental,args.begindate,args.enddate,racedb,args.format)
+        if chunk:
+            print('exported results for {0} races to {1}'.format(len(chunk['raceids']),chunk['file']))
+        else:
+            print('no changed races')
+        return
+    
     if args.begindate:
         begindate = args.begindate
     else:
@@ -144,7 +446,7 @@ def main():
     else:
         enddate = '2020-12-31'
     
-    collect(outfile,begindate,enddate,racedb)
+    collect(outfile,begindate,enddate,racedb,args.format)
     
         
 # ##########################################################################################
@@ -34,8 +34,9 @@ import csv
 
 # home grown
 from . import version
-from .render import rendertime
-from loutilities.agegrade import AgeGrade
+from .config import parameterError
+from .render import rendertimes
+from .agfactors import getagfactors
 
 # distances in miles
 METERSINMILE = 1609.0   # short distance corrects mistake in ag spreadsheet
@@ -56,9 +57,97 @@ DISTTBL = OrderedDict([
                     ('Marathon',26.2)  # short distance corrects mistake in ag spreadsheet
                 ])
 GEN = {'m':'Male','M':'Male','f':'Female','F':'Female'}
+FORMATS = ['csv','xlsx','parquet']
 
 #----------------------------------------------------------------------
-def genagtables(gen,agpcs,ages): 
+def hms(rendered): 
+#----------------------------------------------------------------------
+    '''
+    make sure rendered time format is h:m:s
+    
+    :param rendered: time rendered by rendertime()
+    :rtype: time as h:m:s
+    '''
+    return '0:' * (2 - rendered.count(':')) + rendered
+
+#----------------------------------------------------------------------
+def distfactors(agf,gen,ages): 
+#----------------------------------------------------------------------
+    '''
+    look up age grade factor and open standard for each distance in DISTTBL, for each age
+    
+    :param agf: AgeGradeFactors object
+    :param gen: gender 'M' or 'F'
+    :param ages: list of ages
+    :rtype: [[openstd/factor for each distance] for each age] - seconds for 100% age grade
+    '''
+    stdtimes = []
+    for age in ages:
+        agerow = []
+        for dist in DISTTBL:
+            factor,openstd = agf.factorstd(age,gen,DISTTBL[dist])
+            agerow.append(openstd/factor)
+        stdtimes.append(agerow)
+    
+    return stdtimes
+
+#----------------------------------------------------------------------
+def agtimes(gen,agpcs,ages,agf=None): 
+#----------------------------------------------------------------------
+    '''
+    calculate required results for every age grade percentage, age and distance in one batch
+    
+    same as AgeGrade.result(age,gen,DISTTBL[dist],agpc) for each cell.  Uses numpy if available
+    
+    :param gen: gender 'M' or 'F'
+    :param agpcs: list of age grade percentages
+    :param ages: list of ages
+    :param agf: AgeGradeFactors object, default is the module level cache
+    :rtype: list of times (seconds), ordered by agpc, then age, then distance in DISTTBL order
+    '''
+    if not agf:
+        agf = getagfactors()
+    stdtimes = distfactors(agf,gen,ages)
+    
+    # numpy is optional -- cells are calculated one at a time if it isn't installed
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    
+    if np is None:
+        return [stdtime/(agpc/100.0) for agpc in agpcs for agerow in stdtimes for stdtime in agerow]
+    
+    # broadcast ages x distances table across percentages
+    cube = np.array(stdtimes,dtype=float)[np.newaxis,:,:] / (np.array(agpcs,dtype=float)/100.0)[:,np.newaxis,np.newaxis]
+    return cube.ravel().tolist()
+
+#----------------------------------------------------------------------
+def agtablerows(gen,agpcs,ages,agf=None): 
+#----------------------------------------------------------------------
+    '''
+    generate table rows by age grade with age/distance results, for all age grade percentages at once
+    
+    :param gen: gender 'M' or 'F'
+    :param agpcs: list of age grade percentages
+    :param ages: list of ages
+    :param agf: AgeGradeFactors object, default is the module level cache
+    :rtype: generator of (agpc, age, [seconds for each distance], [h:m:s for each distance])
+    '''
+    times = agtimes(gen,agpcs,ages,agf)
+    
+    # render all times at once, same as rendertime(time,0,useceiling=False,usefloor=True)
+    rendered = [hms(thistime) for thistime in rendertimes(times,0,useceiling=False,usefloor=True)]
+    
+    numdists = len(DISTTBL)
+    cell = 0
+    for agpc in agpcs:
+        for age in ages:
+            yield agpc,age,times[cell:cell+numdists],rendered[cell:cell+numdists]
+            cell += numdists
+
+#----------------------------------------------------------------------
+def genagtables(gen,agpcs,ages,agf=None): 
 #----------------------------------------------------------------------
     '''
     generate tables by age grade with age/distance results, into current directory
@@ -66,43 +155,109 @@ def genagtables(gen,agpcs,ages):
     :param gen: gender 'M' or 'F'
     :param agpcs: list of age grade percentages
     :param ages: list of ages
+    :param agf: AgeGradeFactors object, default is the module level cache
     '''
     
-    # instantiate age grade object
-    ag = AgeGrade()
+    hdr = ['age'] + list(DISTTBL.keys())
     
     # generate csv file for each age grade percentage
-    for agpc in agpcs:
-        # open file and output heading rows
-        fn = 'results-for-age-grade-{}-{}.csv'.format(gen,agpc)
-        F = open(fn,'w',newline='')
-        F.write('Required Results for Age Grade {} {}%\n'.format(GEN[gen],agpc))
-        F.write('\n')
-        hdr = ['age'] + list(DISTTBL.keys())
-        C = csv.DictWriter(F,hdr)
-        C.writeheader()
+    F = None
+    lastagpc = None
+    for agpc,age,times,rendered in agtablerows(gen,agpcs,ages,agf):
+        # open file and output heading rows when starting a new percentage
+        if agpc != lastagpc:
+            if F: F.close()
+            fn = 'results-for-age-grade-{}-{}.csv'.format(gen,agpc)
+            F = open(fn,'w',newline='')
+            F.write('Required Results for Age Grade {} {}%\n'.format(GEN[gen],agpc))
+            F.write('\n')
+            C = csv.writer(F)
+            C.writerow(hdr)
+            lastagpc = agpc
         
-        # generate a row for each age
-        for age in ages:
-            row = {}
-            row['age'] = age
-            
-            # generate each result
-            for dist in list(DISTTBL.keys()):
-                # if this fails, need to copy result from runningclub.agegrade to loutilities.agegrade
-                thistime = rendertime(ag.result(age,gen,DISTTBL[dist],agpc),0, useceiling=False, usefloor=True)
-                
-                # make sure format is h:m:s
-                while len(thistime.split(':')) < 3:
-                    thistime = '0:' + thistime
-                
-                row[dist] = thistime
-                
-            C.writerow(row)
-            
-        # close file
-        F.close()
+        C.writerow([age] + rendered)
+        
+    # close file
+    if F: F.close()
         
+#----------------------------------------------------------------------
+def genagworkbook(fname,gens,agpcs,ages,agf=None): 
+#----------------------------------------------------------------------
+    '''
+    generate tables by age grade with age/distance results, into a single workbook
+    with one sheet per gender and age grade percentage.  Requires xlsxwriter
+    
+    :param fname: output file name
+    :param gens: list of genders 'M' and/or 'F'
+    :param agpcs: list of age grade percentages
+    :param ages: list of ages
+    :param agf: AgeGradeFactors object, default is the module level cache
+    '''
+    # xlsxwriter is only required for workbook output
+    try:
+        import xlsxwriter
+    except ImportError:
+        raise parameterError('xlsxwriter must be installed for xlsx output')
+    
+    hdr = ['age'] + list(DISTTBL.keys())
+    
+    # rows are streamed to disk as they are written
+    wb = xlsxwriter.Workbook(fname,{'constant_memory':True})
+    bold = wb.add_format({'bold':True})
+    try:
+        for gen in gens:
+            lastagpc = None
+            for agpc,age,times,rendered in agtablerows(gen,agpcs,ages,agf):
+                # new sheet for each percentage, with same heading rows as csv file
+                if agpc != lastagpc:
+                    ws = wb.add_worksheet('{} {}%'.format(GEN[gen],agpc))
+                    ws.set_column(1,len(DISTTBL),10)
+                    ws.write_string(0,0,'Required Results for Age Grade {} {}%'.format(GEN[gen],agpc),bold)
+                    ws.write_row(2,0,hdr,bold)
+                    rownum = 3
+                    lastagpc = agpc
+                
+                ws.write_number(rownum,0,age)
+                ws.write_row(rownum,1,rendered)
+                rownum += 1
+    finally:
+        wb.close()
+
+#----------------------------------------------------------------------
+def genagparquet(fname,gens,agpcs,ages,agf=None): 
+#----------------------------------------------------------------------
+    '''
+    generate tables by age grade with age/distance results, into a single parquet file
+    with a row per gender, age grade percentage and age, and time in seconds for each distance.
+    Requires pyarrow
+    
+    :param fname: output file name
+    :param gens: list of genders 'M' and/or 'F'
+    :param agpcs: list of age grade percentages
+    :param ages: list of ages
+    :param agf: AgeGradeFactors object, default is the module level cache
+    '''
+    # pyarrow is only required for parquet output
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise parameterError('pyarrow must be installed for parquet output')
+    
+    schema = pa.schema([('gender',pa.string()),('agpc',pa.int64()),('age',pa.int64())] + [(dist,pa.float64()) for dist in DISTTBL])
+    
+    # one batch per gender
+    writer = pq.ParquetWriter(fname,schema)
+    try:
+        for gen in gens:
+            columns = [[] for field in schema]
+            for agpc,age,times,rendered in agtablerows(gen,agpcs,ages,agf):
+                for column,value in zip(columns,[gen.upper(),agpc,age] + times):
+                    column.append(value)
+            writer.write_batch(pa.RecordBatch.from_arrays([pa.array(column,type=field.type) for column,field in zip(columns,schema)],schema=schema))
+    finally:
+        writer.close()
+
 #----------------------------------------------------------------------
 def main(): 
 #----------------------------------------------------------------------
@@ -110,10 +265,12 @@ def main():
     generate tables by age grade with age/distance results, into current directory
     '''
     parser = argparse.ArgumentParser(version='{0} {1}'.format('runningclub',version.__version__))
-    parser.add_argument('gender',help='gender, "M" or "F"')
+    parser.add_argument('gender',help='gender, "M" or "F", or "MF" for both')
     parser.add_argument('agpcrange',help='range of age grade percentages to generate result for "agpcfirst-agpclast"')
     parser.add_argument('agerange',help='range of ages to generate result for "agefirst-agelast"')
     parser.add_argument('-s','--step',help='step between ages, default 1 year',type=int,default=1)
+    parser.add_argument('-f','--format', help="output file format, one of {0}, default=%(default)s.  csv creates a file per gender and percentage, others create a single file".format(','.join(FORMATS)),choices=FORMATS,default='csv')
+    parser.add_argument('-o','--outfile', help="output file name for xlsx or parquet format, default=results-for-age-grade.<format>",default=None)
     args = parser.parse_args()
     
     agpcrange = [int(agpc) for agpc in args.agpcrange.split('-')]
@@ -124,7 +281,21 @@ def main():
     agpcs = list(range(agpcrange[0],agpcrange[1]+1))
     ages = list(range(agerange[0],agerange[1]+args.step, args.step))
     
-    genagtables(args.gender,agpcs,ages)
+    gens = list(args.gender)
+    
+    if args.format == 'csv':
+        for gen in gens:
+            genagtables(gen,agpcs,ages)
+        return
+    
+    outfile = args.outfile
+    if not outfile:
+        outfile = 'results-for-age-grade.{0}'.format(args.format)
+    
+    if args.format == 'xlsx':
+        genagworkbook(outfile,gens,agpcs,ages)
+    else:
+        genagparquet(outfile,gens,agpcs,ages)
     
 # ##########################################################################################
 #	__main__
@@ -117,6 +117,9 @@ def main():
     asofasc = '{}-1-1'.format(thisyear) # jan 1 of current year
     asof = tYmd.asc2dt(asofasc) 
     
+    # ids of runners added or changed, for incremental export
+    changedrunnerids = set()
+    
     # process each name in new membership list
     allmembers = members.getmembers()
     for name in allmembers:
@@ -164,6 +167,8 @@ def main():
                 thisrunner.name = thisname  
                 
                 added = racedb.update(session,racedb.Runner,dbmember,thisrunner,skipcolumns=['id'])
+                if added:
+                    changedrunnerids.add(dbmember.id)
                 found = True
                 
             # if runner's name is in database, but not a member, see if this runner is a nonmemember which can be converted
@@ -187,6 +192,8 @@ def main():
                 if dob is None or resultage == expectedage:
                     thisrunner = racedb.Runner(thisname,thisdob,thisgender,thishometown)
                     added = racedb.update(session,racedb.Runner,dbnonmember,thisrunner,skipcolumns=['id'])
+                    if added:
+                        changedrunnerids.add(dbnonmember.id)
                     found = True
                 else:
                     print('{} found in database, wrong age, expected {} found {} in {}'.format(thisname,expectedage,resultage,result))
@@ -197,6 +204,8 @@ def main():
             if not found:
                 thisrunner = racedb.Runner(thisname,thisdob,thisgender,thishometown)
                 added = racedb.insert_or_update(session,racedb.Runner,thisrunner,skipcolumns=['id'],name=thisname,dateofbirth=thisdob)
+                if added:
+                    changedrunnerids.add(racedb.getunique(session,racedb.Runner,name=thisname,dateofbirth=thisdob).id)
                 
             # remove this runner from collection of runners which should be deactivated in database
             if (thisrunner.name,thisrunner.dateofbirth) in inactiverunners:
@@ -212,9 +221,19 @@ def main():
     for (name,dateofbirth) in inactiverunners:
         thisrunner = session.query(racedb.Runner).filter_by(name=name,dateofbirth=dateofbirth).first() # should be only one returned by filter
         thisrunner.active = False
+        changedrunnerids.add(thisrunner.id)
         
         if OUT:
             OUT.write('deactivated {0}\n'.format(thisrunner))
+    
+    # exported results for races these runners ran have changed, so incremental export picks up the races again
+    changedrunnerids = list(changedrunnerids)
+    changedraceids = set()
+    BATCHSIZE = 500
+    for batchstart in range(0,len(changedrunnerids),BATCHSIZE):
+        batch = changedrunnerids[batchstart:batchstart+BATCHSIZE]
+        changedraceids.update([raceid for (raceid,) in session.query(racedb.RaceResult.raceid).filter(racedb.RaceResult.runnerid.in_(batch)).distinct()])
+    racedb.newresultsversions(session,sorted(changedraceids))
         
     session.commit()
     session.close()
@@ -89,14 +89,19 @@ def updateraces(session, fileraces):
             OUT.write('found id={0}, race={1}\n'.format(thisrace.id,thisrace))
     
     # process each name in race list
+    changedraceids = []
     for thisrace in fileraces.getraces():
         # add or update race in database
         race = racedb.Race(thisrace['race'],thisrace['year'],thisrace['racenum'],thisrace['date'],thisrace['time'],thisrace['distance'])
-        added = racedb.insert_or_update(session,racedb.Race,race,skipcolumns=['id'],name=race.name,year=race.year)
+        added = racedb.insert_or_update(session,racedb.Race,race,skipcolumns=['id','resultsversion'],name=race.name,year=race.year)
         
         # remove this race from collection of races which should be deleted in database
         if (race.name,race.year) in inactiveraces:
-            inactiveraces.pop((race.name,race.year))
+            dbrace = inactiveraces.pop((race.name,race.year))
+            
+            # exported results show the race name, date and distance, so updated races are exported again
+            if added:
+                changedraceids.append(dbrace.id)
             
         if OUT:
             if added:
@@ -104,6 +109,8 @@ def updateraces(session, fileraces):
             else:
                 OUT.write('no updates necessary {0}\n'.format(race))
     
+    racedb.newresultsversions(session,changedraceids)
+    
     # any races remaining in 'inactiveraces' should be deactivated
     for (name,year) in inactiveraces:
         thisrace = session.query(racedb.Race).filter_by(name=name,year=year).first() # should be only one returned by filter
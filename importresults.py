@@ -50,57 +50,121 @@ from . import clubmember
 from . import raceresults
 from loutilities import agegrade
 from . import render
+from . import agfactors
 from loutilities import timeu
 
 # module globals
 tYmd = timeu.asctime('%Y-%m-%d')
 DEBUG = None
 AGDEBUG = None
-ag = agegrade.AgeGrade()
+ag = None       # only used for --agdebug, otherwise age grade factors come from agfactors cache
 
 #----------------------------------------------------------------------
-def tabulate(session,race,resultsfile,excluded,nonmemforced,series,active,inactive,nonmember,INACTCSV,MISSEDCSV,CLOSECSV,NONMEMCSV): 
+def setplaces(results,timefield,placefield,precision,averagetie): 
 #----------------------------------------------------------------------
     '''
-    collect the data, as directed by series attributes
+    set places for a group of results which is already sorted by timefield
+    
+    results whose times render the same at the indicated precision are tied
+    
+    :param results: list of racedb.RaceResult objects, sorted by timefield
+    :param timefield: name of RaceResult field which holds the time, e.g., 'time' or 'agtime'
+    :param placefield: name of RaceResult field to set the place into, e.g., 'genderplace'
+    :param precision: number of places after decimal point for tie detection
+    :param averagetie: True if places for ties are averaged, else all tied results get the highest place
+    '''
+    
+    # tie detection is based on rendering, which rounds up to a specific precision based on distance
+    # the adjusted time is equal exactly when the rendered time is equal, and is much cheaper to compute
+    keys = [render.adjusttime(getattr(r,timefield),precision) for r in results]
+    
+    numresults = len(results)
+    rrndx = 0
+    while rrndx < numresults:
+        # find the last result which is tied with this one
+        lastndx = rrndx
+        while lastndx+1 < numresults and keys[lastndx+1] == keys[rrndx]:
+            lastndx += 1
+        
+        thisplace = rrndx+1
+        lasttie = lastndx+1
+        if lastndx > rrndx and averagetie:
+            place = (thisplace+lasttie) / 2.0
+        else:
+            place = thisplace
+        for tiendx in range(rrndx,lastndx+1):
+            setattr(results[tiendx],placefield,place)
+        
+        rrndx = lastndx+1
+
+#----------------------------------------------------------------------
+def getrunners(session,names): 
+#----------------------------------------------------------------------
+    '''
+    retrieve runners with any of the indicated names from the database, using a few batched queries
+    rather than a query per runner
+    
+    :param session: database session
+    :param names: set of runner names
+    :rtype: ({(name,dateofbirth):(runnerid,gender),...}, {name:(runnerid,gender),...} for nonmembers)
+    '''
+    
+    runners = {}
+    nonmemberrunners = {}
+    
+    # ordered by id so that the first nonmember with a given name is used, as there may be more than one
+    names = list(names)
+    BATCHSIZE = 500
+    for batchstart in range(0,len(names),BATCHSIZE):
+        batch = names[batchstart:batchstart+BATCHSIZE]
+        query = session.query(racedb.Runner.id,racedb.Runner.name,racedb.Runner.dateofbirth,racedb.Runner.gender,racedb.Runner.member) \
+                  .filter(racedb.Runner.name.in_(batch)).order_by(racedb.Runner.id)
+        for runnerid,name,dateofbirth,gender,member in query:
+            if (name,dateofbirth) not in runners:
+                runners[name,dateofbirth] = (runnerid,gender)
+            if member == False and name not in nonmemberrunners:
+                nonmemberrunners[name] = (runnerid,gender)
+    
+    return runners,nonmemberrunners
+
+#----------------------------------------------------------------------
+def resolveresults(session,race,resultsfile,excluded,nonmemforced,active,inactive,nonmember,MISSEDCSV,CLOSECSV): 
+#----------------------------------------------------------------------
+    '''
+    collect the results from the results file, and match each result against the
+    members and nonmembers in the database
+    
+    this is done once per race -- the resolved results are then tabulated for each series
+    by tabulate()
+    
+    each resolved result has the following keys
+    
+    * result - result from raceresults.RaceResults
+    * found - 'member', 'inactive', 'nonmember' or 'new' (nonmember which is not in the database yet)
+    * name - name of runner (from database if found)
+    * dob - runner's yyyy-mm-dd date of birth from database, or '' if not known
+    * runnerid - runner.id, or None if found == 'new' and runner has not been added to the database yet
+    * gender - M or F
+    * divage - age on Jan 1 of race year, for divisions, or None if not known
+    * agegradeage - age on race day, or None if not known
+    * agpercent, agtime, agfactor - age grade results, or None if agegradeage is not known
     
     :param session: database session
     :param race: racedb.Race object
     :param resultsfile: file containing results
     :param excluded: list of racers which are to be excluded from results, regardless of member match
     :param nonmemforced: list of racers which forced to be included as nonmembers, regardless of member match
-    :param series: racedb.Series object - describes how to calculate results
     :param active: active members as produced by clubmember.ClubMember()
     :param inactive: inactive members as produced by clubmember.ClubMember()
     :param nonmember: nonmembers as produced by clubmember.ClubMember()
-    :param INACTCSV: filehandle to write inactive member log entries, if desired (else None)
     :param MISSEDCSV: filehandle to write log of members which did not match age based on dob in database, if desired (else None)
     :param CLOSECSV: filehandle to write log of members which matched, but not exactly, if desired (else None)
-    :param NONMEMCSV: filehandle to write log of nonmembers which were found, if desired (else None)
-    :rtype: number of entries processed
+    :rtype: (number of entries in results file, list of resolved results)
     '''
     
     # get precision for time rendering
     timeprecision,agtimeprecision = render.getprecision(race.distance)
     
-    # get divisions for this series, if appropriate
-    if series.divisions:
-        alldivs = session.query(racedb.Divisions).filter_by(seriesid=series.id,active=True).all()
-        
-        if len(alldivs) == 0:
-            raise dbConsistencyError('series {0} indicates divisions to be calculated, but no divisions found'.format(series.name))
-        
-        divisions = []
-        for div in alldivs:
-            divisions.append((div.divisionlow,div.divisionhigh))
-
-        # TODO: remove dead code
-        #division = {'F':collections.OrderedDict(),'M':collections.OrderedDict()}
-        ## force order of dict.  later delete empty divisions
-        #for gender in ['F','M']:
-        #    for thisdiv in divisions:
-        #        division[gender][thisdiv] = []
-
     # collect results from resultsfile
     rr = raceresults.RaceResults(resultsfile,race.distance)
     numentries = 0
@@ -113,15 +177,15 @@ def tabulate(session,race,resultsfile,excluded,nonmemforced,series,active,inacti
             break
         numentries += 1
     
-    # loop through result entries, collecting overall, bygender, division and agegrade results
+    # loop through result entries, matching each against the members and nonmembers
+    matched = []
+    aggrade = []
     for rndx in range(len(results)):
         result = results[rndx]
         
         # skip result which has been asked to be excluded
         if result['name'] in excluded: continue
         
-        # some races are for members only
-        # for these, don't tabulate unless member found
         # don't look for member if we are forcing this name to be a nonmember
         foundmember = None
         foundinactive = None
@@ -138,30 +202,35 @@ def tabulate(session,race,resultsfile,excluded,nonmemforced,series,active,inacti
                 ascdob = thismiss['dob']
                 ratio = thismiss['ratio']
                 MISSEDCSV.writerow({'results name':result['name'],'results age':result['age'],'database name':name,'database dob':ascdob,'ratio':ratio})
-            
-        # log inactive members (members who had previously paid, but are not paid up) who ran this race
-        if series.membersonly and not foundmember:
-            if foundinactive and INACTCSV:
-                name,ascdob = foundinactive
-                ratio = clubmember.getratio(result['name'].strip().lower(),name.strip().lower())
-                INACTCSV.writerow({'results name':result['name'],'results age':result['age'],'database name':name,'database dob':ascdob,'ratio':ratio})
-            continue
         
+        matched.append((result,foundmember,foundinactive,foundnonmember))
+    
+    # retrieve all the runners which were matched from the database at once
+    names = set()
+    for result,foundmember,foundinactive,foundnonmember in matched:
+        if foundmember:     names.add(foundmember[0])
+        if foundinactive:   names.add(foundinactive[0])
+        if foundnonmember:  names.add(foundnonmember)
+    runners,nonmemberrunners = getrunners(session,names)
+    
+    # loop through matched entries, resolving each against the database
+    resolved = []
+    for result,foundmember,foundinactive,foundnonmember in matched:
         # for members or people who were once members, set age based on date of birth in database
         if foundmember or foundinactive:
             # for members and inactivemembers, get name, id and genderfrom database (will replace that which was used in results file)
             if foundmember:
+                found = 'member'
                 name,ascdob = foundmember
                 if CLOSECSV and name.strip().lower() != result['name'].strip().lower():
                     ratio = clubmember.getratio(result['name'].strip().lower(),name.strip().lower())
                     CLOSECSV.writerow({'results name':result['name'],'results age':result['age'],'database name':name,'database dob':ascdob,'ratio':ratio})
             elif foundinactive:
+                found = 'inactive'
                 name,ascdob = foundinactive
         
             # get runner from database
-            runner = session.query(racedb.Runner).filter_by(name=name,dateofbirth=ascdob).first()
-            runnerid = runner.id
-            gender = runner.gender
+            runnerid,gender = runners[name,ascdob]
             
             try:
                 dob = tYmd.asc2dt(ascdob)
@@ -191,14 +260,15 @@ def tabulate(session,race,resultsfile,excluded,nonmemforced,series,active,inacti
         # TODO: there may be misspellings in the results file for non-members -- if this occurs, may need to make this more robust
         elif foundnonmember:
             # TODO: how to handle corner case when there are two matching nonmembers of different ages?
+            found = 'nonmember'
             name = foundnonmember
+            ascdob = ''
             
             # get runner from database
-            runner = session.query(racedb.Runner).filter_by(name=name,member=False).first()
-            runnerid = runner.id
-            gender = runner.gender
-            NONMEMCSV.writerow({'results name':result['name'],'results age':result['age'],'new':'N','runner id':runnerid})
+            runnerid,gender = nonmemberrunners[name]
             
+            # if non-member, no division awards, because age as of Jan 1 is not known
+            divage = None
             try:
                 agegradeage = int(result['age'])
             except:
@@ -206,9 +276,13 @@ def tabulate(session,race,resultsfile,excluded,nonmemforced,series,active,inacti
 
         # for new non-members, set agegrade age based on results file
         # if non-member, no division awards, because age as of Jan 1 is not known
+        # the runner is added to the database by tabulate(), only if a series needs it
         # TODO: there may be misspellings in the results file for non-members -- if this occurs, may need to make this more robust
         else:
+            found = 'new'
             name = result['name']
+            ascdob = ''
+            runnerid = None
             gender = result['gender'].upper()
             divage = None
             
@@ -217,12 +291,6 @@ def tabulate(session,race,resultsfile,excluded,nonmemforced,series,active,inacti
             except:
                 agegradeage = None
                 
-            # create the nonmember in the database (no date of birth or hometown)
-            runner = racedb.Runner(name,None,gender,None,member=False)
-            added = racedb.insert_or_update(session,racedb.Runner,runner,skipcolumns=['id'],name=runner.name,dateofbirth=None,member=False)
-            runnerid = runner.id
-            NONMEMCSV.writerow({'results name':result['name'],'results age':result['age'],'new':'Y','runner id':runnerid})
-            
         # may need to write to debug file
         if DEBUG: 
             if foundmember:
@@ -234,24 +302,134 @@ def tabulate(session,race,resultsfile,excluded,nonmemforced,series,active,inacti
             else:
                 DEBUG.write('{0},{1},{2},{3},{4}\n'.format(result['name'],result['age'],'',name,'new nonmember'))
 
-        # at this point, there should always be a runnerid in the database, even if non-member
-        resulttime = result['time']
-        raceresult = racedb.RaceResult(runnerid,race.id,series.id,resulttime,gender,agegradeage)
-
         # always add age grade to result if we know the age
         # we will decide whether to render, later based on series.calcagegrade, in another script
+        resulttime = result['time']
+        agpercent,agtime,agfactor = None,None,None
         if agegradeage:
-            timeprecision,agtimeprecision = render.getprecision(race.distance)
             adjtime = render.adjusttime(resulttime,timeprecision)    # ceiling for adjtime
+            # debug output is written by AgeGrade, one result at a time
             if AGDEBUG:
                 AGDEBUG.write('{},{},{},'.format(result['name'],resulttime,adjtime))
-            raceresult.agpercent,raceresult.agtime,raceresult.agfactor = ag.agegrade(agegradeage,gender,race.distance,adjtime)
+                agpercent,agtime,agfactor = ag.agegrade(agegradeage,gender,race.distance,adjtime)
+            else:
+                aggrade.append((len(resolved),agegradeage,gender,adjtime))
+
+        resolved.append({'result':result,'found':found,'name':name,'dob':ascdob,'runnerid':runnerid,'gender':gender,
+                         'divage':divage,'agegradeage':agegradeage,
+                         'agpercent':agpercent,'agtime':agtime,'agfactor':agfactor})
+    
+    # age grade all the results at once
+    if aggrade:
+        ndxs,ages,gens,times = list(zip(*aggrade))
+        agegrades = agfactors.getagfactors().agegrade_many(ages,gens,race.distance,times)
+        for ndx,(agpercent,agtime,agfactor) in zip(ndxs,agegrades):
+            resolved[ndx].update({'agpercent':agpercent,'agtime':agtime,'agfactor':agfactor})
+    
+    return numentries,resolved
+
+#----------------------------------------------------------------------
+def addnewrunners(session,resolved,NONMEMCSV): 
+#----------------------------------------------------------------------
+    '''
+    add new nonmembers from the resolved results to the database (no date of birth or hometown), and
+    set runnerid for those results
+    
+    :param session: database session
+    :param resolved: resolved results, as returned by resolveresults()
+    :param NONMEMCSV: filehandle to write log of nonmembers which were added, if desired (else None)
+    '''
+    
+    newresolved = [r for r in resolved if r['found'] == 'new' and r['runnerid'] is None]
+    if not newresolved: return
+    
+    # the same name may appear more than once in the results, but only one runner is created
+    newrunners = collections.OrderedDict()
+    for thisresolved in newresolved:
+        if thisresolved['name'] not in newrunners:
+            newrunners[thisresolved['name']] = racedb.Runner(thisresolved['name'],None,thisresolved['gender'],None,member=False)
+    racedb.bulk_insert(session,racedb.Runner,list(newrunners.values()))
+    
+    # retrieve the ids the database assigned, in batches to keep the IN clause reasonable
+    runnerids = {}
+    names = list(newrunners.keys())
+    BATCHSIZE = 500
+    for batchstart in range(0,len(names),BATCHSIZE):
+        batch = names[batchstart:batchstart+BATCHSIZE]
+        for name,runnerid in session.query(racedb.Runner.name,racedb.Runner.id).filter(racedb.Runner.name.in_(batch)).filter_by(dateofbirth='',member=False):
+            runnerids[name] = runnerid
+    
+    for thisresolved in newresolved:
+        thisresolved['runnerid'] = runnerids[thisresolved['name']]
+        if NONMEMCSV:
+            result = thisresolved['result']
+            NONMEMCSV.writerow({'results name':result['name'],'results age':result['age'],'new':'Y','runner id':thisresolved['runnerid']})
+
+#----------------------------------------------------------------------
+def tabulate(session,race,resolved,series,INACTCSV,NONMEMCSV,incremental=False): 
+#----------------------------------------------------------------------
+    '''
+    tabulate the resolved results for one series, as directed by series attributes
+    
+    :param session: database session
+    :param race: racedb.Race object
+    :param resolved: resolved results, as returned by resolveresults()
+    :param series: racedb.Series object - describes how to calculate results
+    :param INACTCSV: filehandle to write inactive member log entries, if desired (else None)
+    :param NONMEMCSV: filehandle to write log of nonmembers which were found, if desired (else None)
+    :param incremental: True if results previously stored for this race / series are to be updated with changes only
+    :rtype: number of results tabulated for this series
+    '''
+    
+    # get precision for time rendering
+    timeprecision,agtimeprecision = render.getprecision(race.distance)
+    
+    # get divisions for this series, if appropriate
+    if series.divisions:
+        alldivs = session.query(racedb.Divisions).filter_by(seriesid=series.id,active=True).all()
+        
+        if len(alldivs) == 0:
+            raise dbConsistencyError('series {0} indicates divisions to be calculated, but no divisions found'.format(series.name))
+        
+        divisions = []
+        for div in alldivs:
+            divisions.append((div.divisionlow,div.divisionhigh))
+
+    # create new nonmembers in the database, the first time a series needs them
+    if not series.membersonly:
+        addnewrunners(session,resolved,NONMEMCSV)
+    
+    # loop through resolved results, collecting overall, bygender, division and agegrade results
+    raceresults = []
+    for thisresolved in resolved:
+        result = thisresolved['result']
+        found = thisresolved['found']
+        
+        # some races are for members only
+        # for these, don't tabulate unless member found
+        if series.membersonly and found != 'member':
+            # log inactive members (members who had previously paid, but are not paid up) who ran this race
+            if found == 'inactive' and INACTCSV:
+                name = thisresolved['name']
+                ratio = clubmember.getratio(result['name'].strip().lower(),name.strip().lower())
+                INACTCSV.writerow({'results name':result['name'],'results age':result['age'],'database name':name,'database dob':thisresolved['dob'],'ratio':ratio})
+            continue
+        
+        # log nonmembers which were found in the database
+        if found == 'nonmember' and NONMEMCSV:
+            NONMEMCSV.writerow({'results name':result['name'],'results age':result['age'],'new':'N','runner id':thisresolved['runnerid']})
+
+        # at this point, there should always be a runnerid in the database, even if non-member
+        raceresult = racedb.RaceResult(thisresolved['runnerid'],race.id,series.id,result['time'],thisresolved['gender'],thisresolved['agegradeage'])
+        raceresult.agpercent = thisresolved['agpercent']
+        raceresult.agtime = thisresolved['agtime']
+        raceresult.agfactor = thisresolved['agfactor']
 
         if series.divisions:
             # member's age to determine division is the member's age on Jan 1
             # if member doesn't give date of birth for membership list, member is not eligible for division awards
             # if non-member, also no division awards, because age as of Jan 1 is not known
-            age = divage    # None if not available
+            age = thisresolved['divage']    # None if not available
             if age:
                 # linear search for correct division
                 for thisdiv in divisions:
@@ -262,139 +440,95 @@ def tabulate(session,race,resultsfile,excluded,nonmemforced,series,active,inacti
                         raceresult.divisionhigh = divhigh
                         break
 
-        # make result persistent
-        session.add(raceresult)
+        raceresults.append(raceresult)
         
     # process overall and bygender results, sorted by time
+    # places are all determined in memory, before the results are made persistent
     # TODO: is series.overall vs. series.orderby=='time' redundant?  same questio for series.agegrade vs. series.orderby=='agtime'
     if series.orderby == 'time':
-        # get all the results which have been stored in the database for this race/series
         ### TODO: use series.orderby, series.hightolow
-        dbresults = session.query(racedb.RaceResult).filter_by(raceid=race.id,seriesid=series.id).order_by(racedb.RaceResult.time).all()
-        numresults = len(dbresults)
-        for rrndx in range(numresults):
-            raceresult = dbresults[rrndx]
-            
-            # set place if it has not been set before
-            # place may have been determined at previous iteration, if a tie was detected
-            if not raceresult.overallplace:
-                thisplace = rrndx+1
-                tieindeces = [rrndx]
-                
-                # detect tie in subsequent results based on rendering,
-                # which rounds to a specific precision based on distance
-                time = render.rendertime(raceresult.time,timeprecision)
-                for tiendx in range(rrndx+1,numresults):
-                    if render.rendertime(dbresults[tiendx].time,timeprecision) != time:
-                        break
-                    tieindeces.append(tiendx)
-                lasttie = tieindeces[-1] + 1
-                for tiendx in tieindeces:
-                    numsametime = len(tieindeces)
-                    if numsametime > 1 and series.averagetie:
-                        dbresults[tiendx].overallplace = (thisplace+lasttie) / 2.0
-                    else:
-                        dbresults[tiendx].overallplace = thisplace
-
-        for gender in ['F','M']:
-            dbresults = session.query(racedb.RaceResult).filter_by(raceid=race.id,seriesid=series.id,gender=gender).order_by(racedb.RaceResult.time).all()
-
-            numresults = len(dbresults)
-            for rrndx in range(numresults):
-                raceresult = dbresults[rrndx]
-            
-                # set place if it has not been set before
-                # place may have been determined at previous iteration, if a tie was detected
-                if not raceresult.genderplace:
-                    thisplace = rrndx+1
-                    tieindeces = [rrndx]
-                    
-                    # detect tie in subsequent results based on rendering,
-                    # which rounds to a specific precision based on distance
-                    time = render.rendertime(raceresult.time,timeprecision)
-                    for tiendx in range(rrndx+1,numresults):
-                        if render.rendertime(dbresults[tiendx].time,timeprecision) != time:
-                            break
-                        tieindeces.append(tiendx)
-                    lasttie = tieindeces[-1] + 1
-                    for tiendx in tieindeces:
-                        numsametime = len(tieindeces)
-                        if numsametime > 1 and series.averagetie:
-                            dbresults[tiendx].genderplace = (thisplace+lasttie) / 2.0
-                        else:
-                            dbresults[tiendx].genderplace = thisplace
-
+        # sort once -- each grouping below is a subset of this list, so stays in time order
+        byorder = sorted(raceresults,key=lambda r: r.time)
+        setplaces(byorder,'time','overallplace',timeprecision,series.averagetie)
+        
+        # collect gender and gender/division groupings in a single pass
+        bygender = {'F':[],'M':[]}
+        bydivision = {}
         if series.divisions:
             for gender in ['F','M']:
-                
-                # linear search for correct division
                 for thisdiv in divisions:
-                    divlow = thisdiv[0]
-                    divhigh = thisdiv[1]
-
-                    dbresults = session.query(racedb.RaceResult)  \
-                                  .filter_by(raceid=race.id,seriesid=series.id,gender=gender,divisionlow=divlow,divisionhigh=divhigh) \
-                                  .order_by(racedb.RaceResult.time).all()
+                    bydivision[gender,thisdiv] = []
+        for raceresult in byorder:
+            if raceresult.gender in bygender:
+                bygender[raceresult.gender].append(raceresult)
+            divkey = (raceresult.gender,(raceresult.divisionlow,raceresult.divisionhigh))
+            if divkey in bydivision:
+                bydivision[divkey].append(raceresult)
         
-                    numresults = len(dbresults)
-                    for rrndx in range(numresults):
-                        raceresult = dbresults[rrndx]
-
-                        # set place if it has not been set before
-                        # place may have been determined at previous iteration, if a tie was detected
-                        if not raceresult.divisionplace:
-                            thisplace = rrndx+1
-                            tieindeces = [rrndx]
-                            
-                            # detect tie in subsequent results based on rendering,
-                            # which rounds to a specific precision based on distance
-                            time = render.rendertime(raceresult.time,timeprecision)
-                            for tiendx in range(rrndx+1,numresults):
-                                if render.rendertime(dbresults[tiendx].time,timeprecision) != time:
-                                    break
-                                tieindeces.append(tiendx)
-                            lasttie = tieindeces[-1] + 1
-                            for tiendx in tieindeces:
-                                numsametime = len(tieindeces)
-                                if numsametime > 1 and series.averagetie:
-                                    dbresults[tiendx].divisionplace = (thisplace+lasttie) / 2.0
-                                else:
-                                    dbresults[tiendx].divisionplace = thisplace
+        for gender in ['F','M']:
+            setplaces(bygender[gender],'time','genderplace',timeprecision,series.averagetie)
+        for divkey in bydivision:
+            setplaces(bydivision[divkey],'time','divisionplace',timeprecision,series.averagetie)
 
     # process age grade results, ordered by agtime
+    # results with unknown age don't have agtime, so can't be placed
     elif series.orderby == 'agtime':
+        byorder = sorted([r for r in raceresults if r.agtime is not None],key=lambda r: r.agtime)
         for gender in ['F','M']:
-            dbresults = session.query(racedb.RaceResult).filter_by(raceid=race.id,seriesid=series.id,gender=gender).order_by(racedb.RaceResult.agtime).all()
+            setplaces([r for r in byorder if r.gender == gender],'agtime','agtimeplace',agtimeprecision,series.averagetie)
 
-            numresults = len(dbresults)
-            for rrndx in range(numresults):
-                raceresult = dbresults[rrndx]
-            
-                # set place if it has not been set before
-                # place may have been determined at previous iteration, if a tie was detected
-                if not raceresult.agtimeplace:
-                    thisplace = rrndx+1
-                    tieindeces = [rrndx]
-                    
-                    # detect tie in subsequent results based on rendering,
-                    # which rounds to a specific precision based on distance
-                    time = render.rendertime(raceresult.agtime,agtimeprecision)
-                    for tiendx in range(rrndx+1,numresults):
-                        if render.rendertime(dbresults[tiendx].agtime,agtimeprecision) != time:
-                            break
-                        tieindeces.append(tiendx)
-                    lasttie = tieindeces[-1] + 1
-                    for tiendx in tieindeces:
-                        numsametime = len(tieindeces)
-                        if numsametime > 1 and series.averagetie:
-                            dbresults[tiendx].agtimeplace = (thisplace+lasttie) / 2.0
-                            #if dbresults[tiendx].agtimeplace == (thisplace+lasttie) / 2:
-                            #    dbresults[tiendx].agtimeplace = int(dbresults[tiendx].agtimeplace)
-                        else:
-                            dbresults[tiendx].agtimeplace = thisplace
+    # make results persistent
+    if incremental:
+        numadded,numupdated,numdeleted = updateresults(session,race,series,raceresults)
+        print('   {0} added, {1} updated, {2} deleted'.format(numadded,numupdated,numdeleted))
+    else:
+        racedb.bulk_insert(session,racedb.RaceResult,raceresults)
 
-    # return number of entries processed
-    return numentries
+    # return number of results tabulated
+    return len(raceresults)
+
+#----------------------------------------------------------------------
+def updateresults(session,race,series,raceresults): 
+#----------------------------------------------------------------------
+    '''
+    update the results stored for this race / series to match raceresults, by comparing against the
+    stored results, and only inserting, updating or deleting the results which have changed
+    
+    places are recomputed in memory by tabulate(), so the results in groupings which were not
+    affected by the changes compare equal and are not written
+    
+    :param session: database session
+    :param race: racedb.Race object
+    :param series: racedb.Series object
+    :param raceresults: list of racedb.RaceResult objects, not yet in the session, with places set
+    :rtype: (number added, number updated, number deleted)
+    '''
+    
+    # stored results, by runner -- the same runner may have more than one result, e.g., nonmembers with the same name
+    stored = collections.defaultdict(list)
+    for dbresult in session.query(racedb.RaceResult).filter_by(raceid=race.id,seriesid=series.id).order_by(racedb.RaceResult.id):
+        stored[dbresult.runnerid,dbresult.runnername].append(dbresult)
+    
+    # update the results which changed, and collect the ones which are new
+    newresults = []
+    numupdated = 0
+    for raceresult in raceresults:
+        dbresults = stored[raceresult.runnerid,raceresult.runnername]
+        if not dbresults:
+            newresults.append(raceresult)
+        elif racedb.update(session,racedb.RaceResult,dbresults.pop(0),raceresult,skipcolumns=['id']):
+            numupdated += 1
+    
+    # whatever is left over is no longer in the results
+    numdeleted = 0
+    for dbresults in list(stored.values()):
+        for dbresult in dbresults:
+            session.delete(dbresult)
+            numdeleted += 1
+    
+    racedb.bulk_insert(session,racedb.RaceResult,newresults)
+    
+    return len(newresults),numupdated,numdeleted
 
 #----------------------------------------------------------------------
 def main(): 
@@ -406,6 +540,7 @@ def main():
     parser.add_argument('-n','--nonmemberfile',help='file with list of racers known to be nonmembers, same format as "close-<resultsfile>.csv"',default=None)
     parser.add_argument('-F','--force',help='force action without user prompt',action='store_true')
     parser.add_argument('-d','--delete',help='delete results for this race',action='store_true')
+    parser.add_argument('-i','--incremental',help='only add, update or delete results which have changed since previous import of this race',action='store_true')
     parser.add_argument('-c','--cutoff',help='cutoff for close match lookup (default %(default)0.2f)',type=float,default=0.7)
     parser.add_argument('-r','--racedb',help='filename of race database (default is as configured during rcuserconfig)',default=None)
     parser.add_argument('--debug',help='if set, create updateraces.txt for debugging',action='store_true')
@@ -435,12 +570,16 @@ def main():
         racedbfile = args.racedb
     else:
         racedbfile = racedb.getdbfilename()
-    active = clubmember.DbClubMember(racedbfile,cutoff=args.cutoff,member=True,active=True)
-    inactive = clubmember.DbClubMember(racedbfile,cutoff=args.cutoff,member=True,active=False)
     
     # insist on high cutoff for nonmember matching
     NONMEMBERCUTOFF = 0.9
-    nonmember = clubmember.DbClubMember(racedbfile,cutoff=NONMEMBERCUTOFF,member=False)
+    members = clubmember.DbClubMemberPartitions(racedbfile,
+                                                active=(args.cutoff,{'member':True,'active':True}),
+                                                inactive=(args.cutoff,{'member':True,'active':False}),
+                                                nonmember=(NONMEMBERCUTOFF,{'member':False}))
+    active = members.getpartition('active')
+    inactive = members.getpartition('inactive')
+    nonmember = members.getpartition('nonmember')
     
     # open race database
     racedb.setracedb(racedbfile)
@@ -460,6 +599,8 @@ def main():
             exists = '(previously entered race results will be deleted)'
         else:
             exists = '(NOTE: race results already entered, and will be overwritten)'
+            if args.incremental:
+                exists = '(NOTE: race results already entered, and changed results will be updated)'
     elif args.delete:
         print('*** no race results found for {0} {1}'.format(race.year,race.name))
         return
@@ -474,11 +615,15 @@ def main():
             print('*** race update aborted -- no changes made')
             return
     
-    # first delete all results for this race
-    numdeleted = session.query(racedb.RaceResult).filter_by(raceid=raceid).delete()
-    if numdeleted:
-        print('deleted {0} entries previously recorded'.format(numdeleted))
-        
+    # first delete all results for this race, unless only changes are to be made
+    if not args.incremental or args.delete:
+        numdeleted = session.query(racedb.RaceResult).filter_by(raceid=raceid).delete()
+        if numdeleted:
+            print('deleted {0} entries previously recorded'.format(numdeleted))
+
+    # standings points cached by renderstandings for this race are no longer valid
+    session.query(racedb.SeriesPoints).filter_by(raceid=raceid).delete()
+
     # only actually update results if --delete option not selected
     if not args.delete:
         
@@ -505,6 +650,15 @@ def main():
         for seriesid in seriesids:
             theseseries.append(session.query(racedb.Series).filter_by(id=seriesid,active=True).first())
         
+        # for incremental update, results for series no longer associated with this race are deleted
+        if args.incremental:
+            query = session.query(racedb.RaceResult).filter_by(raceid=raceid)
+            if theseseries:
+                query = query.filter(~racedb.RaceResult.seriesid.in_([s.id for s in theseseries]))
+            numdeleted = query.delete(synchronize_session=False)
+            if numdeleted:
+                print('deleted {0} entries previously recorded for other series'.format(numdeleted))
+        
         # set up logging files
         logdir = os.path.dirname(resultsfile)
         resultfilebase = os.path.basename(resultsfile)
@@ -525,27 +679,32 @@ def main():
         NONMEMCSV = csv.DictWriter(NONMEM,['results name','results age','new','runner id'])
         NONMEMCSV.writeheader()
         
+        # parse the results file and match the results against the database just once for the race
+        # missed and close logs are collected here
+        print('resolving results from {0}'.format(resultfilebase))
+        numentries,resolved = resolveresults(session,race,resultsfile,excluded,nonmemforced,active,inactive,nonmember,MISSEDCSV,CLOSECSV)
+        print('   {0} entries processed'.format(numentries))
+        MISSED.close()
+        CLOSE.close()
+        
         # for each series - 'series' describes how to tabulate the results
         for series in theseseries:
             # tabulate each race for which there are results, if it hasn't been tabulated before
             print('tabulating {0}'.format(series.name))
-            numentries = tabulate(session,race,resultsfile,excluded,nonmemforced,series,active,inactive,nonmember,INACTCSV,MISSEDCSV,CLOSECSV,NONMEMCSV)
-            print('   {0} entries processed'.format(numentries))
+            numresults = tabulate(session,race,resolved,series,INACTCSV,NONMEMCSV,incremental=args.incremental)
+            print('   {0} results tabulated'.format(numresults))
             
             # only collect log entries for the first series
             if INACTCSV:
                 INACT.close()
                 INACTCSV = None
-            if MISSEDCSV:
-                MISSED.close()
-                MISSEDCSV = None
-            if CLOSECSV:
-                CLOSE.close()
-                CLOSECSV = None
             if NONMEMCSV:
                 NONMEM.close()
                 NONMEMCSV = None
     
+    # results for this race have changed, so the next incremental export picks up the whole race
+    racedb.newresultsversion(session,race)
+    
     # and we're through
     session.commit()
     session.close()
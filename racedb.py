@@ -51,15 +51,16 @@ from Crypto.PublicKey import RSA
 import sqlalchemy   # see http://www.sqlalchemy.org/ written with 0.8.0b2
 from sqlalchemy.ext.declarative import declarative_base
 Base = declarative_base()   # create sqlalchemy Base class
-from sqlalchemy import Column, Integer, Float, Boolean, String, Sequence, UniqueConstraint, ForeignKey
+from sqlalchemy import Column, Integer, Float, Boolean, String, Text, Sequence, UniqueConstraint, ForeignKey, Index
 from sqlalchemy.orm import sessionmaker, object_mapper, relationship, backref
 Session = sessionmaker()    # create sqalchemy Session class
 
 # home grown
-from .config import CF,SECCF,OPTUSERPWAPI,OPTCLUBABBREV,OPTDBTYPE,OPTDBSERVER,OPTDBNAME,OPTDBGLOBUSER,OPTUNAME,KF,SECKEY,OPTPRIVKEY
+from .config import CF,SECCF,OPTUSERPWAPI,OPTCLUBABBREV,OPTDBTYPE,OPTDBSERVER,OPTDBNAME,OPTDBGLOBUSER,OPTDBSCHEMA,OPTUNAME,KF,SECKEY,OPTPRIVKEY
 from . import userpw
 from . import version
 from loutilities import timeu
+from loutilities import extconfigparser
 
 DBDATEFMT = '%Y-%m-%d'
 t = timeu.asctime(DBDATEFMT)
@@ -67,22 +68,64 @@ t = timeu.asctime(DBDATEFMT)
 # will be handle for persistent storage in webapp
 PERSIST = None
 
+# engines created by setracedb, by database url
+ENGINES = {}
+
+# url of the configured database, from getdbfilename() the first time it is needed
+CONFIGUREDURL = None
+
+# connection pool configuration, not used for sqlite
+POOLSIZE = 5
+POOLOVERFLOW = 10
+POOLRECYCLE = 3600  # seconds, mysql closes connections which have been idle too long
+
 class dbConsistencyError(Exception): pass
 
 #----------------------------------------------------------------------
-def setracedb(dbfilename=None):
+def setracedb(dbfilename=None,createschema=None):
 #----------------------------------------------------------------------
     '''
     initialize race database
     
+    the engine for a database is created only the first time the database is set within this
+    process, whether it is given by url or from the configuration.  later calls reuse the engine
+    and its connection pool
+    
     :params dbfilename: filename for race database, if None get from configuration
+    :params createschema: True to create missing tables, False to skip (e.g., schema maintained by alembic), None to get from configuration
     '''
+    # the configured database url may require a password lookup, so it is only resolved once
+    global CONFIGUREDURL
+    dburl = dbfilename
+    if dburl is None:
+        if CONFIGUREDURL is None:
+            CONFIGUREDURL = getdbfilename()
+        dburl = CONFIGUREDURL
+    
+    # reuse engine if this database has been seen already
+    # the schema is checked for a new engine, or later if explicitly requested
+    if dburl in ENGINES:
+        engine = ENGINES[dburl]
+        if createschema:
+            Base.metadata.create_all(engine)
+        Session.configure(bind=engine)
+        return
+    
     # set up connection to db
-    if dbfilename is None:
-        dbfilename = getdbfilename()
-
-    engine = sqlalchemy.create_engine('{0}'.format(dbfilename))
-    Base.metadata.create_all(engine)
+    # sqlite doesn't pool connections to a file
+    if dburl[0:6] == 'sqlite':
+        engine = sqlalchemy.create_engine('{0}'.format(dburl))
+    else:
+        engine = sqlalchemy.create_engine('{0}'.format(dburl),pool_size=POOLSIZE,max_overflow=POOLOVERFLOW,pool_recycle=POOLRECYCLE)
+    
+    # configurations from before dbschema was an option create the schema
+    if createschema is None:
+        dbschema = getoption(OPTDBSCHEMA) or 'create'
+        createschema = dbschema != 'alembic'
+    if createschema:
+        Base.metadata.create_all(engine)
+    
+    ENGINES[dburl] = engine
     Session.configure(bind=engine)
 
 #----------------------------------------------------------------------
@@ -240,6 +283,82 @@ def insert_or_update(session, model, newinstance, skipcolumns=[], **kwargs):
         
     return updated
 
+#----------------------------------------------------------------------
+def bulk_insert(session, model, instances, batchsize=1000):
+#----------------------------------------------------------------------
+    '''
+    insert new rows using batched executemany style statements, within the session's transaction
+    
+    the instances are not added to the session, so their ids are not set.  Pending changes are flushed
+    before the insert, and the session is expired afterwards so that objects already in the identity map
+    (e.g., relationships to the new rows) are reloaded from the database when next accessed
+    
+    :param session: session within which insert occurs
+    :param model: table model
+    :param instances: list of new instances of table model
+    :param batchsize: maximum number of rows per statement
+    :rtype: number of rows inserted
+    '''
+    
+    # convert instances to column values, leaving out primary key so the database sets it
+    rows = []
+    for instance in instances:
+        row = {}
+        for col in object_mapper(instance).columns:
+            if col.primary_key and getattr(instance,col.key) is None: continue
+            row[col.key] = getattr(instance,col.key)
+        rows.append(row)
+    
+    if not rows:
+        return 0
+    
+    session.flush()
+    for batchstart in range(0,len(rows),batchsize):
+        session.execute(model.__table__.insert(),rows[batchstart:batchstart+batchsize])
+    session.expire_all()
+    
+    return len(rows)
+
+#----------------------------------------------------------------------
+def newresultsversion(session, race):
+#----------------------------------------------------------------------
+    '''
+    mark the results for a race as changed, by setting the race's results version greater
+    than that of any other race
+    
+    unlike RaceResult.id, results versions are never reused, so they can be used to find the races
+    whose results have been imported, updated or deleted since some earlier time
+    
+    :param session: session within which update occurs
+    :param race: Race instance
+    :rtype: new results version
+    '''
+    lastversion = session.query(sqlalchemy.func.max(Race.resultsversion)).scalar() or 0
+    race.resultsversion = lastversion + 1
+    return race.resultsversion
+
+#----------------------------------------------------------------------
+def newresultsversions(session, raceids):
+#----------------------------------------------------------------------
+    '''
+    mark the results for several races as changed, e.g., because runners who ran them have
+    changed.  All the races get the same results version, greater than that of any other race
+    
+    :param session: session within which update occurs
+    :param raceids: list of Race.id
+    :rtype: new results version, or None if raceids is empty
+    '''
+    if not raceids:
+        return None
+    
+    session.flush()
+    resultsversion = (session.query(sqlalchemy.func.max(Race.resultsversion)).scalar() or 0) + 1
+    BATCHSIZE = 500
+    for batchstart in range(0,len(raceids),BATCHSIZE):
+        batch = raceids[batchstart:batchstart+BATCHSIZE]
+        session.query(Race).filter(Race.id.in_(batch)).update({Race.resultsversion:resultsversion},synchronize_session=False)
+    return resultsversion
+
 ########################################################################
 class Runner(Base):
 ########################################################################
@@ -260,7 +379,9 @@ class Runner(Base):
     member = Column(Boolean)
     active = Column(Boolean)
 
-    __table_args__ = (UniqueConstraint('name', 'dateofbirth'),)
+    __table_args__ = (UniqueConstraint('name', 'dateofbirth'),
+                      Index('ix_runner_name_dateofbirth_member_active', 'name', 'dateofbirth', 'member', 'active'),
+                      )
     results = relationship("RaceResult", backref='runner', cascade="all, delete, delete-orphan")
 
     #----------------------------------------------------------------------
@@ -308,6 +429,8 @@ class Race(Base):
         * date (yyyy-mm-dd)
         * starttime - for aggregation with other inputs (e.g., athlinks, runningahead)
         * distance (miles)
+        * resultsversion - set each time the race's exported results change, greater than any other race's.  Set by importresults,
+          by importraces when the race changes, and by importmembers when runners who ran the race change
     
     :param name: race name
     :param year: year of race
@@ -325,9 +448,11 @@ class Race(Base):
     starttime = Column(String(5))
     distance = Column(Float)
     active = Column(Boolean)
+    resultsversion = Column(Integer)
     __table_args__ = (UniqueConstraint('name', 'year'),)
     results = relationship("RaceResult", backref='race', cascade="all, delete, delete-orphan")
     series = relationship("RaceSeries", backref='race', cascade="all, delete, delete-orphan")
+    points = relationship("SeriesPoints", backref='race', cascade="all, delete, delete-orphan")
 
     #----------------------------------------------------------------------
     def __init__(self, name, year, racenum, date, starttime, distance):
@@ -385,6 +510,7 @@ class Series(Base):
     divisions = relationship("Divisions", backref='series', cascade="all, delete, delete-orphan")
     races = relationship("RaceSeries", backref='series', cascade="all, delete, delete-orphan")
     results = relationship("RaceResult", backref='series', cascade="all, delete, delete-orphan")
+    points = relationship("SeriesPoints", backref='series', cascade="all, delete, delete-orphan")
 
     #----------------------------------------------------------------------
     def __init__(self, name, membersonly, overall, divisions, agegrade, orderby, hightolow, averagetie, maxraces, multiplier, maxgenpoints, maxdivpoints, maxbynumrunners):
@@ -467,7 +593,14 @@ class RaceResult(Base):
     genderplace = Column(Float)
     divisionplace = Column(Float)
     agtimeplace = Column(Float)
-    __table_args__ = (UniqueConstraint('runnerid', 'runnername', 'raceid', 'seriesid'),)
+    # indexes support the queries made by importresults, renderrace and renderstandings, which filter by
+    # race, series, and gender or division, and order by time, agtime or agpercent
+    __table_args__ = (UniqueConstraint('runnerid', 'runnername', 'raceid', 'seriesid'),
+                      Index('ix_raceresult_race_series_gender_time', 'raceid', 'seriesid', 'gender', 'time'),
+                      Index('ix_raceresult_race_series_gender_agtime', 'raceid', 'seriesid', 'gender', 'agtime'),
+                      Index('ix_raceresult_race_series_gender_agpercent', 'raceid', 'seriesid', 'gender', 'agpercent'),
+                      Index('ix_raceresult_race_series_gender_division_time', 'raceid', 'seriesid', 'gender', 'divisionlow', 'divisionhigh', 'time'),
+                      )
 
     #----------------------------------------------------------------------
     def __init__(self, runnerid, raceid, seriesid, time, gender, agage, divisionlow=None, divisionhigh=None, overallplace=None, genderplace=None, runnername=None, divisionplace=None, agtimeplace=None, agfactor=None, agtime=None, agpercent=None):
@@ -514,7 +647,9 @@ class RaceSeries(Base):
     raceid = Column(Integer, ForeignKey('race.id'))
     seriesid = Column(Integer, ForeignKey('series.id'))
     active = Column(Boolean)
-    __table_args__ = (UniqueConstraint('raceid', 'seriesid'),)
+    __table_args__ = (UniqueConstraint('raceid', 'seriesid'),
+                      Index('ix_raceseries_seriesid', 'seriesid'),
+                      )
 
     #----------------------------------------------------------------------
     def __init__(self, raceid, seriesid):
@@ -563,6 +698,49 @@ class Divisions(Base):
     #----------------------------------------------------------------------
         return "<Divisions '%s','%s','%s',active='%s')>" % (self.seriesid, self.divisionlow, self.divisionhigh, self.active)
     
+########################################################################
+class SeriesPoints(Base):
+########################################################################
+    '''
+    * seriespoints - standings points for a race within a series, cached by renderstandings
+        * seriesid
+        * raceid
+        * gender
+        * signature - series parameters the points were determined with
+        * points - json list of [runnerid,divisionlow,divisionhigh,genpoints,divpoints], in standings order
+    
+    importresults deletes the points for a race when its results are imported
+    
+    :param seriesid: series.id
+    :param raceid: race.id
+    :param gender: M or F
+    :param signature: series parameters the points were determined with
+    :param points: json list of [runnerid,divisionlow,divisionhigh,genpoints,divpoints], in standings order
+    '''
+    __tablename__ = 'seriespoints'
+    id = Column(Integer, Sequence('seriespoints_id_seq'), primary_key=True)
+    seriesid = Column(Integer, ForeignKey('series.id'))
+    raceid = Column(Integer, ForeignKey('race.id'))
+    gender = Column(String(1))
+    signature = Column(String(100))
+    points = Column(Text)
+    __table_args__ = (UniqueConstraint('seriesid', 'raceid', 'gender'),)
+
+    #----------------------------------------------------------------------
+    def __init__(self, seriesid, raceid, gender, signature, points):
+    #----------------------------------------------------------------------
+        
+        self.seriesid = seriesid
+        self.raceid = raceid
+        self.gender = gender
+        self.signature = signature
+        self.points = points
+
+    #----------------------------------------------------------------------
+    def __repr__(self):
+    #----------------------------------------------------------------------
+        return "<SeriesPoints(series='%s',race='%s',gender='%s',signature='%s')>" % (self.seriesid, self.raceid, self.gender, self.signature)
+    
 #----------------------------------------------------------------------
 def main(): 
 #----------------------------------------------------------------------
@@ -606,7 +784,7 @@ def main():
         
         for race in races.getraces():
             newrace = Race(race['race'],race['year'],race['date'],race['time'],race['distance'])
-            added = insert_or_update(session,Race,newrace,skipcolumns=['id'],name=newrace.name,year=newrace.year)
+            added = insert_or_update(session,Race,newrace,skipcolumns=['id','resultsversion'],name=newrace.name,year=newrace.year)
             if added:
                 OUT.write('added or updated race {0}\n'.format(race))
             else:
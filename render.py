@@ -31,6 +31,8 @@ render - common functions for rendering
 import pdb
 import argparse
 import math
+import hashlib
+import html
 
 # pypi
 
@@ -48,6 +50,27 @@ DBDATEFMT = racedb.DBDATEFMT
 dbtime = timeu.asctime(DBDATEFMT)
 rndrtim = timeu.asctime('%m/%d/%Y')
 
+# page for html rendering, class names are the style names used by the renderers
+HTMLPAGE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+td {{font-size: 10pt}}
+.hdr, .divhdr, .racehdr, .bold {{font-weight: bold}}
+.place, .age, .time, .agfactor, .agpercent, .agtime, .race, .race-dropped, .racehdr, .total {{text-align: center}}
+.race-dropped {{color: red}}
+.name-won-agegroup {{color: green}}
+.name-noteligable {{color: blue}}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+{body}</body>
+</html>
+'''
+
 
 #----------------------------------------------------------------------
 def getprecision(distance): 
@@ -125,6 +148,30 @@ def adjusttime(rawtime,precision,useceiling=True,usefloor=False):
     
     return adjtime
 
+#----------------------------------------------------------------------
+def renderwholetime(wholetime): 
+#----------------------------------------------------------------------
+    '''
+    create display for whole number of seconds, e.g., 5, 1:05, 1:01:05
+    
+    leading zeros are removed, and 0 is rendered as ''
+    
+    :param wholetime: time in seconds (int)
+    '''
+    if wholetime < 60:
+        return str(wholetime) if wholetime else ''
+    if wholetime < 60*60:
+        return '{0}:{1:02d}'.format(wholetime//60,wholetime%60)
+    if wholetime < 60*60*60:
+        return '{0}:{1:02d}:{2:02d}'.format(wholetime//3600,wholetime//60%60,wholetime%60)
+    
+    # 60 hours or more keeps going in base 60
+    units = []
+    while wholetime > 0:
+        units.insert(0,'{0:02d}'.format(wholetime%60))
+        wholetime //= 60
+    return ':'.join(units).lstrip('0')
+
 #----------------------------------------------------------------------
 def rendertime(dbtime,precision,useceiling=True,usefloor=False): 
 #----------------------------------------------------------------------
@@ -137,6 +184,97 @@ def rendertime(dbtime,precision,useceiling=True,usefloor=False):
     :param useceiling: True if floor function is to be used (round down)
     '''
     
+    if precision > 0:
+        # adjust time based on precision
+        # note usefloor is not used here, so time is rounded if useceiling is False
+        adjtime = adjusttime(dbtime,precision,useceiling)
+        
+        # fractional part is rendered with leading 0, which is removed
+        wholetime = int(adjtime)
+        rettime = '{{0:0.{0}f}}'.format(precision).format(adjtime - wholetime)
+        if rettime[0] != '0':
+            raise softwareError('formatted adjusted time fraction does not have leading 0: {0}'.format(adjtime))
+        
+        return renderwholetime(wholetime) + rettime[1:]
+        
+    # note round up per USATF rule 165
+    if useceiling:
+        wholetime = int(math.ceil(dbtime))
+    elif usefloor:
+        wholetime = int(math.floor(dbtime))
+    else:
+        wholetime = int(round(dbtime))
+    
+    return renderwholetime(wholetime) or '0'
+
+#----------------------------------------------------------------------
+def rendertimes(dbtimes,precision,useceiling=True,usefloor=False): 
+#----------------------------------------------------------------------
+    '''
+    create times for display, for a whole column of times
+    
+    same as [rendertime(dbtime,precision,useceiling,usefloor) for dbtime in dbtimes], but each
+    distinct displayed time is only rendered once.  Uses numpy if available
+    
+    :param dbtimes: list of times in seconds
+    :param precision: number of places after decimal point
+    :param useceiling: True if ceiling function to be used (round up) - takes precedence if both useceiling and usefloor are True
+    :param useceiling: True if floor function is to be used (round down)
+    :rtype: list of rendered times
+    '''
+    
+    # numpy is optional -- times are rendered with a cache of distinct times if it isn't installed
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    
+    if np is None:
+        rendered = {}
+        rettimes = []
+        for dbtime in dbtimes:
+            if dbtime not in rendered:
+                rendered[dbtime] = rendertime(dbtime,precision,useceiling,usefloor)
+            rettimes.append(rendered[dbtime])
+        return rettimes
+    
+    # same rounding as rendertime, for all times at once, in units of the precision
+    # note usefloor is not used for fractional times, same as rendertime
+    multiplier = 10**precision
+    fixedtimes = np.asarray(dbtimes,dtype=float) * multiplier
+    if useceiling:
+        fixedtimes = np.ceil(fixedtimes)
+    elif usefloor and precision == 0:
+        fixedtimes = np.floor(fixedtimes)
+    else:
+        fixedtimes = np.round(fixedtimes)
+    
+    # render distinct times, then spread them back out
+    distinct,inverse = np.unique(fixedtimes.astype(np.int64),return_inverse=True)
+    rendered = []
+    for fixedtime in distinct.tolist():
+        if precision > 0:
+            wholetime,fractime = divmod(fixedtime,multiplier)
+            rendered.append('{0}.{1:0{2}d}'.format(renderwholetime(wholetime),fractime,precision))
+        else:
+            rendered.append(renderwholetime(fixedtime) or '0')
+    rendered = np.array(rendered,dtype=object)
+    return rendered[inverse.ravel()].tolist()
+
+#----------------------------------------------------------------------
+def looprendertime(dbtime,precision,useceiling=True,usefloor=False): 
+#----------------------------------------------------------------------
+    '''
+    original rendertime implementation, kept for benchmark comparison
+    
+    the original remdbtime /= 60 relied on python 2 integer division, so it is remdbtime //= 60 here
+    
+    :param dbtime: time in seconds
+    :param precision: number of places after decimal point
+    :param useceiling: True if ceiling function to be used (round up) - takes precedence if both useceiling and usefloor are True
+    :param useceiling: True if floor function is to be used (round down)
+    '''
+    
     if precision > 0:
         ''' old code
         multiplier = 10**precision
@@ -186,7 +324,7 @@ def rendertime(dbtime,precision,useceiling=True,usefloor=False):
             rettime = ':' + rettime
         firstthru = False
         rettime = '{0:02d}'.format(thisunit) + rettime
-        remdbtime /= 60
+        remdbtime //= 60
         thisunit = remdbtime%60
         
     while rettime[0] == '0':
@@ -194,6 +332,92 @@ def rendertime(dbtime,precision,useceiling=True,usefloor=False):
         
     return rettime
 
+#----------------------------------------------------------------------
+def benchmark(numtimes,precision=0): 
+#----------------------------------------------------------------------
+    '''
+    compare time rendering implementations, with random race times
+    
+    :param numtimes: number of times to render
+    :param precision: number of places after decimal point
+    :rtype: {'loop':seconds,'rendertime':seconds,'rendertimes':seconds}, where loop is the original implementation
+    '''
+    import random
+    import timeit
+    
+    # 5K to marathon times, to 1/100 second
+    dbtimes = [round(random.uniform(14*60,6*60*60),2) for i in range(numtimes)]
+    
+    expected = [looprendertime(t,precision) for t in dbtimes]
+    if [rendertime(t,precision) for t in dbtimes] != expected:
+        raise softwareError('rendertime does not match original implementation')
+    if rendertimes(dbtimes,precision) != expected:
+        raise softwareError('rendertimes does not match original implementation')
+    
+    results = {}
+    results['loop'] = min(timeit.repeat(lambda: [looprendertime(t,precision) for t in dbtimes],number=1,repeat=3))
+    results['rendertime'] = min(timeit.repeat(lambda: [rendertime(t,precision) for t in dbtimes],number=1,repeat=3))
+    results['rendertimes'] = min(timeit.repeat(lambda: rendertimes(dbtimes,precision),number=1,repeat=3))
+    return results
+
+#----------------------------------------------------------------------
+def htmlcell(value,stylename=None): 
+#----------------------------------------------------------------------
+    '''
+    create table cell for html display
+    
+    :param value: value for cell
+    :param stylename: name of style for cell, rendered as class
+    :rtype: html for cell
+    '''
+    if stylename:
+        return '<td class="{0}">{1}</td>'.format(stylename,html.escape(str(value)))
+    return '<td>{0}</td>'.format(html.escape(str(value)))
+
+#----------------------------------------------------------------------
+def htmlpage(title,body): 
+#----------------------------------------------------------------------
+    '''
+    create html page
+    
+    :param title: title for page
+    :param body: html for body of page, after title
+    :rtype: html for page
+    '''
+    return HTMLPAGE.format(title=html.escape(title),body=body)
+
+#----------------------------------------------------------------------
+def contenthash(content): 
+#----------------------------------------------------------------------
+    '''
+    hash rendered content, e.g., for use as an HTTP ETag
+    
+    :param content: rendered content (str)
+    :rtype: hex digest of sha256 of utf-8 encoded content
+    '''
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+#----------------------------------------------------------------------
+def saverendered(rendered,fname,content,tofile): 
+#----------------------------------------------------------------------
+    '''
+    save rendered content in memory with its hash, and optionally to a file
+    
+    :param rendered: {fname:(content,hash),...} which is updated for this content
+    :param fname: file name for content
+    :param content: rendered content (str)
+    :param tofile: True if content is also to be written to fname
+    :rtype: hash of content
+    '''
+    contentid = contenthash(content)
+    rendered[fname] = (content,contentid)
+    
+    if tofile:
+        with open(fname,'w',encoding='utf-8') as OUT:
+            OUT.write(content)
+    
+    return contentid
+
 #----------------------------------------------------------------------
 def main(): 
 #----------------------------------------------------------------------
@@ -205,9 +429,17 @@ def main():
     #parser.add_argument('-r','--racedb',help='filename of race database (default is as configured during rcuserconfig)',default=None)
     #parser.add_argument('-o','--orderby',help='name of RaceResult field to order results by (default %(default)s)',default='time')
     #parser.add_argument('-H','--hightolow',help='use if results are to be ordered high value to low value',action='store_true')
+    parser.add_argument('-b','--benchmark',help='benchmark time rendering with this many times, e.g., 100000',type=int,default=None)
+    parser.add_argument('-p','--precision',help='precision for benchmark (default %(default)s)',type=int,default=0)
     args = parser.parse_args()
     
     # this would be a good place to put unit tests
+    
+    if args.benchmark:
+        results = benchmark(args.benchmark,args.precision)
+        base = results['loop']
+        for impl in ['loop','rendertime','rendertimes']:
+            print('{0:12s} {1:8.3f} seconds, {2:5.1f}x'.format(impl,results[impl],base/results[impl]))
         
 # ##########################################################################################
 #	__main__
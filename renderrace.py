@@ -31,6 +31,11 @@ renderrace - render result information within database for specified race
 import pdb
 import argparse
 import copy
+import io
+import json
+import time
+import functools
+import multiprocessing
 
 # pypi
 import xlwt
@@ -38,8 +43,10 @@ import xlwt
 # github
 
 # other
+from sqlalchemy.orm import joinedload
 
 # home grown
+from .config import parameterError
 from . import version
 from . import racedb
 from . import render
@@ -178,6 +185,19 @@ class BaseRaceHandler():
 
         pass
     
+    #----------------------------------------------------------------------
+    def prerender(self,times,agtimes):
+    #----------------------------------------------------------------------
+        '''
+        called with all the times which will be rendered, before the first row is rendered,
+        so handlers which display times can render them all at once
+
+        :param times: list of times (seconds)
+        :param agtimes: list of age grade times (seconds)
+        '''
+
+        pass
+    
     #----------------------------------------------------------------------
     def render(self):
     #----------------------------------------------------------------------
@@ -187,6 +207,20 @@ class BaseRaceHandler():
 
         pass
 
+    #----------------------------------------------------------------------
+    def renderrow(self,row):
+    #----------------------------------------------------------------------
+        '''
+        output a whole result line to gender file
+        
+        by default this is done through the cell at a time methods, but may be replaced
+        by a faster implementation
+
+        :param row: (place,name,age,time,agfactor,agpercent,agtime)
+        '''
+
+        rendercells(self,row)
+
     #----------------------------------------------------------------------
     def skipline(self):
     #----------------------------------------------------------------------
@@ -228,7 +262,7 @@ class ListRaceHandler():
         :param fh: derivative of BaseRaceHandler
         '''
         
-        self.fhlist.append(fh)
+        self.fhlist.append(rowhandler(fh))
         
     #----------------------------------------------------------------------
     def prepare(self,year,racename,orderby,nonmembers):
@@ -356,6 +390,32 @@ class ListRaceHandler():
         for fh in self.fhlist:
             fh.render()
 
+    #----------------------------------------------------------------------
+    def prerender(self,times,agtimes):
+    #----------------------------------------------------------------------
+        '''
+        called with all the times which will be rendered, before the first row is rendered
+
+        :param times: list of times (seconds)
+        :param agtimes: list of age grade times (seconds)
+        '''
+
+        for fh in self.fhlist:
+            if hasattr(fh,'prerender'):
+                fh.prerender(times,agtimes)
+
+    #----------------------------------------------------------------------
+    def renderrow(self,row):
+    #----------------------------------------------------------------------
+        '''
+        output a whole result line to gender file
+
+        :param row: (place,name,age,time,agfactor,agpercent,agtime)
+        '''
+
+        for fh in self.fhlist:
+            fh.renderrow(row)
+
     #----------------------------------------------------------------------
     def skipline(self):
     #----------------------------------------------------------------------
@@ -376,6 +436,83 @@ class ListRaceHandler():
         for fh in self.fhlist:
             fh.close()
     
+########################################################################
+class RaceRowAdapter():
+########################################################################
+    '''
+    Adds renderrow() to a RaceHandler object-like which only has the cell at a
+    time methods.  All other methods are passed through to the handler.
+    
+    :param fh: RaceHandler object-like
+    '''
+    #----------------------------------------------------------------------
+    def __init__(self,fh):
+    #----------------------------------------------------------------------
+        self.fh = fh
+    
+    #----------------------------------------------------------------------
+    def __getattr__(self,attr):
+    #----------------------------------------------------------------------
+        return getattr(self.fh,attr)
+    
+    #----------------------------------------------------------------------
+    def renderrow(self,row):
+    #----------------------------------------------------------------------
+        '''
+        output a whole result line to gender file
+
+        :param row: (place,name,age,time,agfactor,agpercent,agtime)
+        '''
+
+        rendercells(self.fh,row)
+
+#----------------------------------------------------------------------
+def rendercells(fh,row):
+#----------------------------------------------------------------------
+    '''
+    render a result line through the cell at a time methods of a RaceHandler
+    
+    :param fh: RaceHandler object-like
+    :param row: (place,name,age,time,agfactor,agpercent,agtime)
+    '''
+    place,name,age,time,agfactor,agpercent,agtime = row
+    
+    fh.clearline()
+    fh.setplace(place)
+    fh.setname(name)
+    fh.setage(age)
+    fh.settime(time)
+    fh.setagfactor(agfactor)
+    fh.setagpercent(agpercent)
+    fh.setagtime(agtime)
+    fh.render()
+
+#----------------------------------------------------------------------
+def rowhandler(fh):
+#----------------------------------------------------------------------
+    '''
+    make sure RaceHandler supports renderrow()
+    
+    :param fh: RaceHandler object-like
+    :rtype: fh if it has renderrow(), else RaceRowAdapter for fh
+    '''
+    if hasattr(fh,'renderrow'):
+        return fh
+    return RaceRowAdapter(fh)
+
+#----------------------------------------------------------------------
+def rendertimes(times,precision):
+#----------------------------------------------------------------------
+    '''
+    render a column of times for display, all at once
+    
+    :param times: list of times (seconds), entries which aren't numbers are skipped
+    :param precision: number of places after decimal point
+    :rtype: {time:rendered time,...}
+    '''
+    times = [time for time in times if isinstance(time,(int,float))]
+    return dict(list(zip(times,render.rendertimes(times,precision))))
+
 ########################################################################
 class TxtRaceHandler(BaseRaceHandler):
 ########################################################################
@@ -397,6 +534,10 @@ class TxtRaceHandler(BaseRaceHandler):
         self.pline = {}
 
         self.timeprecision,self.agtimeprecision = render.getprecision(distance)
+        
+        # {time:rendered time,...} from prerender()
+        self.dtimes = {}
+        self.dagtimes = {}
     
     #----------------------------------------------------------------------
     def prepare(self,year,racename,orderby,nonmembers):
@@ -555,6 +696,42 @@ class TxtRaceHandler(BaseRaceHandler):
 
         self.TXT.write(self.linefmt.format(**self.pline))
     
+    #----------------------------------------------------------------------
+    def prerender(self,times,agtimes):
+    #----------------------------------------------------------------------
+        '''
+        render all the times at once, for renderrow()
+
+        :param times: list of times (seconds)
+        :param agtimes: list of age grade times (seconds)
+        '''
+
+        self.dtimes = rendertimes(times,self.timeprecision)
+        self.dagtimes = rendertimes(agtimes,self.agtimeprecision)
+    
+    #----------------------------------------------------------------------
+    def renderrow(self,row):
+    #----------------------------------------------------------------------
+        '''
+        output a whole result line to gender file
+
+        :param row: (place,name,age,time,agfactor,agpercent,agtime)
+        '''
+        place,name,age,time,agfactor,agpercent,agtime = row
+        
+        # same formatting as the set<field> methods
+        self.pline = {
+            'place': str(place),
+            'name': str(name),
+            'age': str(age),
+            'time': time if isinstance(time,str) else self.dtimes.get(time) or render.rendertime(time,self.timeprecision),
+            'agfactor': '{0:0.4f}'.format(agfactor) if isinstance(agfactor,float) else agfactor,
+            'agpercent': '{0:0.2f}'.format(agpercent) if isinstance(agpercent,float) else agpercent,
+            'agtime': agtime if isinstance(agtime,str) else self.dagtimes.get(agtime) or render.rendertime(agtime,self.agtimeprecision),
+            }
+        
+        self.TXT.write(self.linefmt.format(**self.pline))
+    
     #----------------------------------------------------------------------
     def skipline(self):
     #----------------------------------------------------------------------
@@ -609,7 +786,17 @@ class XlRaceHandler(BaseRaceHandler):
             'agfactor': xlwt.easyxf('align: horiz center; font: height 200',num_format_str='0.0000'),
             'agpercent': xlwt.easyxf('align: horiz center; font: height 200',num_format_str='0.00'),
             }
-    
+        self.initstyles(distance)
+        
+    #----------------------------------------------------------------------
+    def initstyles(self,distance):
+    #----------------------------------------------------------------------
+        '''
+        add time and bold heading styles to self.style, based on distance
+        
+        :param distance: race distance (miles)
+        '''
+        
         # set time styles based on distance
         timeprecision,agtimeprecision = render.getprecision(distance)
         self.timeprecision = timeprecision
@@ -628,12 +815,25 @@ class XlRaceHandler(BaseRaceHandler):
         # add bold font for headings
         for hdg in ['place','name','age','time','agfactor','agpercent']:
             bhdg = 'b{0}'.format(hdg)
-            self.style[bhdg] = copy.deepcopy(self.style[hdg])
-            self.style[bhdg].font.bold = True
+            self.style[bhdg] = self.boldstyle(self.style[hdg])
         
         # this is toggled by self.setbold and understood by the self.set<field> methods
         self.usebold = False
         
+    #----------------------------------------------------------------------
+    def boldstyle(self,style):
+    #----------------------------------------------------------------------
+        '''
+        return bold copy of a style
+        
+        :param style: style from self.style
+        :rtype: bold style
+        '''
+        
+        boldstyle = copy.deepcopy(style)
+        boldstyle.font.bold = True
+        return boldstyle
+        
     #----------------------------------------------------------------------
     def setbold(self,bold=True):
     #----------------------------------------------------------------------
@@ -669,8 +869,7 @@ class XlRaceHandler(BaseRaceHandler):
         rengen = 'Overall'
         if 'gender' in self.resultfilter:
             rengen = MF[self.resultfilter['gender']]
-        self.fname = '{0}-{1}-{2}-{3}.xls'.format(year,racename,rengen,orderby)
-        self.ws = self.wb.add_sheet('{0}-{1}'.format(rengen,orderby))
+        self.addsheet('{0}-{1}-{2}-{3}'.format(year,racename,rengen,orderby),'{0}-{1}'.format(rengen,orderby))
         
         # start rendering lines at row 0
         self.rownum = 0
@@ -697,10 +896,10 @@ class XlRaceHandler(BaseRaceHandler):
             self.colnum[k] = hdrfields.index(k)
 
         # set up col widths
-        self.ws.col(self.colnum['place']).width = 6*256
-        self.ws.col(self.colnum['name']).width = 19*256
-        self.ws.col(self.colnum['age']).width = 6*256
-        self.ws.col(self.colnum['agpercent']).width = 10*256
+        self.setcolwidth(self.colnum['place'],6)
+        self.setcolwidth(self.colnum['name'],19)
+        self.setcolwidth(self.colnum['age'],6)
+        self.setcolwidth(self.colnum['agpercent'],10)
 
         # bold header fields
         self.setbold(True)
@@ -718,6 +917,31 @@ class XlRaceHandler(BaseRaceHandler):
         # rest of rows are not bold
         self.setbold(False)
     
+    #----------------------------------------------------------------------
+    def addsheet(self,basename,sheetname):
+    #----------------------------------------------------------------------
+        '''
+        add the worksheet to the workbook
+        
+        :param basename: file name for the workbook, without extension
+        :param sheetname: name of the worksheet
+        '''
+        
+        self.fname = '{0}.xls'.format(basename)
+        self.ws = self.wb.add_sheet(sheetname)
+    
+    #----------------------------------------------------------------------
+    def setcolwidth(self,colnum,width):
+    #----------------------------------------------------------------------
+        '''
+        set column width for the worksheet
+        
+        :param colnum: column number
+        :param width: width in characters
+        '''
+        
+        self.ws.col(colnum).width = width*256
+    
     #----------------------------------------------------------------------
     def clearline(self):
     #----------------------------------------------------------------------
@@ -789,7 +1013,7 @@ class XlRaceHandler(BaseRaceHandler):
 
         # maybe override time style
         timestyle = self.style['time']
-        if time >= 60*60:
+        if isinstance(time,str) or time >= 60*60:
             timestyle = self.style['time0']
         
         style = timestyle
@@ -846,7 +1070,7 @@ class XlRaceHandler(BaseRaceHandler):
 
         # maybe override time style
         timestyle = self.style['agtime']
-        if agtime >= 60*60:
+        if isinstance(agtime,str) or agtime >= 60*60:
             timestyle = self.style['time0']
         
         style = timestyle
@@ -889,114 +1113,769 @@ class XlRaceHandler(BaseRaceHandler):
         self.rownum = 0
 
 ########################################################################
-class RaceRenderer():
+class XlsxRaceHandler(XlRaceHandler):
 ########################################################################
     '''
-    RaceRenderer collects results and provides rendering methods, for a single series
+    RaceHandler for .xlsx files
+    
+    rows are streamed to disk as they are rendered (xlsxwriter constant_memory mode),
+    so memory use does not grow with the size of the race.  Requires xlsxwriter.
     
     :param session: database session
-    :param racename: race.name
-    :param raceid: race.id
-    :param orderby: name of field in RaceResult with which results should be ordered (e.g., 'time')
-    :param hightolow: True if ordering is high value to low value
-    :param \*\*resultfilter: filter parameters for racedb.RaceResult table
+    :param distance: race distance (miles)
+    :param \*\*resultfilter: keyword filter for RaceResult table
     '''
     #----------------------------------------------------------------------
-    def __init__(self,session,racename,raceid,orderby,hightolow,nonmembers,**resultfilter):
+    def __init__(self,session,distance,**resultfilter):
     #----------------------------------------------------------------------
+
         self.session = session
-        self.racename = racename
-        self.raceid = raceid
-        self.orderby = orderby
-        self.hightolow = hightolow
-        self.nonmembers = nonmembers
         self.resultfilter = resultfilter
         
+        # xlsxwriter is only required if .xlsx files are rendered
+        import xlsxwriter
+        self.xlsxwriter = xlsxwriter
+        
+        # workbook is created when the sheet is added, as the file name isn't known until then
+        self.wb = None
+        
+        # format properties, registered once with the workbook in self.addsheet
+        self.style = {
+            'majorhdr': {'bold':True,'font_size':12},
+            'hdr': {'bold':True,'font_size':10},
+            'note': {'font_size':10},
+            'bold': {'bold':True},
+            'ctrhdr': {'bold':True,'font_size':10},
+            'place': {'align':'center','font_size':10,'num_format':'General'},
+            'name': {'font_size':10},
+            'age': {'align':'center','font_size':10,'num_format':'General'},
+            'time0': {'align':'center','font_size':10,'num_format':'h:mm:ss;@'},
+            'stime0': {'align':'center','font_size':10,'num_format':'m:ss;@'},
+            'time1': {'align':'center','font_size':10,'num_format':'m:ss.0;@'},
+            'time2': {'align':'center','font_size':10,'num_format':'m:ss.00;@'},
+            'agfactor': {'align':'center','font_size':10,'num_format':'0.0000'},
+            'agpercent': {'align':'center','font_size':10,'num_format':'0.00'},
+            }
+        self.initstyles(distance)
+        self.styleprops = self.style
+        
     #----------------------------------------------------------------------
-    def renderrace(self,fh): 
+    def boldstyle(self,style):
     #----------------------------------------------------------------------
         '''
-        render results for a single race
+        return bold copy of a style
+        
+        :param style: format properties from self.style
+        :rtype: bold format properties
+        '''
         
-        fh object has methods with prototypes same as BaseRaceHandler()
+        return dict(style,bold=True)
         
-        :param fh: RaceHandler object-like
+    #----------------------------------------------------------------------
+    def addsheet(self,basename,sheetname):
+    #----------------------------------------------------------------------
         '''
-
-        # Get race information
-        race = self.session.query(racedb.Race).filter_by(id=self.raceid).order_by(racedb.Race.racenum).first()
-        year = race.year
+        create the workbook and add the worksheet to it
         
-        # open file, prepare header, etc
-        fh.prepare(year,self.racename,self.orderby,self.nonmembers)
-                
-        # use first series found for this race, and get the results associated with this race / series
-        #series = self.session.query(racedb.Series).join("results").first()
-        raceseries = self.session.query(racedb.RaceSeries).filter_by(raceid=self.raceid).first()
-        allresults = self.session.query(racedb.RaceResult).filter_by(raceid=self.raceid,seriesid=raceseries.seriesid,**self.resultfilter).all()
-            
-        # sort results based on self.orderby field and highlow directive
-        dresults = sorted([(getattr(r,self.orderby),r) for r in allresults])
-        if self.hightolow: dresults.reverse()
-        allresults = [dr[1] for dr in dresults]
+        :param basename: file name for the workbook, without extension
+        :param sheetname: name of the worksheet
+        '''
         
-        # render results
-        thisplace = 1
-        for result in allresults:
-            fh.clearline()
-            fh.setplace(thisplace)
-            thisplace += 1
-            fh.setname(result.runner.name)
-            fh.setage(result.agage)
-            fh.settime(result.time)
-            fh.setagfactor(result.agfactor)
-            fh.setagpercent(result.agpercent)
-            fh.setagtime(result.agtime)
-            fh.render()
-                        
-        # done with rendering
-        fh.close()
-            
-#----------------------------------------------------------------------
-def main(): 
-#----------------------------------------------------------------------
+        self.fname = '{0}.xlsx'.format(basename)
+        self.wb = self.xlsxwriter.Workbook(self.fname,{'constant_memory':True})
+        self.style = dict([(stylename,self.wb.add_format(props)) for stylename,props in list(self.styleprops.items())])
+        self.ws = self.wb.add_worksheet(sheetname)
+    
+    #----------------------------------------------------------------------
+    def setcolwidth(self,colnum,width):
+    #----------------------------------------------------------------------
+        '''
+        set column width for the worksheet
+        
+        :param colnum: column number
+        :param width: width in characters
+        '''
+        
+        self.ws.set_column(colnum,colnum,width)
+    
+    #----------------------------------------------------------------------
+    def close(self):
+    #----------------------------------------------------------------------
+        '''
+        close workbook, flushing remaining rows to the file
+        '''
+        
+        if self.wb is not None:
+            self.wb.close()
+    
+        self.wb = None
+        self.style = self.styleprops
+        self.rownum = 0
+
+########################################################################
+class JsonRaceHandler(BaseRaceHandler):
+########################################################################
     '''
-    render race information
+    RaceHandler for .json files
+    
+    results are rendered a row at a time into an in-memory document, which is kept in
+    self.rendered with its content hash when the handler is closed
+    
+    :param session: database session
+    :param distance: race distance (miles)
+    :param tofile: True if document is also to be written to a file
+    :param \*\*resultfilter: keyword filter for RaceResult table
     '''
-    parser = argparse.ArgumentParser(version='{0} {1}'.format('runningclub',version.__version__))
-    parser.add_argument('raceid',help='id of race (use listraces to determine raceid)',type=int)
-    parser.add_argument('-o','--orderby',help='name of RaceResult field to order results by (default %(default)s)',default='time')
-    parser.add_argument('-H','--hightolow',help='use if results are to be ordered high value to low value',action='store_true')
-    parser.add_argument('-n','--nonmembers',help='use to suppress note about members only being part of rendered race',action='store_true')
-    parser.add_argument('-r','--racedb',help='filename of race database (default is as configured during rcuserconfig)',default=None)
-    args = parser.parse_args()
+    #----------------------------------------------------------------------
+    def __init__(self,session,distance,tofile=True,**resultfilter):
+    #----------------------------------------------------------------------
+
+        self.session = session
+        self.resultfilter = resultfilter
+        self.tofile = tofile
+        
+        # {fname:(content,hash),...}
+        self.rendered = {}
+        
+        self.JSON = None
+        self.pline = {}
+
+        self.timeprecision,self.agtimeprecision = render.getprecision(distance)
     
-    raceid = args.raceid
-    orderby = args.orderby
-    hightolow = args.hightolow
-    nonmembers = args.nonmembers
+    #----------------------------------------------------------------------
+    def prepare(self,year,racename,orderby,nonmembers):
+    #----------------------------------------------------------------------
+        '''
+        prepare document for output, including race information
+        
+        :param year: year of race
+        :param racename: name of race
+        :param orderby: how results are ordered
+        :param nonmembers: True to suppress note about inclusion of members only
+        '''
+        
+        MF = {'F':'Women','M':'Men'}
+        rengen = 'Overall'
+        if 'gender' in self.resultfilter:
+            rengen = MF[self.resultfilter['gender']]
+        self.fname = '{0}-{1}-{2}-{3}.json'.format(year,racename,rengen,orderby)
+        self.JSON = io.StringIO()
+        
+        # rows are added by self.renderrow, and the document is finished by self.close
+        race = [('year',year),('race',racename),('results',rengen),('orderby',orderby),('membersonly',not nonmembers)]
+        self.JSON.write('{')
+        for k,v in race:
+            self.JSON.write('{0}: {1}, '.format(json.dumps(k),json.dumps(v)))
+        self.JSON.write('"rows": [')
+        self.numrows = 0
+        
+        self.clearline()
     
-    racedb.setracedb(args.racedb)
-    session = racedb.Session()
-    race = session.query(racedb.Race).filter_by(id=raceid).first()
-    if not race:
-        print('raceid {0} not found.  Use listraces to determine raceid'.format(raceid))
-        return
+    #----------------------------------------------------------------------
+    def clearline(self):
+    #----------------------------------------------------------------------
+        '''
+        prepare rendering line for output by clearing all entries
+        '''
+        
+        self.pline = dict([(k,None) for k in ['place','name','age','time','agfactor','agpercent','agtime']])
     
-    # get precision for time, agtime
+    #----------------------------------------------------------------------
+    def setplace(self,place):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'place' field for output
+
+        :param place: value for place field
+        '''
+        
+        self.pline['place'] = place
     
-    for gen in [None,'F','M']:
-        resultfilter = {}
-        if gen:
-            resultfilter['gender'] = gen
-            
-        fh = ListRaceHandler()
-        fh.addhandler(TxtRaceHandler(session,race.distance,**resultfilter))
-        fh.addhandler(XlRaceHandler(session,race.distance,**resultfilter))
+    #----------------------------------------------------------------------
+    def setname(self,name):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'name' field for output
+
+        :param name: value for name field
+        '''
+        
+        self.pline['name'] = name
+    
+    #----------------------------------------------------------------------
+    def setage(self,age):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'age' field for output
+
+        :param age: age on day of race
+        '''
+        
+        self.pline['age'] = age
+    
+    #----------------------------------------------------------------------
+    def settime(self,time):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'time' field for output
+
+        :param time: time (seconds)
+        '''
+        
+        self.pline['time'] = time
+    
+    #----------------------------------------------------------------------
+    def setagfactor(self,agfactor):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'agfactor' field for output
+
+        :param agfactor: age grade factor (between 0 and 1)
+        '''
+
+        self.pline['agfactor'] = agfactor
+    
+    #----------------------------------------------------------------------
+    def setagpercent(self,agpercent):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'agpercent' field for output
+
+        :param agpercent: age grade percentage (between 0 and 100)
+        '''
+        
+        self.pline['agpercent'] = agpercent
+    
+    #----------------------------------------------------------------------
+    def setagtime(self,agtime):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'agtime' field for output
+
+        :param agtime: age grade time (seconds)
+        '''
+        
+        self.pline['agtime'] = agtime
+    
+    #----------------------------------------------------------------------
+    def render(self):
+    #----------------------------------------------------------------------
+        '''
+        output current line to document
+        '''
+
+        pline = self.pline
+        self.renderrow((pline['place'],pline['name'],pline['age'],pline['time'],pline['agfactor'],pline['agpercent'],pline['agtime']))
+    
+    #----------------------------------------------------------------------
+    def renderrow(self,row):
+    #----------------------------------------------------------------------
+        '''
+        output a whole result line to document
+        
+        times are in seconds, adjusted to the precision used for the race
+
+        :param row: (place,name,age,time,agfactor,agpercent,agtime)
+        '''
+        place,name,age,time,agfactor,agpercent,agtime = row
+        
+        result = {
+            'place': place,
+            'name': name,
+            'age': age,
+            'time': render.adjusttime(time,self.timeprecision) if isinstance(time,(int,float)) else time,
+            'agfactor': agfactor,
+            'agpercent': agpercent,
+            'agtime': render.adjusttime(agtime,self.agtimeprecision) if isinstance(agtime,(int,float)) else agtime,
+            }
+        
+        if self.numrows:
+            self.JSON.write(', ')
+        self.JSON.write(json.dumps(result))
+        self.numrows += 1
+    
+    #----------------------------------------------------------------------
+    def skipline(self):
+    #----------------------------------------------------------------------
+        '''
+        blank lines are not rendered in json
+        '''
+
+        pass
+    
+    #----------------------------------------------------------------------
+    def close(self):
+    #----------------------------------------------------------------------
+        '''
+        save rendered document and its hash
+        '''
+        
+        self.JSON.write(']}')
+        render.saverendered(self.rendered,self.fname,self.JSON.getvalue(),self.tofile)
+        self.JSON = None
+    
+########################################################################
+class HtmlRaceHandler(BaseRaceHandler):
+########################################################################
+    '''
+    RaceHandler for .html files
+    
+    results are rendered a row at a time into an in-memory page, which is kept in
+    self.rendered with its content hash when the handler is closed
+    
+    :param session: database session
+    :param distance: race distance (miles)
+    :param tofile: True if page is also to be written to a file
+    :param \*\*resultfilter: keyword filter for RaceResult table
+    '''
+    #----------------------------------------------------------------------
+    def __init__(self,session,distance,tofile=True,**resultfilter):
+    #----------------------------------------------------------------------
+
+        self.session = session
+        self.resultfilter = resultfilter
+        self.tofile = tofile
+        
+        # {fname:(content,hash),...}
+        self.rendered = {}
+        
+        self.HTML = None
+        self.pline = {}
+
+        self.timeprecision,self.agtimeprecision = render.getprecision(distance)
+        
+        # {time:rendered time,...} from prerender()
+        self.dtimes = {}
+        self.dagtimes = {}
+    
+    #----------------------------------------------------------------------
+    def prepare(self,year,racename,orderby,nonmembers):
+    #----------------------------------------------------------------------
+        '''
+        prepare page for output, including as appropriate
+        
+        * print header information
+        * start table
+        
+        :param year: year of race
+        :param racename: name of race
+        :param orderby: how results are ordered
+        :param nonmembers: True to suppress note about inclusion of members only
+        '''
+        
+        MF = {'F':'Women','M':'Men'}
+        rengen = 'Overall'
+        if 'gender' in self.resultfilter:
+            rengen = MF[self.resultfilter['gender']]
+        self.fname = '{0}-{1}-{2}-{3}.html'.format(year,racename,rengen,orderby)
+        self.title = '{0} {1} - {2} results, ordered by {3}'.format(year,racename,rengen,orderby)
+        self.HTML = io.StringIO()
+        
+        # render race
+        if not nonmembers:
+            self.HTML.write('<p class="note">NOTE: these results only show the FSRC members who ran the race</p>\n')
+        self.HTML.write('<table>\n')
+        
+        # render header
+        self.HTML.write('<tr>{0}</tr>\n'.format(''.join([render.htmlcell(hdr,'bold') for hdr in ['place','name','age','time','factor','age grade','adj time']])))
+        self.clearline()
+    
+    #----------------------------------------------------------------------
+    def clearline(self):
+    #----------------------------------------------------------------------
+        '''
+        prepare rendering line for output by clearing all entries
+        '''
+        
+        self.pline = dict([(k,'') for k in ['place','name','age','time','agfactor','agpercent','agtime']])
+    
+    #----------------------------------------------------------------------
+    def setplace(self,place):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'place' column for output (this should be rendered in 1st column)
+
+        :param place: value for place column
+        '''
+        
+        self.pline['place'] = place
+    
+    #----------------------------------------------------------------------
+    def setname(self,name):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'name' column for output (this should be rendered in 2nd column)
+
+        :param name: value for name column
+        '''
+        
+        self.pline['name'] = name
+    
+    #----------------------------------------------------------------------
+    def setage(self,age):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'age' column for output
+
+        :param age: age on day of race
+        '''
+        
+        self.pline['age'] = age
+    
+    #----------------------------------------------------------------------
+    def settime(self,time):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'time' column for output
+
+        :param time: time (seconds)
+        '''
+        
+        self.pline['time'] = time
+    
+    #----------------------------------------------------------------------
+    def setagfactor(self,agfactor):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'agfactor' column for output
+
+        :param agfactor: age grade factor (between 0 and 1)
+        '''
+
+        self.pline['agfactor'] = agfactor
+    
+    #----------------------------------------------------------------------
+    def setagpercent(self,agpercent):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'agpercent' column for output
+
+        :param agpercent: age grade percentage (between 0 and 100)
+        '''
+        
+        self.pline['agpercent'] = agpercent
+    
+    #----------------------------------------------------------------------
+    def setagtime(self,agtime):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'agtime' column for output
+
+        :param agtime: age grade time (seconds)
+        '''
+        
+        self.pline['agtime'] = agtime
+    
+    #----------------------------------------------------------------------
+    def render(self):
+    #----------------------------------------------------------------------
+        '''
+        output current line to page
+        '''
+
+        pline = self.pline
+        self.renderrow((pline['place'],pline['name'],pline['age'],pline['time'],pline['agfactor'],pline['agpercent'],pline['agtime']))
+    
+    #----------------------------------------------------------------------
+    def prerender(self,times,agtimes):
+    #----------------------------------------------------------------------
+        '''
+        render all the times at once, for renderrow()
+
+        :param times: list of times (seconds)
+        :param agtimes: list of age grade times (seconds)
+        '''
+
+        self.dtimes = rendertimes(times,self.timeprecision)
+        self.dagtimes = rendertimes(agtimes,self.agtimeprecision)
+    
+    #----------------------------------------------------------------------
+    def renderrow(self,row):
+    #----------------------------------------------------------------------
+        '''
+        output a whole result line to page
+
+        :param row: (place,name,age,time,agfactor,agpercent,agtime)
+        '''
+        place,name,age,time,agfactor,agpercent,agtime = row
+        
+        # same formatting as TxtRaceHandler
+        cells = [
+            render.htmlcell(place,'place'),
+            render.htmlcell(name,'name'),
+            render.htmlcell(age,'age'),
+            render.htmlcell(time if isinstance(time,str) else self.dtimes.get(time) or render.rendertime(time,self.timeprecision),'time'),
+            render.htmlcell('{0:0.4f}'.format(agfactor) if isinstance(agfactor,float) else agfactor,'agfactor'),
+            render.htmlcell('{0:0.2f}'.format(agpercent) if isinstance(agpercent,float) else agpercent,'agpercent'),
+            render.htmlcell(agtime if isinstance(agtime,str) else self.dagtimes.get(agtime) or render.rendertime(agtime,self.agtimeprecision),'agtime'),
+            ]
+        
+        self.HTML.write('<tr>{0}</tr>\n'.format(''.join(cells)))
+    
+    #----------------------------------------------------------------------
+    def skipline(self):
+    #----------------------------------------------------------------------
+        '''
+        output blank line to page
+        '''
+
+        self.HTML.write('<tr><td colspan="7">&nbsp;</td></tr>\n')
+    
+    #----------------------------------------------------------------------
+    def close(self):
+    #----------------------------------------------------------------------
+        '''
+        save rendered page and its hash
+        '''
+        
+        self.HTML.write('</table>\n')
+        render.saverendered(self.rendered,self.fname,render.htmlpage(self.title,self.HTML.getvalue()),self.tofile)
+        self.HTML = None
+    
+########################################################################
+class RaceRenderer():
+########################################################################
+    '''
+    RaceRenderer collects results and provides rendering methods, for a single series
+    
+    :param session: database session
+    :param racename: race.name
+    :param raceid: race.id
+    :param orderby: name of field in RaceResult with which results should be ordered (e.g., 'time')
+    :param hightolow: True if ordering is high value to low value
+    :param \*\*resultfilter: filter parameters for racedb.RaceResult table
+    '''
+    #----------------------------------------------------------------------
+    def __init__(self,session,racename,raceid,orderby,hightolow,nonmembers,**resultfilter):
+    #----------------------------------------------------------------------
+        self.session = session
+        self.racename = racename
+        self.raceid = raceid
+        self.orderby = orderby
+        self.hightolow = hightolow
+        self.nonmembers = nonmembers
+        self.resultfilter = resultfilter
+        
+    #----------------------------------------------------------------------
+    def renderrace(self,fh): 
+    #----------------------------------------------------------------------
+        '''
+        render results for a single race
+        
+        fh object has methods with prototypes same as BaseRaceHandler().  If fh doesn't have
+        renderrow(), rows are rendered through its cell at a time methods
+        
+        :param fh: RaceHandler object-like
+        '''
+        
+        self.rendergenders({self.resultfilter.get('gender'):fh})
+        
+    #----------------------------------------------------------------------
+    def rendergenders(self,fhbygen): 
+    #----------------------------------------------------------------------
+        '''
+        render results for a single race, overall and by gender, in one pass over the results
+        
+        fh objects have methods with prototypes same as BaseRaceHandler().  If an fh doesn't have
+        renderrow(), rows are rendered through its cell at a time methods
+        
+        :param fhbygen: {gen:fh,...} where gen is None for overall results, else M or F
+        '''
+        fhbygen = dict([(gen,rowhandler(fh)) for gen,fh in list(fhbygen.items())])
+
+        # Get race information
+        race = self.session.query(racedb.Race).filter_by(id=self.raceid).order_by(racedb.Race.racenum).first()
+        year = race.year
+        
+        # open files, prepare headers, etc
+        for fh in list(fhbygen.values()):
+            fh.prepare(year,self.racename,self.orderby,self.nonmembers)
+                
+        # use first series found for this race, and get the results associated with this race / series
+        # results are ordered based on self.orderby field and highlow directive, runners are loaded with the results
+        raceseries = self.session.query(racedb.RaceSeries).filter_by(raceid=self.raceid).first()
+        orderby = getattr(racedb.RaceResult,self.orderby)
+        if self.hightolow: orderby = orderby.desc()
+        allresults = self.session.query(racedb.RaceResult).options(joinedload(racedb.RaceResult.runner)) \
+                        .filter_by(raceid=self.raceid,seriesid=raceseries.seriesid,**self.resultfilter) \
+                        .order_by(orderby,racedb.RaceResult.id).all()
+        
+        # handlers which display times can render them all at once
+        times = [result.time for result in allresults]
+        agtimes = [result.agtime for result in allresults]
+        for fh in list(fhbygen.values()):
+            if hasattr(fh,'prerender'):
+                fh.prerender(times,agtimes)
+        
+        # render results, each result goes to overall and to its gender
+        thisplace = dict([(gen,1) for gen in fhbygen])
+        for result in allresults:
+            fields = (result.runner.name,result.agage,result.time,result.agfactor,result.agpercent,result.agtime)
+            for gen in [None,result.gender]:
+                if gen not in fhbygen: continue
+                fhbygen[gen].renderrow((thisplace[gen],)+fields)
+                thisplace[gen] += 1
+                        
+        # done with rendering
+        for fh in list(fhbygen.values()):
+            fh.close()
+            
+#----------------------------------------------------------------------
+def racehandlers(session,distance,xlsx=False,withjson=False,withhtml=False): 
+#----------------------------------------------------------------------
+    '''
+    create handlers for race files, overall and by gender
+    
+    :param session: database session
+    :param distance: race distance (miles)
+    :param xlsx: True to render .xlsx files rather than .xls files
+    :param withjson: True to also render .json files
+    :param withhtml: True to also render .html files
+    :rtype: {gen:ListRaceHandler,...} where gen is None for overall results, else M or F
+    '''
+    fhbygen = {}
+    for gen in [None,'F','M']:
+        resultfilter = {}
+        if gen:
+            resultfilter['gender'] = gen
+            
+        fh = ListRaceHandler()
+        fh.addhandler(TxtRaceHandler(session,distance,**resultfilter))
+        if xlsx:
+            fh.addhandler(XlsxRaceHandler(session,distance,**resultfilter))
+        else:
+            fh.addhandler(XlRaceHandler(session,distance,**resultfilter))
+        if withjson:
+            fh.addhandler(JsonRaceHandler(session,distance,**resultfilter))
+        if withhtml:
+            fh.addhandler(HtmlRaceHandler(session,distance,**resultfilter))
+        fhbygen[gen] = fh
+    
+    return fhbygen
+
+#----------------------------------------------------------------------
+def selectraces(session,raceids=None,year=None,start=None,end=None): 
+#----------------------------------------------------------------------
+    '''
+    select races to render, all criteria which are given must match
+    
+    :param session: database session
+    :param raceids: list of race.id
+    :param year: year of races
+    :param start: earliest race date (yyyy-mm-dd)
+    :param end: latest race date (yyyy-mm-dd)
+    :rtype: list of racedb.Race, in date order
+    '''
+    if not (raceids or year or start or end):
+        raise parameterError('raceid, year or date range must be specified')
+    
+    query = session.query(racedb.Race)
+    if raceids:
+        query = query.filter(racedb.Race.id.in_(raceids))
+    if year:
+        query = query.filter_by(year=year)
+    if start:
+        query = query.filter(racedb.Race.date >= start)
+    if end:
+        query = query.filter(racedb.Race.date <= end)
+    
+    return query.order_by(racedb.Race.date,racedb.Race.racenum).all()
+
+#----------------------------------------------------------------------
+def renderracefiles(racedbfile,raceid,orderby,hightolow,nonmembers,xlsx=False,withjson=False,withhtml=False): 
+#----------------------------------------------------------------------
+    '''
+    render result files for a single race, using a session of its own
+    
+    this is the worker for main() --jobs, so it must be picklable and not depend on the caller's session
+    
+    :param racedbfile: filename of race database, None if as configured during rcuserconfig
+    :param raceid: race.id to render
+    :param orderby: name of RaceResult field to order results by
+    :param hightolow: True if results are to be ordered high value to low value
+    :param nonmembers: True to suppress note about inclusion of members only
+    :param xlsx: True to render .xlsx files rather than .xls files
+    :param withjson: True to also render .json files
+    :param withhtml: True to also render .html files
+    :rtype: (race name, elapsed seconds)
+    '''
+    started = time.time()
+    
+    racedb.setracedb(racedbfile)
+    session = racedb.Session()
+    race = session.query(racedb.Race).filter_by(id=raceid).one()
+    
+    fhbygen = racehandlers(session,race.distance,xlsx,withjson,withhtml)
+    RaceRenderer(session,race.name,race.id,orderby,hightolow,nonmembers).rendergenders(fhbygen)
+    
+    racename = race.name
+    session.close()
+    
+    return racename,time.time()-started
+
+#----------------------------------------------------------------------
+def main(): 
+#----------------------------------------------------------------------
+    '''
+    render race information
+    '''
+    parser = argparse.ArgumentParser(version='{0} {1}'.format('runningclub',version.__version__))
+    parser.add_argument('raceid',help='id of race(s) (use listraces to determine raceid)',type=int,nargs='*')
+    parser.add_argument('-y','--year',help='render all races in this year',type=int,default=None)
+    parser.add_argument('-b','--begindate',help='render races on or after this date, yyyy-mm-dd',default=None)
+    parser.add_argument('-e','--enddate',help='render races on or before this date, yyyy-mm-dd',default=None)
+    parser.add_argument('-o','--orderby',help='name of RaceResult field to order results by (default %(default)s)',default='time')
+    parser.add_argument('-H','--hightolow',help='use if results are to be ordered high value to low value',action='store_true')
+    parser.add_argument('-n','--nonmembers',help='use to suppress note about members only being part of rendered race',action='store_true')
+    parser.add_argument('-r','--racedb',help='filename of race database (default is as configured during rcuserconfig)',default=None)
+    parser.add_argument('-x','--xlsx',help='render .xlsx files rather than .xls files (requires xlsxwriter)',action='store_true')
+    parser.add_argument('--json',help='also render .json files',action='store_true')
+    parser.add_argument('--html',help='also render .html files',action='store_true')
+    parser.add_argument('-j','--jobs',help='number of processes to render races in parallel, default %(default)s',type=int,default=1)
+    args = parser.parse_args()
+    
+    if not (args.raceid or args.year or args.begindate or args.enddate):
+        parser.error('raceid, --year, --begindate or --enddate must be specified')
+    
+    orderby = args.orderby
+    hightolow = args.hightolow
+    nonmembers = args.nonmembers
+    
+    racedb.setracedb(args.racedb)
+    session = racedb.Session()
+    races = selectraces(session,args.raceid,args.year,args.begindate,args.enddate)
+    
+    # report any requested races which weren't found
+    foundids = [race.id for race in races]
+    for raceid in args.raceid:
+        if raceid not in foundids:
+            print('raceid {0} not found.  Use listraces to determine raceid'.format(raceid))
+    
+    # render each race in its own process
+    if args.jobs > 1:
+        # workers make their own connections, so make sure none are inherited from this process
+        session.close()
+        for engine in list(racedb.ENGINES.values()):
+            engine.dispose()
+        
+        pool = multiprocessing.Pool(args.jobs)
+        try:
+            worker = functools.partial(renderracefiles,args.racedb,orderby=orderby,hightolow=hightolow,nonmembers=nonmembers,
+                                       xlsx=args.xlsx,withjson=args.json,withhtml=args.html)
+            for racename,elapsed in pool.imap_unordered(worker,foundids):
+                print('{0} rendered in {1:.1f} seconds'.format(racename,elapsed))
+        finally:
+            pool.close()
+            pool.join()
+        return
+    
+    for race in races:
+        # render overall and gender results together
+        fhbygen = racehandlers(session,race.distance,args.xlsx,args.json,args.html)
         
         # render the results, according to specifications
-        rr = RaceRenderer(session,race.name,raceid,orderby,hightolow,nonmembers,**resultfilter)
-        rr.renderrace(fh)
+        rr = RaceRenderer(session,race.name,race.id,orderby,hightolow,nonmembers)
+        rr.rendergenders(fhbygen)
 
     session.close()
         
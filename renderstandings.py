@@ -32,6 +32,13 @@ renderstandings - render result information within database for standings
 import pdb
 import argparse
 import math
+import json
+import io
+import html
+import time
+import functools
+import multiprocessing
+import importlib.util
 
 # pypi
 import xlwt
@@ -39,6 +46,7 @@ import xlwt
 # github
 
 # other
+from sqlalchemy.orm import joinedload
 
 # home grown
 from .config import parameterError,dbConsistencyError
@@ -172,6 +180,21 @@ class BaseStandingsHandler():
 
         pass
 
+    #----------------------------------------------------------------------
+    def renderrow(self,gen,row):
+    #----------------------------------------------------------------------
+        '''
+        output a whole runner line to gender file
+        
+        by default this is done through the cell at a time methods, but may be replaced
+        by a faster implementation
+
+        :param gen: gender M or F
+        :param row: (place,name,total,races), races is [(racenum,result,stylename),...]
+        '''
+
+        rendercells(self,gen,row)
+
     #----------------------------------------------------------------------
     def skipline(self,gen):
     #----------------------------------------------------------------------
@@ -215,7 +238,7 @@ class ListStandingsHandler():
         :param fh: derivative of BaseStandingsHandler
         '''
         
-        self.fhlist.append(fh)
+        self.fhlist.append(rowhandler(fh))
         
     #----------------------------------------------------------------------
     def prepare(self,gen,series,year):
@@ -326,6 +349,19 @@ class ListStandingsHandler():
         for fh in self.fhlist:
             fh.render(gen)
 
+    #----------------------------------------------------------------------
+    def renderrow(self,gen,row):
+    #----------------------------------------------------------------------
+        '''
+        output a whole runner line to gender file
+
+        :param gen: gender M or F
+        :param row: (place,name,total,races), races is [(racenum,result,stylename),...]
+        '''
+
+        for fh in self.fhlist:
+            fh.renderrow(gen,row)
+
     #----------------------------------------------------------------------
     def skipline(self,gen):
     #----------------------------------------------------------------------
@@ -348,6 +384,70 @@ class ListStandingsHandler():
         for fh in self.fhlist:
             fh.close()
     
+########################################################################
+class StandingsRowAdapter():
+########################################################################
+    '''
+    Adds renderrow() to a StandingsHandler object-like which only has the cell at a
+    time methods.  All other methods are passed through to the handler.
+    
+    :param fh: StandingsHandler object-like
+    '''
+    #----------------------------------------------------------------------
+    def __init__(self,fh):
+    #----------------------------------------------------------------------
+        self.fh = fh
+    
+    #----------------------------------------------------------------------
+    def __getattr__(self,attr):
+    #----------------------------------------------------------------------
+        return getattr(self.fh,attr)
+    
+    #----------------------------------------------------------------------
+    def renderrow(self,gen,row):
+    #----------------------------------------------------------------------
+        '''
+        output a whole runner line to gender file
+
+        :param gen: gender M or F
+        :param row: (place,name,total,races), races is [(racenum,result,stylename),...]
+        '''
+
+        rendercells(self.fh,gen,row)
+
+#----------------------------------------------------------------------
+def rendercells(fh,gen,row):
+#----------------------------------------------------------------------
+    '''
+    render a runner line through the cell at a time methods of a StandingsHandler
+    
+    :param fh: StandingsHandler object-like
+    :param gen: gender M or F
+    :param row: (place,name,total,races), races is [(racenum,result,stylename),...]
+    '''
+    place,name,total,races = row
+    
+    fh.clearline(gen)
+    fh.setplace(gen,place)
+    fh.setname(gen,name)
+    fh.settotal(gen,total)
+    for racenum,result,stylename in races:
+        fh.setrace(gen,racenum,result,stylename)
+    fh.render(gen)
+
+#----------------------------------------------------------------------
+def rowhandler(fh):
+#----------------------------------------------------------------------
+    '''
+    make sure StandingsHandler supports renderrow()
+    
+    :param fh: StandingsHandler object-like
+    :rtype: fh if it has renderrow(), else StandingsRowAdapter for fh
+    '''
+    if hasattr(fh,'renderrow'):
+        return fh
+    return StandingsRowAdapter(fh)
+
 ########################################################################
 class TxtStandingsHandler(BaseStandingsHandler):
 ########################################################################
@@ -405,6 +505,7 @@ class TxtStandingsHandler(BaseStandingsHandler):
         for racenum in self.racelist:
             self.linefmt += '{{race{0}:{1}s}} '.format(racenum,COLWIDTH)
         self.linefmt += '{total:10s}\n'
+        self.racekey = dict([(racenum,'race{0}'.format(racenum)) for racenum in self.racelist])
         
         self.clearline(gen)
         self.setplace(gen,'')
@@ -496,6 +597,28 @@ class TxtStandingsHandler(BaseStandingsHandler):
 
         self.TXT[gen].write(self.linefmt.format(**self.pline[gen]))
     
+    #----------------------------------------------------------------------
+    def renderrow(self,gen,row):
+    #----------------------------------------------------------------------
+        '''
+        output a whole runner line to gender file
+
+        :param gen: gender M or F
+        :param row: (place,name,total,races), races is [(racenum,result,stylename),...]
+        '''
+        place,name,total,races = row
+        
+        pline = self.pline[gen]
+        for k in pline:
+            pline[k] = ''
+        pline['place'] = str(place)
+        pline['name'] = str(name)
+        pline['total'] = str(total)
+        for racenum,result,stylename in races:
+            pline[self.racekey.get(racenum) or 'race{0}'.format(racenum)] = str(result)
+        
+        self.TXT[gen].write(self.linefmt.format(**pline))
+    
     #----------------------------------------------------------------------
     def skipline(self,gen):
     #----------------------------------------------------------------------
@@ -574,8 +697,7 @@ class XlStandingsHandler(BaseStandingsHandler):
         # open output file
         MF = {'F':'Women','M':'Men'}
         rengen = MF[gen]
-        self.fname = '{0}-{1}.xls'.format(year,series.name)
-        self.ws[gen] = self.wb.add_sheet(rengen)
+        self.addsheet(gen,'{0}-{1}'.format(year,series.name),rengen)
         
         # render list of all races which will be in the series
         hdrcol = 0
@@ -594,22 +716,18 @@ class XlStandingsHandler(BaseStandingsHandler):
             self.rownum[gen] += 1
         self.rownum[gen] += 1
 
-        self.racelist = []
         self.races = self.session.query(racedb.Race).join("series").filter_by(seriesid=series.id,active=True).order_by(racedb.Race.racenum).all()
+        self.racelist = [race.racenum for race in self.races]
         numraces = len(self.races)
         nracerows = int(math.ceil(numraces/2.0))
-        thiscol = 1
-        for racendx in range(nracerows):
-            race = self.races[racendx]
-            self.racelist.append(race.racenum)
-            thisrow = self.rownum[gen]+racendx
-            self.ws[gen].write(thisrow,thiscol,'\tRace {0}: {1}: {2}\n'.format(race.racenum,race.name,render.renderdate(race.date)),self.style['racename'])
-        thiscol = 6
-        for racendx in range(nracerows,numraces):
-            race = self.races[racendx]
-            self.racelist.append(race.racenum)
-            thisrow = self.rownum[gen]+racendx-nracerows
-            self.ws[gen].write(thisrow,thiscol,'\tRace {0}: {1}: {2}\n'.format(race.racenum,race.name,render.renderdate(race.date)),self.style['racename'])
+        
+        # race list is in two columns, written a row at a time so rows are never revisited
+        for racerow in range(nracerows):
+            thisrow = self.rownum[gen]+racerow
+            for racendx,thiscol in [(racerow,1),(racerow+nracerows,6)]:
+                if racendx >= numraces: continue
+                race = self.races[racendx]
+                self.ws[gen].write(thisrow,thiscol,'\tRace {0}: {1}: {2}\n'.format(race.racenum,race.name,render.renderdate(race.date)),self.style['racename'])
 
         self.rownum[gen] += nracerows+1
         
@@ -623,13 +741,14 @@ class XlStandingsHandler(BaseStandingsHandler):
             self.colnum['race{0}'.format(racenum)] = thiscol
             thiscol += 1
         self.colnum['total'] = thiscol
+        self.racecolnum = dict([(racenum,self.colnum['race{0}'.format(racenum)]) for racenum in self.racelist])
 
         # set up col widths
-        self.ws[gen].col(self.colnum['place']).width = 6*256
-        self.ws[gen].col(self.colnum['name']).width = 19*256
-        self.ws[gen].col(self.colnum['total']).width = 9*256
+        self.setcolwidth(gen,self.colnum['place'],6)
+        self.setcolwidth(gen,self.colnum['name'],19)
+        self.setcolwidth(gen,self.colnum['total'],9)
         for racenum in self.racelist:
-            self.ws[gen].col(self.colnum['race{0}'.format(racenum)]).width = 6*256
+            self.setcolwidth(gen,self.colnum['race{0}'.format(racenum)],6)
         
         # render header
         self.clearline(gen)
@@ -644,6 +763,33 @@ class XlStandingsHandler(BaseStandingsHandler):
 
         return numraces
     
+    #----------------------------------------------------------------------
+    def addsheet(self,gen,basename,sheetname):
+    #----------------------------------------------------------------------
+        '''
+        add a worksheet for this gender to the workbook
+        
+        :param gen: gender M or F
+        :param basename: file name for the workbook, without extension
+        :param sheetname: name of the worksheet
+        '''
+        
+        self.fname = '{0}.xls'.format(basename)
+        self.ws[gen] = self.wb.add_sheet(sheetname)
+    
+    #----------------------------------------------------------------------
+    def setcolwidth(self,gen,colnum,width):
+    #----------------------------------------------------------------------
+        '''
+        set column width for this gender's worksheet
+        
+        :param gen: gender M or F
+        :param colnum: column number
+        :param width: width in characters
+        '''
+        
+        self.ws[gen].col(colnum).width = width*256
+    
     #----------------------------------------------------------------------
     def clearline(self,gen):
     #----------------------------------------------------------------------
@@ -724,6 +870,29 @@ class XlStandingsHandler(BaseStandingsHandler):
 
         self.rownum[gen] += 1
     
+    #----------------------------------------------------------------------
+    def renderrow(self,gen,row):
+    #----------------------------------------------------------------------
+        '''
+        output a whole runner line to gender file
+
+        :param gen: gender M or F
+        :param row: (place,name,total,races), races is [(racenum,result,stylename),...]
+        '''
+        place,name,total,races = row
+        
+        ws = self.ws[gen]
+        rownum = self.rownum[gen]
+        ws.write(rownum,self.colnum['place'],place,self.style['place'])
+        ws.write(rownum,self.colnum['name'],name,self.style['name'])
+        ws.write(rownum,self.colnum['total'],total,self.style['total'])
+        for racenum,result,stylename in races:
+            # skip races not in this series
+            if racenum in self.racecolnum:
+                ws.write(rownum,self.racecolnum[racenum],result,self.style[stylename])
+        
+        self.rownum[gen] += 1
+    
     #----------------------------------------------------------------------
     def skipline(self,gen):
     #----------------------------------------------------------------------
@@ -752,198 +921,934 @@ class XlStandingsHandler(BaseStandingsHandler):
         self.rownum = {'F':0,'M':0}
     
 ########################################################################
-class StandingsRenderer():
+class XlsxStandingsHandler(XlStandingsHandler):
 ########################################################################
     '''
-    StandingsRenderer collects standings and provides rendering methods, for a single series
+    StandingsHandler for .xlsx files
+    
+    rows are streamed to disk as they are rendered (xlsxwriter constant_memory mode),
+    so memory use does not grow with the number of runners.  Requires xlsxwriter.
     
     :param session: database session
-    :param series: racedb.Series
-    :param orderby: database field by which standings should be ordered (e.g., racedb.RaceResult.time)
-    :param hightolow: True if ordering is high value to low value
-    :param bydiv: True if standings are to be tallied by division, in addition to by gender
-    :param avgtie: True if tie points are averaged, else max points is used for both
-    :param multiplier: race points are multiplied by this value
-    :param maxgenpoints: maximum number of points by gender for first place result.  If None, standings are tallied directly
-    :param maxdivpoints: maximum number of points by division for first place result
-    :param maxraces: maximum number of races run by a runner to be included in total points
-    :param maxbynumrunners: True if maximum points is based on the number of runners for the race
     '''
+    # format properties, registered once with each workbook
+    STYLES = {
+        'majorhdr': {'bold':True,'font_size':12},
+        'hdr': {'bold':True,'font_size':10},
+        'divhdr': {'bold':True,'font_size':10},
+        'racehdr': {'align':'center','bold':True,'font_size':10},
+        'racename': {'font_size':10},
+        'place': {'align':'center','font_size':10,'num_format':'General'},
+        'name': {'font_size':10},
+        'name-won-agegroup': {'font_size':10,'font_color':'green','num_format':'General'},
+        'name-noteligable': {'font_size':10,'font_color':'blue','num_format':'General'},
+        'race': {'align':'center','font_size':10,'num_format':'General'},
+        'race-dropped': {'align':'center','font_size':10,'font_color':'red','num_format':'General'},
+        'total': {'align':'center','font_size':10,'num_format':'General'},
+        }
+    
     #----------------------------------------------------------------------
-    def __init__(self,session,series,orderby,hightolow,bydiv,avgtie,multiplier=1,maxgenpoints=None,maxdivpoints=None,maxraces=None,maxbynumrunners=False):
+    def __init__(self,session):
     #----------------------------------------------------------------------
-        self.session = session
-        self.series = series
-        self.orderby = orderby
-        self.hightolow = hightolow
-        self.bydiv = bydiv
-        self.avgtie = avgtie
-        self.multiplier = multiplier
-        self.maxgenpoints = maxgenpoints
-        self.maxdivpoints = maxdivpoints
-        self.maxraces = maxraces
-        self.maxbynumrunners = maxbynumrunners
+        BaseStandingsHandler.__init__(self,session)
         
+        # xlsxwriter is only required if .xlsx files are rendered
+        import xlsxwriter
+        self.xlsxwriter = xlsxwriter
+        
+        # workbook is created when the first sheet is added, as the file name isn't known until then
+        self.wb = None
+        self.ws = {}
+        self.style = {}
+        
+        self.rownum = {'F':0,'M':0}
+    
     #----------------------------------------------------------------------
-    def collectstandings(self,racesprocessed,gen,raceid,byrunner,divrunner): 
+    def addsheet(self,gen,basename,sheetname):
     #----------------------------------------------------------------------
         '''
-        collect standings for this race / series
+        add a worksheet for this gender to the workbook, creating the workbook if needed
         
-        in byrunner[name][type], points{race} entries are set to '' for race not run, to 0 for race run but no points given
+        :param gen: gender M or F
+        :param basename: file name for the workbook, without extension
+        :param sheetname: name of the worksheet
+        '''
         
-        :param racesprocessed: number of races processed so far
-        :param gen: gender, M or F
-        :param raceid: race.id to collect standings for
-        :param byrunner: dict updated as runner standings are collected {name:{'bygender':[points1,points2,...],'bydivision':[points1,points2,...]}}
-        :param divrunner: dict updated with runner names by division {div:[runner1,runner2,...],...}
-        :rtype: number of standings processed for this race / series
+        if self.wb is None:
+            self.fname = '{0}.xlsx'.format(basename)
+            self.wb = self.xlsxwriter.Workbook(self.fname,{'constant_memory':True})
+            self.style = dict([(stylename,self.wb.add_format(props)) for stylename,props in list(self.STYLES.items())])
+        
+        self.ws[gen] = self.wb.add_worksheet(sheetname)
+    
+    #----------------------------------------------------------------------
+    def setcolwidth(self,gen,colnum,width):
+    #----------------------------------------------------------------------
         '''
-        numresults = 0
+        set column width for this gender's worksheet
+        
+        :param gen: gender M or F
+        :param colnum: column number
+        :param width: width in characters
+        '''
+        
+        self.ws[gen].set_column(colnum,colnum,width)
     
-        # get all the results currently in the database
-        # byrunner = {name:{'bygender':[points,points,...],'bydivision':[points,points,...]}, ...}
-        allresults = self.session.query(racedb.RaceResult).order_by(self.orderby).filter_by(raceid=raceid,seriesid=self.series.id,gender=gen).all()
-        if self.hightolow: allresults.sort(reverse=True)
+    #----------------------------------------------------------------------
+    def close(self):
+    #----------------------------------------------------------------------
+        '''
+        close workbook, flushing remaining rows to the file
+        '''
         
-        for resultndx in range(len(allresults)):
-            numresults += 1
-            result = allresults[resultndx]
-            
-            # add runner name 
-            name = result.runner.name
-            if name not in byrunner:
-                byrunner[name] = {}
-                byrunner[name]['bygender'] = []
-                if self.bydiv:
-                    if name not in divrunner[(result.divisionlow,result.divisionhigh)]:
-                        divrunner[(result.divisionlow,result.divisionhigh)].append(name)
-                    byrunner[name]['bydivision'] = []
-            
-            # for this runner, catch 'bygender' and 'bydivision' up to current race position
-            while len(byrunner[name]['bygender']) < racesprocessed:
-                byrunner[name]['bygender'].append('')
-                if self.bydiv:
-                    byrunner[name]['bydivision'].append('')
-                    
-            # accumulate points for this result
-            # if result is ordered by time, genderplace and divisionplace may be used
-            if self.orderby == racedb.RaceResult.time:
-                # if result points depend on the number of runners, update maxgenpoints
-                if self.maxbynumrunners:
-                    self.maxgenpoints = len(allresults)
-                
-                # if starting at the top (i.e., maxgenpoints is non-zero, accumulate points accordingly
-                if self.maxgenpoints:
-                    genpoints = self.multiplier*(self.maxgenpoints+1-result.genderplace)
-                
-                # otherwise, accumulate from the bottom
-                else:
-                    genpoints = self.multiplier*result.genderplace
-                
-                byrunner[name]['bygender'].append(max(genpoints,0))
-                if self.bydiv:
-                    divpoints = self.multiplier*(self.maxdivpoints+1-result.divisionplace)
-                    byrunner[name]['bydivision'].append(max(divpoints,0))
-            
-            # if result was ordered by agpercent, agpercent is used -- assume no divisions
-            elif self.orderby == racedb.RaceResult.agpercent:
-                # some combinations don't make sense, and have been commented out
-                # TODO: verify combinations in updaterace.py
-                
-                ## if result points depend on the number of runners, update maxgenpoints
-                #if byrunner:
-                #    maxgenpoints = len(allresults)
-                #
-                ## if starting at the top (i.e., maxgenpoints is non-zero, accumulate points accordingly
-                #if maxgenpoints:
-                #    genpoints = self.multiplier*(self.maxgenpoints+1-result.genderplace)
-                #
-                ## otherwise, accumulate from the bottom (this should never happen)
-                #else:
-                genpoints = int(round(self.multiplier*result.agpercent))
-                
-                byrunner[name]['bygender'].append(max(genpoints,0))
-                #if self.bydiv:
-                #    divpoints = self.multiplier*(self.maxdivpoints+1-result.divisionplace)
-                #    byrunner[name]['bydivision'].append(max(divpoints,0))
-            
-            # if result is ordered by agtime, agtimeplace may be used -- assume no divisions
-            elif self.orderby == racedb.RaceResult.agtime:
-                # if result points depend on the number of runners, update maxgenpoints
-                if byrunner:
-                    self.maxgenpoints = len(allresults)
-                
-                # if starting at the top (i.e., maxgenpoints is non-zero, accumulate points accordingly
-                if self.maxgenpoints:
-                    genpoints = self.multiplier*(self.maxgenpoints+1-result.agtimeplace)
-                
-                # otherwise, accumulate from the bottom
-                else:
-                    genpoints = self.multiplier*result.agtimeplace
-                
-                byrunner[name]['bygender'].append(max(genpoints,0))
-                #if self.bydiv:
-                #    divpoints = self.multiplier*(self.maxdivpoints+1-result.divisionplace)
-                #    byrunner[name]['bydivision'].append(max(divpoints,0))
-                #
-            else:
-                raise parameterError('results must be ordered by time, agtime or agpercent')
-            
-        return numresults            
+        if self.wb is not None:
+            self.wb.close()
+        
+        self.wb = None
+        self.ws = {}
+        self.style = {}
+        self.rownum = {'F':0,'M':0}
+    
+########################################################################
+class JsonStandingsHandler(BaseStandingsHandler):
+########################################################################
+    '''
+    StandingsHandler for .json files
+    
+    standings for both genders are rendered into a single document for the series,
+    which is kept in self.rendered with its content hash when the handler is closed
     
+    :param session: database session
+    :param tofile: True if document is also to be written to a file
+    '''
     #----------------------------------------------------------------------
-    def renderseries(self,fh): 
+    def __init__(self,session,tofile=True):
+    #----------------------------------------------------------------------
+        BaseStandingsHandler.__init__(self,session)
+        self.tofile = tofile
+        
+        # {fname:(content,hash),...}
+        self.rendered = {}
+        
+        self.doc = None
+        self.sections = {}
+        self.rows = {}
+        self.pline = {'F':{},'M':{}}
+    
+    #----------------------------------------------------------------------
+    def prepare(self,gen,series,year):
     #----------------------------------------------------------------------
         '''
-        render standings for a single series
+        prepare document for output, including as appropriate
         
-        see BaseStandingsHandler for methods of fh
+        * series and race information
+        * list of rows for this gender
         
-        :param fh: StandingsHandler object-like
+        numraces has number of races
+        
+        :param gen: gender M or F
+        :param series: racedb.Series
+        :param year: year of races
+        :rtype: numraces
+        '''
+        
+        MF = {'F':'Women','M':'Men'}
+        rengen = MF[gen]
+        
+        races = self.session.query(racedb.Race).join("series").filter_by(seriesid=series.id,active=True).order_by(racedb.Race.racenum).all()
+        self.racelist = [race.racenum for race in races]
+        
+        # document is started by the first gender
+        if self.doc is None:
+            self.fname = '{0}-{1}.json'.format(year,series.name)
+            self.doc = {
+                'series': series.name,
+                'year': year,
+                'races': [{'racenum':race.racenum,'name':race.name,'date':race.date} for race in races],
+                'standings': {},
+                }
+        
+        # rows are grouped by division headers, e.g., 'Overall'
+        self.sections[gen] = self.doc['standings'][rengen] = []
+        self.rows[gen] = None
+        self.clearline(gen)
+        
+        return len(races)
+    
+    #----------------------------------------------------------------------
+    def clearline(self,gen):
+    #----------------------------------------------------------------------
         '''
+        prepare rendering line for output by clearing all entries
 
-        # collect divisions, if necessary
-        if self.bydiv:
-            divisions = []
-            for div in self.session.query(racedb.Divisions).filter_by(seriesid=self.series.id,active=True).order_by(racedb.Divisions.divisionlow).all():
-                divisions.append((div.divisionlow,div.divisionhigh))
-            if len(divisions) == 0:
-                raise dbConsistencyError('series {0} indicates divisions to be calculated, but no divisions found'.format(self.series.name))
+        :param gen: gender M or F
+        '''
+        
+        self.pline[gen] = {'place':'','name':'','namestyle':'name','total':'','races':[]}
+    
+    #----------------------------------------------------------------------
+    def setplace(self,gen,place,stylename='place'):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'place' column for output
 
-        # Get first race for filename year -- assume all active races are within the same year
-        firstrace = self.session.query(racedb.Race).filter_by(active=True).order_by(racedb.Race.racenum).first()
-        year = firstrace.year
+        :param gen: gender M or F
+        :param place: value for place column
+        :param stylename: name of style for field display
+        '''
         
-        # process each gender
-        for gen in ['F','M']:
-            # open file, prepare header, etc
-            fh.prepare(gen,self.series,year)
-                    
-            # collect data for each race, within byrunner dict
-            # also track names of runners within each division
-            byrunner = {}
-            divrunner = None
-            if self.bydiv:
-                divrunner = {}
-                for div in divisions:
-                    divrunner[div] = []
-                
-            # pick up active races for this series, in racenum order
-            racesprocessed = 0
-            racenums = []
-            for race in self.session.query(racedb.Race).filter_by(active=True).join("series").filter_by(seriesid=self.series.id,active=True).order_by(racedb.Race.racenum):
-                # skip races not included in this series (note race.series points at raceseries table)
-                #if self.series.id not in [s.seriesid for s in race.series]: continue
-                self.collectstandings(racesprocessed,gen,race.id,byrunner,divrunner)
-                racesprocessed += 1
-                racenums.append(race.racenum)
-                
-            # render standings
-            # first by division
-            if self.bydiv:
-                fh.clearline(gen)
-                fh.setplace(gen,'Place','racehdr')
+        self.pline[gen]['place'] = place
+    
+    #----------------------------------------------------------------------
+    def setname(self,gen,name,stylename='name'):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'name' column for output
+
+        :param gen: gender M or F
+        :param name: value for name column
+        :param stylename: name of style for field display
+        '''
+        
+        self.pline[gen]['name'] = name
+        self.pline[gen]['namestyle'] = stylename
+    
+    #----------------------------------------------------------------------
+    def setrace(self,gen,racenum,result,stylename='race'):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'race{n}' column for output, for race n
+        should be '' for empty race
+
+        :param gen: gender M or F
+        :param racenum: number of race
+        :param result: value for race column
+        :param stylename: name of style for field display
+        '''
+        
+        self.pline[gen]['races'].append((racenum,result,stylename))
+    
+    #----------------------------------------------------------------------
+    def settotal(self,gen,total,stylename='total'):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'total' column for output
+
+        :param gen: gender M or F
+        :param total: value for total column
+        :param stylename: name of style for field display
+        '''
+        
+        self.pline[gen]['total'] = total
+    
+    #----------------------------------------------------------------------
+    def render(self,gen):
+    #----------------------------------------------------------------------
+        '''
+        add current line to gender standings
+        
+        a division header line starts a new group of rows
+
+        :param gen: gender M or F
+        '''
+        
+        pline = self.pline[gen]
+        if pline['namestyle'] == 'divhdr':
+            self.rows[gen] = []
+            self.sections[gen].append({'title':pline['name'],'rows':self.rows[gen]})
+        else:
+            self.renderrow(gen,(pline['place'],pline['name'],pline['total'],pline['races']))
+    
+    #----------------------------------------------------------------------
+    def renderrow(self,gen,row):
+    #----------------------------------------------------------------------
+        '''
+        add a whole runner line to gender standings
+        
+        races not run are not included, and races which don't count toward
+        the total are listed in 'dropped'
+
+        :param gen: gender M or F
+        :param row: (place,name,total,races), races is [(racenum,result,stylename),...]
+        '''
+        place,name,total,races = row
+        
+        # runner lines before any division header have nowhere to go
+        if self.rows[gen] is None: return
+        
+        points = {}
+        dropped = []
+        for racenum,result,stylename in races:
+            if result == '' or racenum not in self.racelist: continue
+            points[str(racenum)] = result
+            if stylename == 'race-dropped':
+                dropped.append(racenum)
+        
+        # place is '' for ties
+        self.rows[gen].append({'place':place if place != '' else None,'name':name,'total':total,'races':points,'dropped':dropped})
+    
+    #----------------------------------------------------------------------
+    def skipline(self,gen):
+    #----------------------------------------------------------------------
+        '''
+        blank lines are not rendered in json
+
+        :param gen: gender M or F
+        '''
+        
+        pass
+    
+    #----------------------------------------------------------------------
+    def close(self):
+    #----------------------------------------------------------------------
+        '''
+        save rendered document and its hash, and start a new document for the next series
+        '''
+        
+        if self.doc is not None:
+            # drop headers which have no runners of their own, e.g., 'Age Group'
+            for gen in self.sections:
+                self.sections[gen][:] = [section for section in self.sections[gen] if section['rows']]
+            render.saverendered(self.rendered,self.fname,json.dumps(self.doc),self.tofile)
+        
+        self.doc = None
+        self.sections = {}
+        self.rows = {}
+    
+########################################################################
+class HtmlStandingsHandler(BaseStandingsHandler):
+########################################################################
+    '''
+    StandingsHandler for .html files
+    
+    standings for both genders are rendered into a single page for the series,
+    which is kept in self.rendered with its content hash when the handler is closed
+    
+    :param session: database session
+    :param tofile: True if page is also to be written to a file
+    '''
+    #----------------------------------------------------------------------
+    def __init__(self,session,tofile=True):
+    #----------------------------------------------------------------------
+        BaseStandingsHandler.__init__(self,session)
+        self.tofile = tofile
+        
+        # {fname:(content,hash),...}
+        self.rendered = {}
+        
+        self.HTML = {}
+        self.pline = {'F':{},'M':{}}
+    
+    #----------------------------------------------------------------------
+    def prepare(self,gen,series,year):
+    #----------------------------------------------------------------------
+        '''
+        prepare page for output, including as appropriate
+        
+        * print header information
+        * start table
+        * collect print line dict for output
+        
+        numraces has number of races
+        
+        :param gen: gender M or F
+        :param series: racedb.Series
+        :param year: year of races
+        :rtype: numraces
+        '''
+        
+        MF = {'F':'Women','M':'Men'}
+        rengen = MF[gen]
+        self.fname = '{0}-{1}.html'.format(year,series.name)
+        self.title = 'FSRC {0} {1} standings'.format(year,series.name)
+        self.HTML[gen] = io.StringIO()
+        HTML = self.HTML[gen]
+        
+        # render header, including list of all races which will be in the series
+        HTML.write("<h2>FSRC {0}'s {1} {2} standings</h2>\n".format(rengen,year,html.escape(series.name)))
+        # only drop races if max defined
+        if series.maxraces:
+            HTML.write('<p class="hdr">Points in red are dropped.</p>\n')
+        # don't mention divisions unless series is using divisions
+        if series.divisions:
+            HTML.write('<p class="hdr">Runners highlighted in blue won an overall award and are not eligible for age group awards.</p>\n')
+            HTML.write('<p class="hdr">Runners highlighted in green won an age group award.</p>\n')
+        HTML.write('<ul class="racename">\n')
+        self.racelist = []
+        for race in self.session.query(racedb.Race).join("series").filter_by(seriesid=series.id,active=True).order_by(racedb.Race.racenum).all():
+            self.racelist.append(race.racenum)
+            HTML.write('<li>Race {0}: {1}: {2}</li>\n'.format(race.racenum,html.escape(race.name),render.renderdate(race.date)))
+        HTML.write('</ul>\n')
+        
+        # cells are rendered in column order
+        self.colkeys = ['place','name'] + ['race{0}'.format(racenum) for racenum in self.racelist] + ['total']
+        self.racekey = dict([(racenum,'race{0}'.format(racenum)) for racenum in self.racelist])
+        
+        # render table header
+        HTML.write('<table>\n')
+        self.clearline(gen)
+        self.setplace(gen,'')
+        self.setname(gen,'')
+        self.settotal(gen,'Total Pts.',stylename='racehdr')
+        for racenum in self.racelist:
+            self.setrace(gen,racenum,racenum,stylename='racehdr')
+        self.render(gen)
+        
+        return len(self.racelist)
+    
+    #----------------------------------------------------------------------
+    def clearline(self,gen):
+    #----------------------------------------------------------------------
+        '''
+        prepare rendering line for output by clearing all entries
+
+        :param gen: gender M or F
+        '''
+        
+        self.pline[gen] = {}
+    
+    #----------------------------------------------------------------------
+    def setplace(self,gen,place,stylename='place'):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'place' column for output (this should be rendered in 1st column)
+
+        :param gen: gender M or F
+        :param place: value for place column
+        :param stylename: name of style for field display
+        '''
+        
+        self.pline[gen]['place'] = (place,stylename)
+    
+    #----------------------------------------------------------------------
+    def setname(self,gen,name,stylename='name'):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'name' column for output (this should be rendered in 2nd column)
+
+        :param gen: gender M or F
+        :param name: value for name column
+        :param stylename: name of style for field display
+        '''
+        
+        self.pline[gen]['name'] = (name,stylename)
+    
+    #----------------------------------------------------------------------
+    def setrace(self,gen,racenum,result,stylename='race'):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'race{n}' column for output, for race n
+        should be '' for empty race
+
+        :param gen: gender M or F
+        :param racenum: number of race
+        :param result: value for race column
+        :param stylename: name of style for field display
+        '''
+        
+        self.pline[gen]['race{0}'.format(racenum)] = (result,stylename)
+    
+    #----------------------------------------------------------------------
+    def settotal(self,gen,total,stylename='total'):
+    #----------------------------------------------------------------------
+        '''
+        put value in 'total' column for output
+
+        :param gen: gender M or F
+        :param total: value for total column
+        :param stylename: name of style for field display
+        '''
+        
+        self.pline[gen]['total'] = (total,stylename)
+    
+    #----------------------------------------------------------------------
+    def render(self,gen):
+    #----------------------------------------------------------------------
+        '''
+        output current line to gender table
+
+        :param gen: gender M or F
+        '''
+        
+        pline = self.pline[gen]
+        cells = []
+        for k in self.colkeys:
+            value,stylename = pline.get(k,('',None))
+            cells.append(render.htmlcell(value,stylename))
+        self.HTML[gen].write('<tr>{0}</tr>\n'.format(''.join(cells)))
+    
+    #----------------------------------------------------------------------
+    def renderrow(self,gen,row):
+    #----------------------------------------------------------------------
+        '''
+        output a whole runner line to gender table
+
+        :param gen: gender M or F
+        :param row: (place,name,total,races), races is [(racenum,result,stylename),...]
+        '''
+        place,name,total,races = row
+        
+        pline = {'place':(place,'place'),'name':(name,'name'),'total':(total,'total')}
+        for racenum,result,stylename in races:
+            if racenum in self.racekey:
+                pline[self.racekey[racenum]] = (result,stylename)
+        
+        cells = [render.htmlcell(*pline.get(k,('',None))) for k in self.colkeys]
+        self.HTML[gen].write('<tr>{0}</tr>\n'.format(''.join(cells)))
+    
+    #----------------------------------------------------------------------
+    def skipline(self,gen):
+    #----------------------------------------------------------------------
+        '''
+        output blank line to gender table
+
+        :param gen: gender M or F
+        '''
+        
+        self.HTML[gen].write('<tr><td colspan="{0}">&nbsp;</td></tr>\n'.format(len(self.colkeys)))
+    
+    #----------------------------------------------------------------------
+    def close(self):
+    #----------------------------------------------------------------------
+        '''
+        save rendered page and its hash, and start a new page for the next series
+        '''
+        
+        if self.HTML:
+            body = ''.join([self.HTML[gen].getvalue() + '</table>\n' for gen in ['F','M'] if gen in self.HTML])
+            render.saverendered(self.rendered,self.fname,render.htmlpage(self.title,body),self.tofile)
+        
+        self.HTML = {}
+    
+########################################################################
+class StandingsRenderer():
+########################################################################
+    '''
+    StandingsRenderer collects standings and provides rendering methods, for a single series
+    
+    :param session: database session
+    :param series: racedb.Series
+    :param orderby: database field by which standings should be ordered (e.g., racedb.RaceResult.time)
+    :param hightolow: True if ordering is high value to low value
+    :param bydiv: True if standings are to be tallied by division, in addition to by gender
+    :param avgtie: True if tie points are averaged, else max points is used for both
+    :param multiplier: race points are multiplied by this value
+    :param maxgenpoints: maximum number of points by gender for first place result.  If None, standings are tallied directly
+    :param maxdivpoints: maximum number of points by division for first place result
+    :param maxraces: maximum number of races run by a runner to be included in total points
+    :param maxbynumrunners: True if maximum points is based on the number of runners for the race
+    :param usematrix: True if standings are to be tallied with StandingsMatrix when possible (requires numpy)
+    :param usecache: True if race points are to be cached in the database (racedb.SeriesPoints) between renderings
+    :param savecache: True if points which weren't cached are to be saved in the cache, False to only read the cache
+    '''
+    #----------------------------------------------------------------------
+    def __init__(self,session,series,orderby,hightolow,bydiv,avgtie,multiplier=1,maxgenpoints=None,maxdivpoints=None,maxraces=None,maxbynumrunners=False,usematrix=True,usecache=True,savecache=True):
+    #----------------------------------------------------------------------
+        self.session = session
+        self.series = series
+        self.orderby = orderby
+        self.hightolow = hightolow
+        self.bydiv = bydiv
+        self.avgtie = avgtie
+        self.multiplier = multiplier
+        self.maxgenpoints = maxgenpoints
+        self.maxdivpoints = maxdivpoints
+        self.maxraces = maxraces
+        self.maxbynumrunners = maxbynumrunners
+        self.usematrix = usematrix
+        self.usecache = usecache
+        self.savecache = savecache
+        
+        # cached points are only used if they were determined with the same parameters
+        self.signature = '{0} {1} {2} {3} {4} {5} {6}'.format(orderby.key,bool(hightolow),bool(bydiv),multiplier,maxgenpoints,maxdivpoints,bool(maxbynumrunners))
+        
+    #----------------------------------------------------------------------
+    def collectresults(self,races): 
+    #----------------------------------------------------------------------
+        '''
+        collect all the results for this series with a single query
+        
+        runners are loaded with the results, so result.runner does not cause another query
+        
+        :param races: list of racedb.Race to collect results for
+        :rtype: {(gender,raceid):[result,result,...],...} with each list in standings order
+        '''
+        orderby = self.orderby.desc() if self.hightolow else self.orderby
+        raceids = [race.id for race in races]
+
+        results = {}
+        if not raceids: return results
+        
+        query = self.session.query(racedb.RaceResult).options(joinedload(racedb.RaceResult.runner))
+        query = query.filter(racedb.RaceResult.seriesid==self.series.id,racedb.RaceResult.raceid.in_(raceids))
+        for result in query.order_by(orderby,racedb.RaceResult.id):
+            results.setdefault((result.gender,result.raceid),[]).append(result)
+            
+        return results
+    
+    #----------------------------------------------------------------------
+    def resultpoints(self,result,numresults): 
+    #----------------------------------------------------------------------
+        '''
+        determine points for a single result
+        
+        :param result: racedb.RaceResult
+        :param numresults: number of results for this race / series / gender
+        :rtype: (genpoints,divpoints), divpoints is None if not tallied by division
+        '''
+        divpoints = None
+        
+        # if result is ordered by time, genderplace and divisionplace may be used
+        if self.orderby == racedb.RaceResult.time:
+            # if result points depend on the number of runners, update maxgenpoints
+            if self.maxbynumrunners:
+                self.maxgenpoints = numresults
+            
+            # if starting at the top (i.e., maxgenpoints is non-zero, accumulate points accordingly
+            if self.maxgenpoints:
+                genpoints = self.multiplier*(self.maxgenpoints+1-result.genderplace)
+            
+            # otherwise, accumulate from the bottom
+            else:
+                genpoints = self.multiplier*result.genderplace
+            
+            if self.bydiv:
+                divpoints = max(self.multiplier*(self.maxdivpoints+1-result.divisionplace),0)
+        
+        # if result was ordered by agpercent, agpercent is used -- assume no divisions
+        elif self.orderby == racedb.RaceResult.agpercent:
+            # some combinations don't make sense, and have been commented out
+            # TODO: verify combinations in updaterace.py
+            
+            ## if result points depend on the number of runners, update maxgenpoints
+            #if byrunner:
+            #    maxgenpoints = numresults
+            #
+            ## if starting at the top (i.e., maxgenpoints is non-zero, accumulate points accordingly
+            #if maxgenpoints:
+            #    genpoints = self.multiplier*(self.maxgenpoints+1-result.genderplace)
+            #
+            ## otherwise, accumulate from the bottom (this should never happen)
+            #else:
+            genpoints = int(round(self.multiplier*result.agpercent))
+            
+            #if self.bydiv:
+            #    divpoints = max(self.multiplier*(self.maxdivpoints+1-result.divisionplace),0)
+        
+        # if result is ordered by agtime, agtimeplace may be used -- assume no divisions
+        elif self.orderby == racedb.RaceResult.agtime:
+            # result points depend on the number of runners
+            self.maxgenpoints = numresults
+            
+            # if starting at the top (i.e., maxgenpoints is non-zero, accumulate points accordingly
+            if self.maxgenpoints:
+                genpoints = self.multiplier*(self.maxgenpoints+1-result.agtimeplace)
+            
+            # otherwise, accumulate from the bottom
+            else:
+                genpoints = self.multiplier*result.agtimeplace
+            
+            #if self.bydiv:
+            #    divpoints = max(self.multiplier*(self.maxdivpoints+1-result.divisionplace),0)
+            #
+        else:
+            raise parameterError('results must be ordered by time, agtime or agpercent')
+        
+        return max(genpoints,0),divpoints
+    
+    #----------------------------------------------------------------------
+    def racepoints(self,raceresults): 
+    #----------------------------------------------------------------------
+        '''
+        determine points for each result of a race / series / gender
+        
+        :param raceresults: results for this race / series / gender in standings order
+        :rtype: [(runnerid,name,(divisionlow,divisionhigh),genpoints,divpoints),...] in standings order
+        '''
+        racepoints = []
+        for result in raceresults:
+            genpoints,divpoints = self.resultpoints(result,len(raceresults))
+            racepoints.append((result.runnerid,result.runner.name,(result.divisionlow,result.divisionhigh),genpoints,divpoints))
+        return racepoints
+    
+    #----------------------------------------------------------------------
+    def collectpoints(self,races): 
+    #----------------------------------------------------------------------
+        '''
+        collect points for each race of this series
+        
+        points are cached in racedb.SeriesPoints, and only races without cached points are 
+        retrieved from the results.  Points depend only on the places and divisions stored when
+        results are imported, so importresults invalidates the cached points for the race it
+        imports.  Runner names are not cached
+        
+        :param races: list of racedb.Race to collect points for
+        :rtype: {(gender,raceid):[(runnerid,name,(divisionlow,divisionhigh),genpoints,divpoints),...],...} with each list in standings order
+        '''
+        points = {}
+        
+        # pick up cached points, remembering the database rows so they can be updated if necessary
+        cached = {}
+        cacherows = {}
+        if self.usecache and races:
+            query = self.session.query(racedb.SeriesPoints).filter(racedb.SeriesPoints.seriesid==self.series.id,racedb.SeriesPoints.raceid.in_([race.id for race in races]))
+            for cacherow in query:
+                cacherows[cacherow.gender,cacherow.raceid] = cacherow
+                if cacherow.signature == self.signature:
+                    cached[cacherow.gender,cacherow.raceid] = json.loads(cacherow.points)
+        
+        # runner names aren't cached because importmembers may change them
+        names = {}
+        runnerids = list(set([entry[0] for racepoints in list(cached.values()) for entry in racepoints]))
+        BATCHSIZE = 500
+        for batchstart in range(0,len(runnerids),BATCHSIZE):
+            batch = runnerids[batchstart:batchstart+BATCHSIZE]
+            for runnerid,name in self.session.query(racedb.Runner.id,racedb.Runner.name).filter(racedb.Runner.id.in_(batch)):
+                names[runnerid] = name
+        
+        # use cached points for races which have them for both genders
+        # runners may have been deleted since the points were cached, in which case the race is treated as uncached
+        uncached = []
+        for race in races:
+            if (('F',race.id) in cached and ('M',race.id) in cached
+                    and all([entry[0] in names for gen in ['F','M'] for entry in cached[gen,race.id]])):
+                for gen in ['F','M']:
+                    points[gen,race.id] = [(runnerid,names[runnerid],(divlow,divhigh),genpoints,divpoints)
+                                           for runnerid,divlow,divhigh,genpoints,divpoints in cached[gen,race.id]]
+            else:
+                uncached.append(race)
+        
+        # determine points for the rest of the races from the results, and cache them
+        allresults = self.collectresults(uncached)
+        for race in uncached:
+            for gen in ['F','M']:
+                points[gen,race.id] = self.racepoints(allresults.get((gen,race.id),[]))
+                
+                if self.usecache and self.savecache:
+                    cachepoints = json.dumps([[runnerid,div[0],div[1],genpoints,divpoints] for runnerid,name,div,genpoints,divpoints in points[gen,race.id]])
+                    if (gen,race.id) in cacherows:
+                        cacherow = cacherows[gen,race.id]
+                        cacherow.signature = self.signature
+                        cacherow.points = cachepoints
+                    else:
+                        self.session.add(racedb.SeriesPoints(self.series.id,race.id,gen,self.signature,cachepoints))
+        
+        return points
+    
+    #----------------------------------------------------------------------
+    def collectstandings(self,racesprocessed,gen,raceid,byrunner,divrunner,racepoints=None): 
+    #----------------------------------------------------------------------
+        '''
+        collect standings for this race / series
+        
+        in byrunner[name][type], points{race} entries are set to '' for race not run, to 0 for race run but no points given
+        
+        :param racesprocessed: number of races processed so far
+        :param gen: gender, M or F
+        :param raceid: race.id to collect standings for
+        :param byrunner: dict updated as runner standings are collected {name:{'bygender':[points1,points2,...],'bydivision':[points1,points2,...]}}
+        :param divrunner: dict updated with runner names by division {div:[runner1,runner2,...],...}
+        :param racepoints: points for this race / series / gender from collectpoints(). If None, results are retrieved from the database
+        :rtype: number of standings processed for this race / series
+        '''
+        numresults = 0
+    
+        # get all the results currently in the database, if points not supplied
+        # byrunner = {name:{'bygender':[points,points,...],'bydivision':[points,points,...]}, ...}
+        if racepoints is None:
+            orderby = self.orderby.desc() if self.hightolow else self.orderby
+            allresults = self.session.query(racedb.RaceResult).options(joinedload(racedb.RaceResult.runner)).order_by(orderby,racedb.RaceResult.id).filter_by(raceid=raceid,seriesid=self.series.id,gender=gen).all()
+            racepoints = self.racepoints(allresults)
+        
+        for runnerid,name,div,genpoints,divpoints in racepoints:
+            numresults += 1
+            
+            # add runner name 
+            if name not in byrunner:
+                byrunner[name] = {}
+                byrunner[name]['bygender'] = []
+                if self.bydiv:
+                    if name not in divrunner[div]:
+                        divrunner[div].append(name)
+                    byrunner[name]['bydivision'] = []
+            
+            # for this runner, catch 'bygender' and 'bydivision' up to current race position
+            while len(byrunner[name]['bygender']) < racesprocessed:
+                byrunner[name]['bygender'].append('')
+                if self.bydiv:
+                    byrunner[name]['bydivision'].append('')
+                    
+            # accumulate points for this result
+            byrunner[name]['bygender'].append(genpoints)
+            if divpoints is not None:
+                byrunner[name]['bydivision'].append(divpoints)
+            
+        return numresults            
+    
+    #----------------------------------------------------------------------
+    def collectmatrix(self,gen,races,points): 
+    #----------------------------------------------------------------------
+        '''
+        collect standings for this series / gender into a StandingsMatrix
+        
+        the matrix can't represent two results for the same name in one race, or division points
+        for a series not ordered by time.  In these cases, and if numpy is not installed, None is
+        returned and standings must be collected with collectstandings()
+        
+        :param gen: gender, M or F
+        :param races: list of racedb.Race in racenum order
+        :param points: return value from collectpoints()
+        :rtype: StandingsMatrix, or None
+        '''
+        # numpy is optional -- standings are tallied with lists if it isn't installed
+        if importlib.util.find_spec('numpy') is None:
+            return None
+        
+        if self.bydiv and self.orderby != racedb.RaceResult.time:
+            return None
+        
+        matrix = StandingsMatrix(len(races),self.maxraces,self.bydiv)
+        for racendx in range(len(races)):
+            for runnerid,name,div,genpoints,divpoints in points.get((gen,races[racendx].id),[]):
+                if not matrix.addresult(racendx,name,div,genpoints,divpoints):
+                    return None
+        
+        matrix.tally()
+        return matrix
+    
+    #----------------------------------------------------------------------
+    def renderrunners(self,fh,gen,racenums,byrunner,names,pointstype): 
+    #----------------------------------------------------------------------
+        '''
+        render standings for a group of runners, from lists collected by collectstandings()
+        
+        :param fh: StandingsHandler object-like, with renderrow()
+        :param gen: gender, M or F
+        :param racenums: list of racenum for the series races
+        :param byrunner: dict of runner standings from collectstandings()
+        :param names: names of runners in this group
+        :param pointstype: 'bygender' or 'bydivision'
+        '''
+        # calculate runner total points
+        bypoints = []
+        for name in names:
+            # convert each race result to int if possible
+            byrunner[name][pointstype] = [int(r) if isinstance(r, float) and r==int(r) else r for r in byrunner[name][pointstype]]
+            # total numbers only, highest first (races not run are '')
+            racetotals = [r for r in byrunner[name][pointstype] if type(r) in [int,float]]
+            racetotals.sort(reverse=True)
+            if self.maxraces is None:
+                racesused = racetotals
+            else:
+                racesused = racetotals[:min(self.maxraces,len(racetotals))]
+            byrunner[name]['racesused'] = racesused[:]  # NOTE: this field will be reinitialized for overall / gender standings
+            totpoints = sum(racesused)
+            # render as integer if result same as integer
+            totpoints = int(totpoints) if totpoints == int(totpoints) else totpoints
+            bypoints.append((totpoints,name))
+        
+        # sort runners by total points and render
+        bypoints.sort(reverse=True)
+        thisplace = 1
+        lastpoints = -999
+        for runner in bypoints:
+            totpoints,name = runner
+            
+            # render place if it's different than last runner's place, else there was a tie
+            renderplace = thisplace
+            if totpoints == lastpoints:
+                renderplace = ''
+            thisplace += 1
+            
+            # remember last total points
+            lastpoints = totpoints
+            
+            # collect race results
+            races = []
+            iracenums = iter(racenums)
+            for pts in byrunner[name][pointstype]:
+                racenum = next(iracenums)
+                if pts in byrunner[name]['racesused']:
+                    races.append((racenum,pts,'race'))
+                    byrunner[name]['racesused'].remove(pts)
+                else:
+                    races.append((racenum,pts,'race-dropped'))
+            
+            # render the runner's line
+            fh.renderrow(gen,(renderplace,name,totpoints,races))
+    
+    #----------------------------------------------------------------------
+    def seriesraces(self): 
+    #----------------------------------------------------------------------
+        '''
+        get the active races for this series
+        
+        :rtype: list of racedb.Race in racenum order
+        '''
+        return self.session.query(racedb.Race).filter_by(active=True).join("series").filter_by(seriesid=self.series.id,active=True).order_by(racedb.Race.racenum).all()
+    
+    #----------------------------------------------------------------------
+    def renderseries(self,fh): 
+    #----------------------------------------------------------------------
+        '''
+        render standings for a single series
+        
+        see BaseStandingsHandler for methods of fh.  If fh doesn't have renderrow(), rows
+        are rendered through its cell at a time methods
+        
+        :param fh: StandingsHandler object-like
+        '''
+        fh = rowhandler(fh)
+
+        # collect divisions, if necessary
+        if self.bydiv:
+            divisions = []
+            for div in self.session.query(racedb.Divisions).filter_by(seriesid=self.series.id,active=True).order_by(racedb.Divisions.divisionlow).all():
+                divisions.append((div.divisionlow,div.divisionhigh))
+            if len(divisions) == 0:
+                raise dbConsistencyError('series {0} indicates divisions to be calculated, but no divisions found'.format(self.series.name))
+
+        # Get first race for filename year -- assume all active races are within the same year
+        firstrace = self.session.query(racedb.Race).filter_by(active=True).order_by(racedb.Race.racenum).first()
+        year = firstrace.year
+        
+        # pick up active races for this series, in racenum order, and the points for these races
+        races = self.seriesraces()
+        racenums = [race.racenum for race in races]
+        points = self.collectpoints(races)
+        
+        # process each gender
+        for gen in ['F','M']:
+            # open file, prepare header, etc
+            fh.prepare(gen,self.series,year)
+            
+            # collect data for each race, into a matrix if possible
+            matrix = None
+            if self.usematrix:
+                matrix = self.collectmatrix(gen,races,points)
+            
+            # otherwise within byrunner dict
+            # also track names of runners within each division
+            if not matrix:
+                byrunner = {}
+                divrunner = None
+                if self.bydiv:
+                    divrunner = {}
+                    for div in divisions:
+                        divrunner[div] = []
+                    
+                racesprocessed = 0
+                for race in races:
+                    # skip races not included in this series (note race.series points at raceseries table)
+                    #if self.series.id not in [s.seriesid for s in race.series]: continue
+                    self.collectstandings(racesprocessed,gen,race.id,byrunner,divrunner,points[gen,race.id])
+                    racesprocessed += 1
+                
+            # render standings
+            # first by division
+            if self.bydiv:
+                fh.clearline(gen)
+                fh.setplace(gen,'Place','racehdr')
                 fh.setname(gen,'Age Group','divhdr')
                 fh.render(gen)
                 
@@ -956,52 +1861,11 @@ class StandingsRenderer():
                     fh.setname(gen,divtext,'divhdr')
                     fh.render(gen)
                     
-                    # calculate runner total points
-                    bypoints = []
-                    for name in divrunner[div]:
-                        # convert each race result to int if possible
-                        byrunner[name]['bydivision'] = [int(r) if isinstance(r, float) and r==int(r) else r for r in byrunner[name]['bydivision']]
-                        racetotals = byrunner[name]['bydivision'][:]    # make a copy
-                        racetotals.sort(reverse=True)
-                        # total numbers only, and convert to int if possible
-                        racetotals = [r for r in racetotals if type(r) in [int,float]]
-                        racesused = racetotals[:min(self.maxraces,len(racetotals))]
-                        byrunner[name]['racesused'] = racesused[:]  # NOTE: this field will be reinitialized for overall / gender standings
-                        totpoints = sum(racesused)
-                        # render as integer if result same as integer
-                        totpoints = int(totpoints) if totpoints == int(totpoints) else totpoints
-                        bypoints.append((totpoints,name))
-                    
-                    # sort runners within division by total points and render
-                    bypoints.sort(reverse=True)
-                    thisplace = 1
-                    lastpoints = -999
-                    for runner in bypoints:
-                        totpoints,name = runner
-                        fh.clearline(gen)
-                        
-                        # render place if it's different than last runner's place, else there was a tie
-                        renderplace = thisplace
-                        if totpoints == lastpoints:
-                            renderplace = ''
-                        fh.setplace(gen,renderplace)
-                        thisplace += 1
-                        
-                        # render name and total points, remember last total points
-                        fh.setname(gen,name)
-                        fh.settotal(gen,totpoints)
-                        lastpoints = totpoints
-                        
-                        # render race results
-                        iracenums = iter(racenums)
-                        for pts in byrunner[name]['bydivision']:
-                            racenum = next(iracenums)
-                            if pts in byrunner[name]['racesused']:
-                                fh.setrace(gen,racenum,pts)
-                                byrunner[name]['racesused'].remove(pts)
-                            else:
-                                fh.setrace(gen,racenum,pts,stylename='race-dropped')
-                        fh.render(gen)
+                    # render runners within division by total points
+                    if matrix:
+                        matrix.render(fh,gen,racenums,'bydivision',div)
+                    else:
+                        self.renderrunners(fh,gen,racenums,byrunner,divrunner[div],'bydivision')
                         
                     # skip line between divisions
                     fh.skipline(gen)
@@ -1012,57 +1876,255 @@ class StandingsRenderer():
             fh.setname(gen,'Overall','divhdr')
             fh.render(gen)
             
-            # calculate runner total points
-            bypoints = []
-            for name in byrunner:
-                # convert each race result to int if possible
-                byrunner[name]['bygender'] = [int(r) if isinstance(r, float) and r==int(r) else r for r in byrunner[name]['bygender']]
-                racetotals = byrunner[name]['bygender'][:]    # make a copy
-                racetotals.sort(reverse=True)
-                # total numbers only, and convert to int if possible
-                racetotals = [r for r in racetotals if type(r) in [int,float]]
-                racesused = racetotals[:min(self.maxraces,len(racetotals))]
-                byrunner[name]['racesused'] = racesused[:]  # NOTE: this field will be reinitialized for overall / gender standings
-                totpoints = sum(racesused)
-                totpoints = int(totpoints) if totpoints == int(totpoints) else totpoints
-                bypoints.append((totpoints,name))
-            
-            # sort runners by total points and render
-            bypoints.sort(reverse=True)
-            thisplace = 1
-            lastpoints = -999
-            for runner in bypoints:
-                totpoints,name = runner
-                fh.clearline(gen)
-                        
-                # render place if it's different than last runner's place, else there was a tie
-                renderplace = thisplace
-                if totpoints == lastpoints:
-                    renderplace = ''
-                fh.setplace(gen,renderplace)
-                thisplace += 1
-                
-                # render name and total points, remember last total points
-                fh.setname(gen,name)
-                fh.settotal(gen,totpoints)
-                lastpoints = totpoints
-                
-                # render race results
-                iracenums = iter(racenums)
-                for pts in byrunner[name]['bygender']:
-                    racenum = next(iracenums)
-                    if pts in byrunner[name]['racesused']:
-                        fh.setrace(gen,racenum,pts)
-                        byrunner[name]['racesused'].remove(pts)
-                    else:
-                        fh.setrace(gen,racenum,pts,stylename='race-dropped')
-                fh.render(gen)
+            # render runners by total points
+            if matrix:
+                matrix.render(fh,gen,racenums,'bygender')
+            else:
+                self.renderrunners(fh,gen,racenums,byrunner,list(byrunner.keys()),'bygender')
 
             fh.skipline(gen)
                         
         # done with rendering
         fh.close()
             
+########################################################################
+class StandingsMatrix():
+########################################################################
+    '''
+    StandingsMatrix holds the points for one gender of a series as a runners x races matrix, and
+    tallies totals and places with numpy.  Standings are the same as those tallied by 
+    StandingsRenderer.collectstandings() and StandingsRenderer.renderrunners()
+    
+    usage:
+    
+        * addresult() for each result, in race order then standings order
+        * tally()
+        * render() for overall and each division
+    
+    :param numraces: number of races in the series
+    :param maxraces: maximum number of races run by a runner to be included in total points, None for all races
+    :param bydiv: True if division points are collected
+    '''
+    #----------------------------------------------------------------------
+    def __init__(self,numraces,maxraces,bydiv):
+    #----------------------------------------------------------------------
+        self.numraces = numraces
+        self.maxraces = maxraces
+        self.bydiv = bydiv
+        
+        # rows are added at runner's first result, which determines runner's division
+        self.rows = {}
+        self.names = []
+        self.divs = []
+        
+        # points by (row,racendx)
+        self.genpoints = {}
+        self.divpoints = {}
+        
+        # set by tally()
+        self.standings = {}
+        
+    #----------------------------------------------------------------------
+    def addresult(self,racendx,name,div,genpoints,divpoints): 
+    #----------------------------------------------------------------------
+        '''
+        add a result to the matrix
+        
+        :param racendx: index of race within series
+        :param name: runner name
+        :param div: (divisionlow,divisionhigh) for this result
+        :param genpoints: points by gender
+        :param divpoints: points by division, or None
+        :rtype: False if runner already has a result for this race, else True
+        '''
+        if name not in self.rows:
+            self.rows[name] = len(self.names)
+            self.names.append(name)
+            self.divs.append(div)
+        
+        pos = (self.rows[name],racendx)
+        if pos in self.genpoints:
+            return False
+        
+        self.genpoints[pos] = genpoints
+        if divpoints is not None:
+            self.divpoints[pos] = divpoints
+        return True
+    
+    #----------------------------------------------------------------------
+    def tally(self): 
+    #----------------------------------------------------------------------
+        '''
+        tally totals for each runner, by gender and by division
+        '''
+        self.standings['bygender'] = self.tallypoints(self.genpoints)
+        if self.bydiv:
+            self.standings['bydivision'] = self.tallypoints(self.divpoints)
+        
+    #----------------------------------------------------------------------
+    def tallypoints(self,bypos): 
+    #----------------------------------------------------------------------
+        '''
+        tally totals from the best races for each runner
+        
+        where a runner has the same points in more than one race, the earliest races are used
+        
+        :param bypos: {(row,racendx):points,...}
+        :rtype: (points,present,used,totals) - points, present and used are runners x races matrices
+        '''
+        import numpy as np
+        
+        points = np.zeros((len(self.names),self.numraces))
+        present = np.zeros(points.shape,dtype=bool)
+        if bypos:
+            rows,cols = list(zip(*list(bypos.keys())))
+            points[rows,cols] = list(bypos.values())
+            present[rows,cols] = True
+        
+        # number of races included in total
+        numused = self.numraces if self.maxraces is None else min(self.maxraces,self.numraces)
+        
+        used = np.zeros(points.shape,dtype=bool)
+        if numused > 0:
+            # partial sort finds each runner's numused'th best points -- races not run rank below 0 points
+            ranked = np.where(present,points,-1)
+            nth = -np.partition(-ranked,numused-1,axis=1)[:,numused-1:numused]
+            
+            # use all races better than that, then as many of the earliest races with the same points as needed
+            used = ranked > nth
+            same = ranked == nth
+            needed = numused - used.sum(axis=1,keepdims=True)
+            used |= same & (np.cumsum(same,axis=1) <= needed)
+            used &= present
+        
+        # points are always multiples of 0.5, so the sum is exact regardless of order
+        totals = np.where(used,points,0).sum(axis=1)
+        
+        return points,present,used,totals
+    
+    #----------------------------------------------------------------------
+    def renderpoints(self,points): 
+    #----------------------------------------------------------------------
+        '''
+        convert points to int if possible
+        
+        :param points: points from matrix
+        :rtype: int or float
+        '''
+        points = float(points)
+        return int(points) if points == int(points) else points
+    
+    #----------------------------------------------------------------------
+    def render(self,fh,gen,racenums,pointstype,div=None): 
+    #----------------------------------------------------------------------
+        '''
+        render standings for all runners, or runners within a division
+        
+        :param fh: StandingsHandler object-like, with renderrow()
+        :param gen: gender, M or F
+        :param racenums: list of racenum for the series races
+        :param pointstype: 'bygender' or 'bydivision'
+        :param div: (divisionlow,divisionhigh) to render runners within a division, or None for all runners
+        '''
+        import numpy as np
+        
+        points,present,used,totals = self.standings[pointstype]
+        
+        rows = [row for row in range(len(self.names)) if div is None or self.divs[row] == div]
+        if not rows: return
+        
+        # sort runners by total points, then name, high to low
+        rows = np.array(rows)
+        names = np.array([self.names[row] for row in rows])
+        order = rows[np.lexsort((names,totals[rows]))[::-1]]
+        
+        # place is not rendered if total points are the same as the last runner's, i.e., there was a tie
+        ordertotals = totals[order]
+        tied = np.concatenate(([False],ordertotals[1:] == ordertotals[:-1]))
+        
+        for place,row,tie in zip(list(range(1,len(order)+1)),order,tied):
+            # collect race results through runner's last race, races not run are ''
+            races = []
+            lastrace = np.flatnonzero(present[row])[-1]
+            for col in range(lastrace+1):
+                pts = self.renderpoints(points[row,col]) if present[row,col] else ''
+                if used[row,col]:
+                    races.append((racenums[col],pts,'race'))
+                else:
+                    races.append((racenums[col],pts,'race-dropped'))
+            
+            fh.renderrow(gen,('' if tie else place,self.names[row],self.renderpoints(totals[row]),races))
+    
+#----------------------------------------------------------------------
+def seriesrenderer(session,series,savecache=True): 
+#----------------------------------------------------------------------
+    '''
+    create StandingsRenderer for a series, according to series specifications
+    
+    :param session: database session
+    :param series: racedb.Series
+    :param savecache: True if points which weren't cached are to be saved in the cache, False to only read the cache
+    :rtype: StandingsRenderer
+    '''
+    # orderby parameter is specified by the series
+    orderby = getattr(racedb.RaceResult,series.orderby)
+    
+    # TODO: now that we are passing series object, can remove many of the parameters
+    return StandingsRenderer(session,series,orderby,series.hightolow,series.divisions,
+                             series.averagetie,multiplier=series.multiplier,maxgenpoints=series.maxgenpoints,
+                             maxdivpoints=series.maxdivpoints,maxraces=series.maxraces,maxbynumrunners=series.maxbynumrunners,savecache=savecache)
+
+#----------------------------------------------------------------------
+def standingshandler(session,xlsx=False,withjson=False,withhtml=False): 
+#----------------------------------------------------------------------
+    '''
+    create handler for standings files
+    
+    :param session: database session
+    :param xlsx: True to render .xlsx files rather than .xls files
+    :param withjson: True to also render .json files
+    :param withhtml: True to also render .html files
+    :rtype: ListStandingsHandler
+    '''
+    fh = ListStandingsHandler()
+    fh.addhandler(TxtStandingsHandler(session))
+    fh.addhandler(XlsxStandingsHandler(session) if xlsx else XlStandingsHandler(session))
+    if withjson:
+        fh.addhandler(JsonStandingsHandler(session))
+    if withhtml:
+        fh.addhandler(HtmlStandingsHandler(session))
+    return fh
+
+#----------------------------------------------------------------------
+def renderseriesfiles(racedbfile,seriesid,xlsx=False,withjson=False,withhtml=False): 
+#----------------------------------------------------------------------
+    '''
+    render standings files for a single series, using a session of its own
+    
+    this is the worker for main() --jobs, so it must be picklable and not depend on the caller's session.
+    workers run at the same time, so they only read the points cache, which main() fills beforehand
+    
+    :param racedbfile: filename of race database, None if as configured during rcuserconfig
+    :param seriesid: series.id to render
+    :param xlsx: True to render .xlsx files rather than .xls files
+    :param withjson: True to also render .json files
+    :param withhtml: True to also render .html files
+    :rtype: (series name, elapsed seconds)
+    '''
+    started = time.time()
+    
+    racedb.setracedb(racedbfile)
+    session = racedb.Session()
+    series = session.query(racedb.Series).filter_by(id=seriesid).one()
+    
+    fh = standingshandler(session,xlsx,withjson,withhtml)
+    seriesrenderer(session,series,savecache=False).renderseries(fh)
+    
+    seriesname = series.name
+    session.close()
+    
+    return seriesname,time.time()-started
+
 #----------------------------------------------------------------------
 def main(): 
 #----------------------------------------------------------------------
@@ -1072,6 +2134,10 @@ def main():
     parser = argparse.ArgumentParser(version='{0} {1}'.format('runningclub',version.__version__))
     parser.add_argument('-s','--series',help='series to render',default=None)
     parser.add_argument('-r','--racedb',help='filename of race database (default is as configured during rcuserconfig)',default=None)
+    parser.add_argument('-j','--jobs',help='number of processes to render series in parallel, default %(default)s',type=int,default=1)
+    parser.add_argument('-x','--xlsx',help='render .xlsx files rather than .xls files (requires xlsxwriter)',action='store_true')
+    parser.add_argument('--json',help='also render .json files',action='store_true')
+    parser.add_argument('--html',help='also render .html files',action='store_true')
     args = parser.parse_args()
     
     racedb.setracedb(args.racedb)
@@ -1081,21 +2147,39 @@ def main():
     sfilter = {'active':True}
     theseseries = session.query(racedb.Series).filter_by(**sfilter).join("results").all()
     
-    fh = ListStandingsHandler()
-    fh.addhandler(TxtStandingsHandler(session))
-    fh.addhandler(XlStandingsHandler(session))
+    # render each series in its own process
+    if args.jobs > 1:
+        seriesids = [series.id for series in theseseries]
+        
+        # fill the points cache first, so workers don't write to the database at the same time
+        for series in theseseries:
+            rr = seriesrenderer(session,series)
+            rr.collectpoints(rr.seriesraces())
+        session.commit()
+        
+        # workers make their own connections, so make sure none are inherited from this process
+        session.close()
+        for engine in list(racedb.ENGINES.values()):
+            engine.dispose()
+        
+        pool = multiprocessing.Pool(args.jobs)
+        try:
+            for seriesname,elapsed in pool.imap_unordered(functools.partial(renderseriesfiles,args.racedb,xlsx=args.xlsx,withjson=args.json,withhtml=args.html),seriesids):
+                print('{0} rendered in {1:.1f} seconds'.format(seriesname,elapsed))
+        finally:
+            pool.close()
+            pool.join()
+        return
+    
+    fh = standingshandler(session,args.xlsx,args.json,args.html)
     
     for series in theseseries:
-        # orderby parameter is specified by the series
-        orderby = getattr(racedb.RaceResult,series.orderby)
-        
         # render the standings, according to series specifications
-        # TODO: now that we are passing series object, can remove many of the parameters
-        rr = StandingsRenderer(session,series,orderby,series.hightolow,series.divisions,
-                               series.averagetie,multiplier=series.multiplier,maxgenpoints=series.maxgenpoints,
-                               maxdivpoints=series.maxdivpoints,maxraces=series.maxraces,maxbynumrunners=series.maxbynumrunners)
+        rr = seriesrenderer(session,series)
         rr.renderseries(fh)
 
+    # save points cached while rendering
+    session.commit()
     session.close()
         
 # ##########################################################################################
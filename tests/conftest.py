@@ -0,0 +1,80 @@
+###########################################################################################
+# conftest - shared race database setup for tests
+###########################################################################################
+
+# standard
+
+# pypi
+import pytest
+
+# name, dob, gender, divage
+RUNNERS = [('Ann Lee','1970-03-04','F',50),('Bob Ray','1965-07-01','M',55),('Cat Fox','1980-11-30','F',40),
+           ('Dan Oak','1958-01-15','M',62),('Eve Elm','1985-05-05','F',35),('Fay Ash','1962-09-09','F',58)]
+
+#----------------------------------------------------------------------
+def resolved(session,times):
+#----------------------------------------------------------------------
+    '''
+    create resolved results, as from importresults.resolveresults(), for members
+
+    :param session: database session
+    :param times: {name:time,...}
+    :rtype: list of resolved results
+    '''
+    from runningclub import racedb
+
+    divages = dict([(name,divage) for name,dob,gender,divage in RUNNERS])
+    resolved = []
+    for name,time in times.items():
+        runner = session.query(racedb.Runner).filter_by(name=name).one()
+        resolved.append({'result':{'name':name,'age':divages[name],'time':time},'found':'member','name':name,'dob':runner.dateofbirth,
+                         'runnerid':runner.id,'gender':runner.gender,'divage':divages[name],'agegradeage':divages[name],
+                         'agpercent':50.0,'agtime':time,'agfactor':1.0})
+    return resolved
+
+#----------------------------------------------------------------------
+def addseries(session,numraces):
+#----------------------------------------------------------------------
+    '''
+    add RUNNERS, and a series with divisions and races Race1, Race2, ... on the first of each month of 2020
+
+    :param session: database session
+    :param numraces: number of races in the series
+    :rtype: series, [race,...]
+    '''
+    from runningclub import racedb
+
+    for name,dob,gender,divage in RUNNERS:
+        session.add(racedb.Runner(name,dob,gender,'Town, ST'))
+    series = racedb.Series('Grand Prix',True,True,True,False,'time',False,True,None,1,10,5,False)
+    session.add(series)
+    races = []
+    for racenum in range(1,numraces+1):
+        race = racedb.Race('Race{0}'.format(racenum),2020,racenum,'2020-{0:02d}-01'.format(racenum),'08:00',3.1)
+        session.add(race)
+        races.append(race)
+    session.flush()
+    for divlow,divhigh in [(0,44),(45,99)]:
+        session.add(racedb.Divisions(series.id,divlow,divhigh))
+    for race in races:
+        session.add(racedb.RaceSeries(race.id,series.id))
+    session.commit()
+    return series,races
+
+#----------------------------------------------------------------------
+@pytest.fixture
+def dburl(tmp_path):
+#----------------------------------------------------------------------
+    return 'sqlite:///{0}'.format(tmp_path/'race.db')
+
+#----------------------------------------------------------------------
+@pytest.fixture
+def session(dburl):
+#----------------------------------------------------------------------
+    pytest.importorskip('loutilities')
+    from runningclub import racedb
+
+    racedb.setracedb(dburl,createschema=True)
+    session = racedb.Session()
+    yield session
+    session.close()
@@ -0,0 +1,79 @@
+###########################################################################################
+# test_clubmember - tests for clubmember name matching
+###########################################################################################
+
+# standard
+import csv
+import difflib
+import random
+
+# pypi
+import pytest
+pytest.importorskip('loutilities')
+
+# home grown
+from runningclub import clubmember
+
+# common given and family names, so characters like 'a', 'n' and 'e' are shared by much of the roster
+# and the quick_ratio bound shortlists many names which difflib then rejects
+FIRST = '''james mary robert patricia john jennifer michael linda david elizabeth william barbara richard susan
+           joseph jessica thomas sarah christopher karen charles lisa daniel nancy matthew betty anthony sandra
+           mark margaret donald ashley steven kimberly andrew emily paul donna joshua michelle kenneth carol'''.split()
+LAST = '''smith johnson williams brown jones garcia miller davis rodriguez martinez hernandez lopez gonzalez
+          wilson anderson thomas taylor moore jackson martin lee perez thompson white harris sanchez clark
+          ramirez lewis robinson walker young allen king wright scott torres nguyen hill flores'''.split()
+
+#----------------------------------------------------------------------
+def typo(rand,name):
+#----------------------------------------------------------------------
+    '''
+    return name with up to three random character substitutions, deletions or insertions
+    '''
+    name = list(name)
+    for i in range(rand.randint(0,3)):
+        pos = rand.randrange(len(name))
+        edit = rand.choice(['sub','del','ins'])
+        if edit == 'sub':
+            name[pos] = rand.choice('abcdefghijklmnopqrstuvwxyz ')
+        elif edit == 'del' and len(name) > 2:
+            del name[pos]
+        else:
+            name.insert(pos,rand.choice('abcdefghijklmnopqrstuvwxyz'))
+    return ''.join(name)
+
+#----------------------------------------------------------------------
+@pytest.fixture(scope='module')
+def rosterfile(tmp_path_factory):
+#----------------------------------------------------------------------
+    fname = tmp_path_factory.mktemp('roster')/'members.csv'
+    with open(fname,'w',newline='') as ROSTER:
+        ROSTERCSV = csv.DictWriter(ROSTER,['First','Last','DOB','Gender','City','State'])
+        ROSTERCSV.writeheader()
+        for first in FIRST:
+            for last in LAST:
+                ROSTERCSV.writerow({'First':first,'Last':last,'DOB':'1970-01-01','Gender':'M','City':'Frederick','State':'MD'})
+        # only a few characters in common with 'zabwyc' or 'xa by c', but quick_ratio and ratio are more than 0.6
+        ROSTERCSV.writerow({'First':'xab','Last':'yc','DOB':'','Gender':'F','City':'','State':''})
+    return str(fname)
+
+#----------------------------------------------------------------------
+@pytest.mark.parametrize('cutoff',[0.6,0.7,0.8,0.9,1.0])
+@pytest.mark.parametrize('withindex',[True,False])
+def test_getmember_same_as_get_close_matches(rosterfile,cutoff,withindex):
+#----------------------------------------------------------------------
+    if withindex:
+        pytest.importorskip('numpy')
+    members = clubmember.CsvClubMember(rosterfile,cutoff=cutoff)
+    if not withindex:
+        members.nameindex = None
+    names = list(members.getmembers().keys())
+
+    rand = random.Random(cutoff)
+    queries = [typo(rand,rand.choice(names)) for i in range(100)] + ['zabwyc','xa by c','a','']
+    for query in queries:
+        expected = difflib.get_close_matches(query,names,cutoff=cutoff)
+        match = members.getmember(query)
+        if not expected:
+            assert match == {}
+        else:
+            assert [match['matchingmembers'][0]['name'].lower()] + match['closematches'] == expected
@@ -0,0 +1,159 @@
+###########################################################################################
+# test_exportresults - tests for exportresults incremental export
+###########################################################################################
+
+# standard
+import csv
+import json
+import os.path
+
+# pypi
+import pytest
+pytest.importorskip('loutilities')
+
+# home grown
+from runningclub import racedb
+from runningclub import importresults
+from runningclub import importraces
+from runningclub import exportresults
+from conftest import resolved,addseries
+
+#----------------------------------------------------------------------
+def importrace(session,race,series,times,incremental=False):
+#----------------------------------------------------------------------
+    '''
+    store results for race like importresults.main()
+    '''
+    if not incremental:
+        session.query(racedb.RaceResult).filter_by(raceid=race.id).delete()
+    importresults.tabulate(session,race,resolved(session,times),series,None,None,incremental=incremental)
+    racedb.newresultsversion(session,race)
+    session.commit()
+
+#----------------------------------------------------------------------
+def readchunks(outdir):
+#----------------------------------------------------------------------
+    '''
+    apply incremental export chunks in order, as a consumer would
+
+    :rtype: {racename:set of rows}
+    '''
+    byrace = {}
+    for chunk in exportresults.readmanifest(outdir)['chunks']:
+        for race in chunk['races']:
+            byrace[race['name']] = set()
+        with open(os.path.join(outdir,chunk['file']),newline='') as CHUNK:
+            for row in csv.DictReader(CHUNK):
+                byrace[row['race']].add((row['name'],row['time']))
+    return byrace
+
+#----------------------------------------------------------------------
+def test_incremental_import_then_export(session,dburl,tmp_path):
+#----------------------------------------------------------------------
+    outdir = str(tmp_path/'export')
+    series,races = addseries(session,2)
+
+    importrace(session,races[0],series,{'Ann Lee':1200,'Bob Ray':1100,'Cat Fox':1300})
+    importrace(session,races[1],series,{'Ann Lee':1250,'Bob Ray':1150})
+    chunk = exportresults.incremental(outdir,thisracedb=dburl)
+    assert chunk['raceids'] == [races[0].id,races[1].id]
+    assert exportresults.incremental(outdir,thisracedb=dburl) is None
+
+    # incremental import updates, deletes and adds results in place -- unchanged results keep their ids
+    importrace(session,races[0],series,{'Ann Lee':1200,'Bob Ray':1105,'Dan Oak':1400},incremental=True)
+    chunk = exportresults.incremental(outdir,thisracedb=dburl)
+    assert chunk['raceids'] == [races[0].id]
+
+    # reimport of the last race gets back the same result ids
+    importrace(session,races[1],series,{'Ann Lee':1260,'Cat Fox':1350})
+    chunk = exportresults.incremental(outdir,thisracedb=dburl)
+    assert chunk['raceids'] == [races[1].id]
+
+    assert readchunks(outdir) == {
+        'Race1':set([('Ann Lee','0:20:00'),('Bob Ray','0:18:25'),('Dan Oak','0:23:20')]),
+        'Race2':set([('Ann Lee','0:21:00'),('Cat Fox','0:22:30')]),
+        }
+
+#----------------------------------------------------------------------
+def test_formats_dedupe_rows(session,tmp_path):
+#----------------------------------------------------------------------
+    series,(race,) = addseries(session,1)
+    allseries = [series,racedb.Series('Racing Team',True,False,False,False,'time',False,True,None,1,None,None,False)]
+    session.add(allseries[1])
+    session.flush()
+    ann = session.query(racedb.Runner).filter_by(name='Ann Lee').one()
+
+    # same result in both series is exported once.  Different times which render the same are one csv row,
+    # as for the original csv export, but are different rows for the typed formats
+    for series in allseries:
+        session.add(racedb.RaceResult(ann.id,race.id,series.id,1200.2,'F',50,agpercent=50.0))
+    session.add(racedb.RaceResult(ann.id,race.id,allseries[0].id,1200.4,'F',50,agpercent=50.0))
+    session.commit()
+
+    csvfile = str(tmp_path/'results.csv')
+    ndjsonfile = str(tmp_path/'results.ndjson')
+    exportresults.writeexport(session,csvfile,'csv')
+    exportresults.writeexport(session,ndjsonfile,'ndjson')
+    with open(csvfile,newline='') as CSV:
+        csvtimes = [row['time'] for row in csv.DictReader(CSV)]
+    with open(ndjsonfile) as NDJSON:
+        ndjsontimes = [json.loads(line)['time'] for line in NDJSON]
+
+    assert csvtimes == ['0:20:01']
+    assert ndjsontimes == [1200.2,1200.4]
+
+########################################################################
+class FileRaces():
+########################################################################
+    '''
+    stands in for racefile.RaceFile in importraces.updateraces()
+    '''
+    def __init__(self,races):
+        self.races = races
+    def getraces(self):
+        return self.races
+
+#----------------------------------------------------------------------
+def test_incremental_windows_and_changes(session,dburl,tmp_path):
+#----------------------------------------------------------------------
+    outdir = str(tmp_path/'export')
+    series,races = addseries(session,2)
+    raceids = [race.id for race in races]
+    january = {'begindate':'2020-01-01','enddate':'2020-01-31'}
+
+    importrace(session,races[0],series,{'Ann Lee':1200,'Bob Ray':1100})
+    importrace(session,races[1],series,{'Ann Lee':1250,'Cat Fox':1350})
+    assert exportresults.incremental(outdir,thisracedb=dburl,**january)['raceids'] == [raceids[0]]
+    assert exportresults.incremental(outdir,thisracedb=dburl)['raceids'] == raceids
+
+    # change outside the window is still exported for the whole season
+    importrace(session,races[1],series,{'Ann Lee':1260,'Cat Fox':1350})
+    assert exportresults.incremental(outdir,thisracedb=dburl,**january) is None
+    assert exportresults.incremental(outdir,thisracedb=dburl)['raceids'] == [raceids[1]]
+
+    # deleted results are reported as a race with no results
+    session.query(racedb.RaceResult).filter_by(raceid=raceids[0]).delete()
+    racedb.newresultsversion(session,session.query(racedb.Race).get(raceids[0]))
+    session.commit()
+    chunk = exportresults.incremental(outdir,thisracedb=dburl)
+    assert chunk['raceids'] == [raceids[0]]
+    assert readchunks(outdir)['Race1'] == set()
+
+    # updated race is exported again, unchanged race is not
+    importraces.updateraces(session,FileRaces([
+        {'race':'Race1','year':2020,'racenum':1,'date':'2020-01-01','time':'08:00','distance':3.1},
+        {'race':'Race2','year':2020,'racenum':2,'date':'2020-02-01','time':'08:00','distance':5.0},
+        ]))
+    session.commit()
+    assert exportresults.incremental(outdir,thisracedb=dburl)['raceids'] == [raceids[1]]
+
+    # importmembers marks the races of changed runners
+    cat = session.query(racedb.Runner).filter_by(name='Cat Fox').one()
+    changedraceids = [raceid for (raceid,) in session.query(racedb.RaceResult.raceid).filter(racedb.RaceResult.runnerid.in_([cat.id])).distinct()]
+    racedb.newresultsversions(session,changedraceids)
+    session.commit()
+    assert exportresults.incremental(outdir,thisracedb=dburl)['raceids'] == [raceids[1]]
+    assert racedb.newresultsversions(session,[]) is None
+
+    manifest = exportresults.readmanifest(outdir)
+    assert set(manifest['watermarks']) == set(['2020-01-01:2020-01-31',':'])
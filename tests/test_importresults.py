@@ -0,0 +1,63 @@
+###########################################################################################
+# test_importresults - tests for importresults tabulation
+###########################################################################################
+
+# standard
+
+# pypi
+import pytest
+pytest.importorskip('loutilities')
+
+# home grown
+from runningclub import racedb
+from runningclub import importresults
+from conftest import resolved,addseries
+
+# Cat Fox drops out, Fay Ash is added, Bob Ray's time changes, which moves Dan Oak up overall
+FIRSTTIMES = {'Ann Lee':1200,'Bob Ray':1100,'Cat Fox':1300,'Dan Oak':1400,'Eve Elm':1250}
+CHANGEDTIMES = {'Ann Lee':1200,'Bob Ray':1105,'Dan Oak':1400,'Eve Elm':1250,'Fay Ash':1500}
+PLACEFIELDS = ['time','gender','divisionlow','divisionhigh','overallplace','genderplace','divisionplace']
+
+#----------------------------------------------------------------------
+def storedresults(session,race):
+#----------------------------------------------------------------------
+    '''
+    :rtype: {runnername:RaceResult,...} stored for race
+    '''
+    results = {}
+    for dbresult in session.query(racedb.RaceResult).filter_by(raceid=race.id):
+        results[session.query(racedb.Runner).get(dbresult.runnerid).name] = dbresult
+    return results
+
+#----------------------------------------------------------------------
+def test_incremental_reimport(session,capsys):
+#----------------------------------------------------------------------
+    series,(race,freshrace) = addseries(session,2)
+
+    importresults.tabulate(session,race,resolved(session,FIRSTTIMES),series,None,None)
+    session.commit()
+    first = dict([(name,(dbresult.id,[getattr(dbresult,field) for field in PLACEFIELDS])) for name,dbresult in storedresults(session,race).items()])
+
+    capsys.readouterr()
+    importresults.tabulate(session,race,resolved(session,CHANGEDTIMES),series,None,None,incremental=True)
+    session.commit()
+    assert '1 added, 2 updated, 1 deleted' in capsys.readouterr().out
+
+    # places are the same as for a fresh import of the changed results
+    importresults.tabulate(session,freshrace,resolved(session,CHANGEDTIMES),series,None,None)
+    session.commit()
+    stored = storedresults(session,race)
+    fresh = storedresults(session,freshrace)
+    assert sorted(stored) == sorted(CHANGEDTIMES)
+    for name in CHANGEDTIMES:
+        assert [getattr(stored[name],field) for field in PLACEFIELDS] == [getattr(fresh[name],field) for field in PLACEFIELDS]
+    assert stored['Dan Oak'].overallplace == 4
+    assert stored['Fay Ash'].genderplace == 3
+
+    # results which changed keep their ids, and results which didn't change are left alone
+    for name in ['Bob Ray','Dan Oak']:
+        assert stored[name].id == first[name][0]
+        assert [getattr(stored[name],field) for field in PLACEFIELDS] != first[name][1]
+    for name in ['Ann Lee','Eve Elm']:
+        assert (stored[name].id,[getattr(stored[name],field) for field in PLACEFIELDS]) == first[name]
+    assert session.query(racedb.RaceResult).filter_by(raceid=race.id).count() == len(CHANGEDTIMES)
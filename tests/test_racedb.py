@@ -0,0 +1,75 @@
+###########################################################################################
+# test_racedb - tests for race database setup
+###########################################################################################
+
+# standard
+
+# pypi
+import pytest
+pytest.importorskip('loutilities')
+import sqlalchemy
+from loutilities import extconfigparser
+
+# home grown
+from runningclub import racedb
+from runningclub.config import SECCF,OPTDBTYPE,OPTDBNAME,OPTDBSCHEMA
+
+########################################################################
+class OldConfig():
+########################################################################
+    '''
+    configuration from before the dbschema option was added, answers CF.get() as used by racedb.getoption()
+
+    :param dbname: configured database file name
+    '''
+    #----------------------------------------------------------------------
+    def __init__(self,dbname):
+    #----------------------------------------------------------------------
+        self.options = {OPTDBTYPE:'sqlite',OPTDBNAME:dbname}
+
+    #----------------------------------------------------------------------
+    def get(self,section,option):
+    #----------------------------------------------------------------------
+        assert section == SECCF
+        if option not in self.options:
+            raise extconfigparser.unknownOption(option)
+        return self.options[option]
+
+#----------------------------------------------------------------------
+def test_setracedb_reuses_engine_for_configured_url(tmp_path,monkeypatch):
+#----------------------------------------------------------------------
+    dburl = 'sqlite:///{0}'.format(tmp_path/'race.db')
+    lookups = []
+    def getdbfilename():
+        lookups.append(dburl)
+        return dburl
+    monkeypatch.setattr(racedb,'getdbfilename',getdbfilename)
+    monkeypatch.setattr(racedb,'CONFIGUREDURL',None)
+
+    racedb.setracedb(None,createschema=False)
+    engine = racedb.ENGINES[dburl]
+    racedb.setracedb(None,createschema=False)
+    racedb.setracedb(dburl,createschema=False)
+    assert racedb.ENGINES[dburl] is engine
+    assert [e for e in racedb.ENGINES.values() if e is engine] == [engine]
+    assert lookups == [dburl]
+
+    # schema is created when requested for an engine which already exists
+    assert not sqlalchemy.inspect(engine).has_table('runner')
+    racedb.setracedb(None,createschema=True)
+    assert sqlalchemy.inspect(engine).has_table('runner')
+    assert racedb.Session.kw['bind'] is engine
+
+#----------------------------------------------------------------------
+def test_setracedb_without_dbschema_option(tmp_path,monkeypatch):
+#----------------------------------------------------------------------
+    monkeypatch.setattr(racedb,'CF',OldConfig(str(tmp_path/'configured.db')))
+    assert racedb.getoption(OPTDBSCHEMA) is None
+    monkeypatch.setattr(racedb,'CONFIGUREDURL',None)
+
+    # schema is created by default, for the configured database and for one given by url
+    dburl = 'sqlite:///{0}'.format(tmp_path/'race.db')
+    racedb.setracedb(dburl)
+    assert sqlalchemy.inspect(racedb.ENGINES[dburl]).has_table('runner')
+    racedb.setracedb()
+    assert sqlalchemy.inspect(racedb.ENGINES[racedb.CONFIGUREDURL]).has_table('runner')
@@ -0,0 +1,26 @@
+###########################################################################################
+# test_render - tests for render time rendering
+###########################################################################################
+
+# pypi
+import pytest
+pytest.importorskip('loutilities')
+
+# home grown
+from runningclub import render
+
+#----------------------------------------------------------------------
+@pytest.mark.parametrize('precision',[0,1,2])
+def test_rendertimes_same_as_original(precision):
+#----------------------------------------------------------------------
+    dbtimes = [0.4,59,59.999,60,3599.5,3600,3661.25,4*3600+1.01]
+    expected = [render.looprendertime(t,precision) for t in dbtimes]
+    assert [render.rendertime(t,precision) for t in dbtimes] == expected
+    assert render.rendertimes(dbtimes,precision) == expected
+
+#----------------------------------------------------------------------
+def test_benchmark_compares_with_original():
+#----------------------------------------------------------------------
+    results = render.benchmark(1000,2)
+    assert sorted(results) == ['loop','rendertime','rendertimes']
+    assert all(seconds > 0 for seconds in results.values())
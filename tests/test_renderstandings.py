@@ -0,0 +1,198 @@
+###########################################################################################
+# test_renderstandings - tests for series standings rendering
+###########################################################################################
+
+# standard
+
+# pypi
+import pytest
+pytest.importorskip('loutilities')
+
+# home grown
+from runningclub import racedb
+from runningclub import importresults
+from runningclub import renderstandings
+from conftest import resolved,addseries
+
+# times by race, with a tie in Race2 and a runner who ran every race
+TIMES = [{'Ann Lee':1200,'Bob Ray':1100,'Cat Fox':1300,'Eve Elm':1250},
+         {'Ann Lee':1250,'Bob Ray':1150,'Cat Fox':1250,'Dan Oak':1400,'Fay Ash':1500},
+         {'Ann Lee':1210,'Eve Elm':1190,'Fay Ash':1480,'Dan Oak':1390},
+         {'Ann Lee':1230,'Cat Fox':1280,'Eve Elm':1200,'Bob Ray':1120}]
+
+# standings expected from TIMES by maxraces, division and overall headers by name, then
+# (gen,place,name,total,[(racenum,points,stylename),...]) for each runner
+# ties in total share a place and are ordered by name, descending
+STANDINGS = {
+    1: [
+        ('F','Age Group'),
+        ('F','44 & Under'),
+        ('F',1,'Eve Elm',5,[(1,5,'race'),(2,'','race-dropped'),(3,5,'race-dropped'),(4,5,'race-dropped')]),
+        ('F','','Cat Fox',5,[(1,4,'race-dropped'),(2,5,'race'),(3,'','race-dropped'),(4,4,'race-dropped')]),
+        ('F','45 & Over'),
+        ('F',1,'Ann Lee',5,[(1,5,'race'),(2,5,'race-dropped'),(3,5,'race-dropped'),(4,5,'race-dropped')]),
+        ('F',2,'Fay Ash',4,[(1,'','race-dropped'),(2,4,'race'),(3,4,'race-dropped')]),
+        ('F','Overall'),
+        ('F',1,'Eve Elm',10,[(1,9,'race-dropped'),(2,'','race-dropped'),(3,10,'race'),(4,10,'race-dropped')]),
+        ('F','','Ann Lee',10,[(1,10,'race'),(2,9.5,'race-dropped'),(3,9,'race-dropped'),(4,9,'race-dropped')]),
+        ('F',3,'Cat Fox',9.5,[(1,8,'race-dropped'),(2,9.5,'race'),(3,'','race-dropped'),(4,8,'race-dropped')]),
+        ('F',4,'Fay Ash',8,[(1,'','race-dropped'),(2,8,'race'),(3,8,'race-dropped')]),
+        ('M','Age Group'),
+        ('M','44 & Under'),
+        ('M','45 & Over'),
+        ('M',1,'Dan Oak',5,[(1,'','race-dropped'),(2,4,'race-dropped'),(3,5,'race')]),
+        ('M','','Bob Ray',5,[(1,5,'race'),(2,5,'race-dropped'),(3,'','race-dropped'),(4,5,'race-dropped')]),
+        ('M','Overall'),
+        ('M',1,'Dan Oak',10,[(1,'','race-dropped'),(2,9,'race-dropped'),(3,10,'race')]),
+        ('M','','Bob Ray',10,[(1,10,'race'),(2,10,'race-dropped'),(3,'','race-dropped'),(4,10,'race-dropped')]),
+        ],
+    2: [
+        ('F','Age Group'),
+        ('F','44 & Under'),
+        ('F',1,'Eve Elm',10,[(1,5,'race'),(2,'','race-dropped'),(3,5,'race'),(4,5,'race-dropped')]),
+        ('F',2,'Cat Fox',9,[(1,4,'race'),(2,5,'race'),(3,'','race-dropped'),(4,4,'race-dropped')]),
+        ('F','45 & Over'),
+        ('F',1,'Ann Lee',10,[(1,5,'race'),(2,5,'race'),(3,5,'race-dropped'),(4,5,'race-dropped')]),
+        ('F',2,'Fay Ash',8,[(1,'','race-dropped'),(2,4,'race'),(3,4,'race')]),
+        ('F','Overall'),
+        ('F',1,'Eve Elm',20,[(1,9,'race-dropped'),(2,'','race-dropped'),(3,10,'race'),(4,10,'race')]),
+        ('F',2,'Ann Lee',19.5,[(1,10,'race'),(2,9.5,'race'),(3,9,'race-dropped'),(4,9,'race-dropped')]),
+        ('F',3,'Cat Fox',17.5,[(1,8,'race'),(2,9.5,'race'),(3,'','race-dropped'),(4,8,'race-dropped')]),
+        ('F',4,'Fay Ash',16,[(1,'','race-dropped'),(2,8,'race'),(3,8,'race')]),
+        ('M','Age Group'),
+        ('M','44 & Under'),
+        ('M','45 & Over'),
+        ('M',1,'Bob Ray',10,[(1,5,'race'),(2,5,'race'),(3,'','race-dropped'),(4,5,'race-dropped')]),
+        ('M',2,'Dan Oak',9,[(1,'','race-dropped'),(2,4,'race'),(3,5,'race')]),
+        ('M','Overall'),
+        ('M',1,'Bob Ray',20,[(1,10,'race'),(2,10,'race'),(3,'','race-dropped'),(4,10,'race-dropped')]),
+        ('M',2,'Dan Oak',19,[(1,'','race-dropped'),(2,9,'race'),(3,10,'race')]),
+        ],
+    None: [
+        ('F','Age Group'),
+        ('F','44 & Under'),
+        ('F',1,'Eve Elm',15,[(1,5,'race'),(2,'','race-dropped'),(3,5,'race'),(4,5,'race')]),
+        ('F',2,'Cat Fox',13,[(1,4,'race'),(2,5,'race'),(3,'','race-dropped'),(4,4,'race')]),
+        ('F','45 & Over'),
+        ('F',1,'Ann Lee',20,[(1,5,'race'),(2,5,'race'),(3,5,'race'),(4,5,'race')]),
+        ('F',2,'Fay Ash',8,[(1,'','race-dropped'),(2,4,'race'),(3,4,'race')]),
+        ('F','Overall'),
+        ('F',1,'Ann Lee',37.5,[(1,10,'race'),(2,9.5,'race'),(3,9,'race'),(4,9,'race')]),
+        ('F',2,'Eve Elm',29,[(1,9,'race'),(2,'','race-dropped'),(3,10,'race'),(4,10,'race')]),
+        ('F',3,'Cat Fox',25.5,[(1,8,'race'),(2,9.5,'race'),(3,'','race-dropped'),(4,8,'race')]),
+        ('F',4,'Fay Ash',16,[(1,'','race-dropped'),(2,8,'race'),(3,8,'race')]),
+        ('M','Age Group'),
+        ('M','44 & Under'),
+        ('M','45 & Over'),
+        ('M',1,'Bob Ray',15,[(1,5,'race'),(2,5,'race'),(3,'','race-dropped'),(4,5,'race')]),
+        ('M',2,'Dan Oak',9,[(1,'','race-dropped'),(2,4,'race'),(3,5,'race')]),
+        ('M','Overall'),
+        ('M',1,'Bob Ray',30,[(1,10,'race'),(2,10,'race'),(3,'','race-dropped'),(4,10,'race')]),
+        ('M',2,'Dan Oak',19,[(1,'','race-dropped'),(2,9,'race'),(3,10,'race')]),
+        ],
+    }
+
+#----------------------------------------------------------------------
+def standingsrows(rows):
+#----------------------------------------------------------------------
+    '''
+    return rows recorded by RecordingHandler in the form used by STANDINGS
+
+    :param rows: RecordingHandler.rows
+    :rtype: list of header or standings rows
+    '''
+    standingsrows = []
+    for gen,row in rows:
+        if isinstance(row,dict):
+            standingsrows.append((gen,row['name'][0]))
+        elif row is not None:
+            standingsrows.append((gen,)+tuple(row))
+    return standingsrows
+
+########################################################################
+class RecordingHandler(renderstandings.BaseStandingsHandler):
+########################################################################
+    '''
+    StandingsHandler which records what is rendered
+    '''
+    #----------------------------------------------------------------------
+    def __init__(self,session):
+    #----------------------------------------------------------------------
+        renderstandings.BaseStandingsHandler.__init__(self,session)
+        self.rows = []
+        self.line = {}
+
+    def clearline(self,gen):
+        self.line = {}
+
+    def setplace(self,gen,place,stylename='place'):
+        self.line['place'] = (place,stylename)
+
+    def setname(self,gen,name,stylename='name'):
+        self.line['name'] = (name,stylename)
+
+    def render(self,gen):
+        self.rows.append((gen,self.line))
+
+    def renderrow(self,gen,row):
+        self.rows.append((gen,row))
+
+    def skipline(self,gen):
+        self.rows.append((gen,None))
+
+#----------------------------------------------------------------------
+@pytest.fixture
+def standings(session):
+#----------------------------------------------------------------------
+    series,races = addseries(session,len(TIMES))
+    for race,times in zip(races,TIMES):
+        importresults.tabulate(session,race,resolved(session,times),series,None,None)
+    session.commit()
+
+#----------------------------------------------------------------------
+@pytest.mark.usefixtures('standings')
+@pytest.mark.parametrize('maxraces',[None,1,2,3,10])
+def test_matrix_same_as_lists(session,maxraces):
+#----------------------------------------------------------------------
+    pytest.importorskip('numpy')
+    series = session.query(racedb.Series).one()
+    series.maxraces = maxraces
+    session.commit()
+
+    rendered = {}
+    for usematrix in [True,False]:
+        rr = renderstandings.seriesrenderer(session,series)
+        rr.usematrix = usematrix
+        rr.usecache = False
+        fh = RecordingHandler(session)
+        rr.renderseries(fh)
+        rendered[usematrix] = fh.rows
+
+    assert rendered[True] == rendered[False]
+    assert [row for gen,row in rendered[True] if isinstance(row,tuple)]
+
+    # pin the standings themselves, so a change to both engines can't go unnoticed
+    if maxraces in STANDINGS:
+        assert standingsrows(rendered[True]) == STANDINGS[maxraces]
+
+#----------------------------------------------------------------------
+@pytest.mark.usefixtures('standings')
+def test_savecache_false_only_reads_cache(session):
+#----------------------------------------------------------------------
+    series = session.query(racedb.Series).one()
+
+    # nothing is written when the cache is only read
+    fh = RecordingHandler(session)
+    renderstandings.seriesrenderer(session,series,savecache=False).renderseries(fh)
+    session.commit()
+    assert session.query(racedb.SeriesPoints).count() == 0
+
+    # once the cache is filled, as main() does before starting workers, standings are the same
+    rr = renderstandings.seriesrenderer(session,series)
+    rr.collectpoints(rr.seriesraces())
+    session.commit()
+    assert session.query(racedb.SeriesPoints).count() == 2*len(TIMES)
+
+    cachedfh = RecordingHandler(session)
+    renderstandings.seriesrenderer(session,series,savecache=False).renderseries(cachedfh)
+    assert cachedfh.rows == fh.rows